@@ -0,0 +1,51 @@
+/**
+ * productApi.test.js
+ *
+ * Tests unitaires pour le service productApi.
+ * On mocke axios pour ne pas faire de vrais appels réseau.
+ */
+
+import { describe, it, expect, vi, beforeEach } from 'vitest'
+
+// ── Mock d'axios ─────────────────────────────────────────────────────────────
+const mockAxiosInstance = {
+  get: vi.fn(),
+  interceptors: { request: { use: vi.fn() } },
+}
+
+vi.mock('axios', () => ({
+  default: {
+    create: vi.fn(() => mockAxiosInstance),
+  },
+}))
+
+const { listProducts } = await import('../services/productApi')
+
+describe('productApi — listProducts', () => {
+  beforeEach(() => {
+    vi.clearAllMocks()
+  })
+
+  it('retourne la page unique quand il n\'y a pas de curseur suivant', async () => {
+    mockAxiosInstance.get.mockResolvedValueOnce({ data: [{ id: 1 }], headers: {} })
+
+    const result = await listProducts()
+
+    expect(result).toEqual([{ id: 1 }])
+    expect(mockAxiosInstance.get).toHaveBeenCalledTimes(1)
+    expect(mockAxiosInstance.get).toHaveBeenCalledWith('/products', { params: { limit: 1000 } })
+  })
+
+  it('suit X-Next-Cursor jusqu\'à la dernière page', async () => {
+    mockAxiosInstance.get
+      .mockResolvedValueOnce({ data: [{ id: 1 }, { id: 2 }], headers: { 'x-next-cursor': 'abc' } })
+      .mockResolvedValueOnce({ data: [{ id: 3 }], headers: {} })
+
+    const result = await listProducts()
+
+    expect(result.map((p) => p.id)).toEqual([1, 2, 3])
+    expect(mockAxiosInstance.get).toHaveBeenLastCalledWith('/products', {
+      params: { limit: 1000, cursor: 'abc' },
+    })
+  })
+})
@@ -16,9 +16,20 @@ client.interceptors.request.use((config) => {
   return config
 })
 
+// GET /products est paginé (curseur) : on demande la plus grande page autorisée
+// par l'API et on suit X-Next-Cursor jusqu'à la dernière pour avoir tout le catalogue.
+const PAGE_SIZE = 1000
+
 export async function listProducts() {
-  const { data } = await client.get('/products')
-  return data
+  const products = []
+  let cursor
+  do {
+    const params = cursor ? { limit: PAGE_SIZE, cursor } : { limit: PAGE_SIZE }
+    const { data, headers } = await client.get('/products', { params })
+    products.push(...data)
+    cursor = headers?.['x-next-cursor']
+  } while (cursor)
+  return products
 }
 
 export async function getProduct(id) {
@@ -1,3 +1,3 @@
 -- Initialisation PostgreSQL — DevOpsCorp
--- Schéma métier : l’API produits utilise encore SQLite (products.db) dans le code actuel.
--- Ce script peut accueillir des migrations futures.
+-- Schéma métier : la table products est créée par l'API produits au démarrage
+-- (product-api/database_pg.py) quand DB_HOST pointe vers ce serveur.
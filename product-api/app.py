@@ -3,27 +3,87 @@ app.py — Application principale FastAPI
 
 C'est le point d'entrée de l'API.
 On y définit toutes les routes (endpoints) et on assemble les briques
-(database.py pour la BDD, auth.py pour la sécurité).
+(repository.py pour la BDD — SQLite ou PostgreSQL —, auth.py pour la sécurité).
+
+Les routes sont "async def" : les accès PostgreSQL (asyncpg) ne bloquent pas
+la boucle d'événements, et les accès SQLite passent par un pool de threads
+dédié (repository.py, DB_EXECUTOR_THREADS).
 
 Pour lancer : uvicorn app:app --reload
               ^^^^^^     ^^^
               fichier    variable FastAPI dans ce fichier
+
+En production : python server.py (multi-workers, voir server.py)
 """
 
 import os
 
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import Body, FastAPI, Depends, Header, HTTPException, Path, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Annotated, Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from typing import Annotated, Any, Literal, Optional
 
 from prometheus_fastapi_instrumentator import Instrumentator
 
-from database import init_db, get_all_products, get_product_by_id, create_product, update_product, delete_product
+import compression
+import conditional
+import events
+import metrics
+import profiling
+import repository
+import streaming
+from serialization import FastJSONResponse
+from timing import ServerTimingMiddleware
+from database import (
+    ChangeFeedExpiredError,
+    InvalidCursorError,
+    InvalidSearchError,
+    PoolTimeoutError,
+    PreconditionFailedError,
+    SORT_OPTIONS,
+    SQL_INT_MAX,
+    TOP_OPTIONS,
+    StockConflictError,
+)
 from seed_products import DEMO_PRODUCTS
 from auth import get_current_user, require_admin
 
 PRODUCT_NOT_FOUND = "Produit non trouvé"
+PRODUCT_MODIFIED = "Le produit a été modifié depuis votre lecture (If-Match)"
+STOCK_INSUFFICIENT = "Stock insuffisant"
+STOCK_OVERFLOW = "Stock maximal dépassé"
+
+# Les réponses produits sont propres à l'utilisateur (JWT) et doivent être
+# revalidées à chaque fois : le client garde sa copie et renvoie son ETag.
+CACHE_CONTROL = "private, no-cache"
+
+# Pagination de GET /products : taille de page par défaut et maximum autorisé
+PRODUCTS_PAGE_SIZE = int(os.environ.get("PRODUCTS_PAGE_SIZE", "100"))
+PRODUCTS_MAX_PAGE_SIZE = int(os.environ.get("PRODUCTS_MAX_PAGE_SIZE", "1000"))
+# Export en flux : nombre de produits lus (et encodés) à la fois
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+# Flux de changements : taille de page par défaut et maximum autorisé
+CHANGES_PAGE_SIZE = int(os.environ.get("CHANGES_PAGE_SIZE", "500"))
+CHANGES_MAX_PAGE_SIZE = int(os.environ.get("CHANGES_MAX_PAGE_SIZE", "5000"))
+# Nombre max de produits renvoyés par GET /products/top
+TOP_MAX_SIZE = int(os.environ.get("TOP_MAX_SIZE", "100"))
+# Nombre max d'ids acceptés par POST /products/batch-get
+BATCH_GET_MAX_IDS = int(os.environ.get("BATCH_GET_MAX_IDS", "1000"))
+# Nombre max d'éléments acceptés par une requête /products/bulk
+BULK_MAX_ITEMS = int(os.environ.get("BULK_MAX_ITEMS", "5000"))
+
+SortOption = Literal[SORT_OPTIONS]
+TopOption = Literal[TOP_OPTIONS]
+
+# Ids et stocks sont des colonnes INTEGER (32 bits) en PostgreSQL : SQLite accepte
+# des entiers 64 bits, mais asyncpg refuserait la valeur (erreur 500). Hors bornes : 422.
+SQL_INT_MIN = -SQL_INT_MAX - 1
+SqlInt = Annotated[int, Field(ge=SQL_INT_MIN, le=SQL_INT_MAX)]
+ProductId = Annotated[int, Path(ge=SQL_INT_MIN, le=SQL_INT_MAX)]
+# Variation de stock : symétrique, pour que -delta soit aussi un INTEGER (voir database.adjust_stock_params)
+StockDelta = Annotated[int, Field(ge=-SQL_INT_MAX, le=SQL_INT_MAX)]
 
 CurrentUser = Annotated[dict, Depends(get_current_user)]
 AdminUser = Annotated[dict, Depends(require_admin)]
@@ -39,7 +99,7 @@ class ProductCreate(BaseModel):
     name: str
     description: Optional[str] = None
     price: float
-    stock: int = 0
+    stock: SqlInt = 0
     category: Optional[str] = None
 
 
@@ -48,16 +108,163 @@ class ProductUpdate(BaseModel):
     name: str
     description: Optional[str] = None
     price: float
-    stock: int = 0
+    stock: SqlInt = 0
+    category: Optional[str] = None
+
+
+class ProductPatch(BaseModel):
+    """
+    Schéma pour la mise à jour partielle (PATCH) : tous les champs sont facultatifs.
+    Seuls les champs présents dans le JSON envoyé sont modifiés.
+    """
+    name: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[float] = None
+    stock: Optional[SqlInt] = None
     category: Optional[str] = None
 
+    @model_validator(mode="after")
+    def required_fields_not_null(self):
+        """description et category peuvent être effacées (null), pas name / price / stock."""
+        for field in ("name", "price", "stock"):
+            if field in self.model_fields_set and getattr(self, field) is None:
+                raise ValueError(f"{field} ne peut pas être null")
+        return self
+
+
+class ProductBulkUpdate(ProductUpdate):
+    """Un élément de PATCH /products/bulk : la mise à jour + l'id du produit visé."""
+    id: SqlInt
+
+
+class ProductIds(BaseModel):
+    """Body de DELETE /products/bulk et de POST /products/batch-get."""
+    ids: list[SqlInt]
+
+
+class StockAdjustment(BaseModel):
+    """Body de POST /products/{id}/stock : variation du stock (négative = sortie, positive = réassort)."""
+    delta: StockDelta
+
+
+class StockAdjustmentItem(StockAdjustment):
+    """Une ligne de POST /products/stock : la variation + l'id du produit visé."""
+    id: SqlInt
+
+
+class RequestProfilingSettings(BaseModel):
+    """Body de POST /admin/profiling/requests : part des requêtes profilées et durée de la fenêtre."""
+    rate: float = Field(gt=0, le=1)
+    duration: float = Field(gt=0, le=profiling.PROFILING_MAX_DURATION)
+
+
+def check_bulk_size(items: list):
+    """413 si la requête bulk dépasse BULK_MAX_ITEMS éléments."""
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Maximum {BULK_MAX_ITEMS} éléments par requête",
+        )
+
+
+def validate_bulk_items(items: list, model: type[BaseModel]):
+    """
+    Valide chaque élément d'une requête bulk séparément.
+
+    Un élément invalide n'empêche pas les autres d'être traités : on retourne
+    les éléments valides et, pour les autres, leur position (index) et les erreurs Pydantic.
+    """
+    check_bulk_size(items)
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            valid.append(model.model_validate(item))
+        except ValidationError as exc:
+            errors.append({
+                "index": index,
+                "errors": jsonable_encoder(exc.errors(include_url=False, include_context=False)),
+            })
+    return valid, errors
+
+
+def page_response(request: Request, products: list, next_cursor: Optional[str], headers: dict = None):
+    """
+    Réponse d'une page de liste : le tableau de produits + les headers de pagination.
+
+    La réponse est construite ici plutôt que par FastAPI : les produits (dicts
+    venant de la base) sont encodés directement par orjson, sans passer par
+    jsonable_encoder qui les reparcourt champ par champ.
+    """
+    return FastJSONResponse(products, headers=pagination_headers(request, next_cursor, headers))
+
+
+def pagination_headers(request: Request, next_cursor: Optional[str], headers: dict = None) -> dict:
+    """Headers X-Next-Cursor et Link rel="next" (s'il reste des produits), ajoutés à 'headers'."""
+    headers = dict(headers or {})
+    if next_cursor:
+        next_url = request.url.include_query_params(cursor=next_cursor)
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    return headers
+
+
+def compressed_page_response(request: Request, body: bytes, encoding: Optional[str],
+                             next_cursor: Optional[str], headers: dict):
+    """Réponse d'une page déjà encodée (et compressée si 'encoding') : le middleware la laisse telle quelle."""
+    response = Response(body, media_type="application/json", headers=pagination_headers(request, next_cursor, headers))
+    if encoding:
+        compression.set_encoding_headers(response.headers, encoding, len(body))
+    return response
+
+
+def stock_conflict_error(exc: StockConflictError) -> HTTPException:
+    """
+    404 si un produit n'existe pas, sinon 409 avec le stock disponible de chaque ligne refusée
+    (insufficient : passerait sous zéro, overflow : dépasserait SQL_INT_MAX).
+    """
+    lines = {"insufficient": exc.insufficient, "overflow": exc.overflow}
+    if exc.not_found:
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"message": PRODUCT_NOT_FOUND, "not_found": exc.not_found, **lines},
+        )
+    message = STOCK_INSUFFICIENT if exc.insufficient else STOCK_OVERFLOW
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail={"message": message, **lines})
+
+
+def not_modified(headers: dict):
+    """Réponse 304 : aucun corps, seulement les validateurs."""
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
+async def check_if_match(request: Request, product_id: int) -> Optional[dict]:
+    """
+    Concurrence optimiste : si le client envoie If-Match, le produit doit avoir
+    encore l'ETag qu'il a lu (lecture en base, pas dans le cache) -> sinon 412.
+
+    Retourne la ligne vérifiée (None sans If-Match), à passer en 'expected' à
+    l'écriture : elle n'a lieu que si la ligne n'a pas changé entre-temps, sinon
+    PreconditionFailedError (412, voir precondition_failed_handler). Sans cela,
+    deux clients avec le même ETag passeraient tous deux la vérification.
+    """
+    if request.headers.get("if-match") is None:
+        return None
+    current = await repository.get_product_by_id(product_id, use_cache=False)
+    if not current:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=PRODUCT_NOT_FOUND)
+    if conditional.precondition_failed(request.headers, conditional.product_etag(current)):
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=PRODUCT_MODIFIED)
+    return current
+
 
 # --- Création de l'app FastAPI ---
 
 app = FastAPI(
     title="Product API",
     description="API CRUD de gestion des produits — DOCorps",
-    version="1.0.0"
+    version="1.0.0",
+    # orjson si installé (voir serialization.py) pour toutes les réponses JSON
+    default_response_class=FastJSONResponse,
 )
 
 # CORS : appels depuis le frontend React (navigateur)
@@ -71,30 +278,66 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Sans ça, le navigateur cache ces headers au JavaScript du frontend
+    expose_headers=["X-Next-Cursor", "Link", "ETag", "Last-Modified", "Server-Timing"],
 )
 
+# Compression gzip / brotli / zstd des réponses d'au moins COMPRESSION_MIN_SIZE octets.
+# Ajouté avant ServerTimingMiddleware : il s'exécute à l'intérieur, son temps apparaît donc dans Server-Timing.
+app.add_middleware(compression.CompressionMiddleware)
+
+# Header Server-Timing (temps SQL, attente du pool, JSON, compression, total) sur chaque réponse
+app.add_middleware(ServerTimingMiddleware)
+
+# Profilage cProfile d'un pourcentage de requêtes, activé à la demande (routes /admin/profiling)
+app.add_middleware(profiling.ProfilingMiddleware)
+
 # Métriques HTTP pour Prometheus (/metrics)
+# Les métriques internes (pool, requêtes SQL, caches...) sont déclarées dans metrics.py
+# et exposées sur la même route.
 Instrumentator().instrument(app).expose(app)
 
 
+@app.exception_handler(PreconditionFailedError)
+def precondition_failed_handler(request: Request, exc: PreconditionFailedError):
+    """Écriture conditionnelle (If-Match) refusée : le produit a changé depuis la vérification."""
+    return JSONResponse(status_code=status.HTTP_412_PRECONDITION_FAILED, content={"detail": PRODUCT_MODIFIED})
+
+
+@app.exception_handler(PoolTimeoutError)
+def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    """Pool de connexions saturé : 503 pour que le client (ou le LB) réessaie."""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Base de données momentanément saturée, réessayez"},
+        headers={"Retry-After": "1"},
+    )
+
+
 # --- Événement de démarrage ---
 
 @app.on_event("startup")
-def startup():
+async def startup():
     """
-    S'exécute UNE SEULE FOIS quand le serveur démarre.
-    Crée la table si elle n'existe pas, puis insère les produits démo si la base est vide.
+    S'exécute UNE SEULE FOIS quand le serveur démarre (dans chaque worker).
+    Ouvre le pool, applique les migrations manquantes, puis insère les produits démo si la base est vide.
+    Retire d'abord de /metrics les gauges des workers morts (que uvicorn relance).
+
+    Le temps de démarrage ne dépend pas de la taille du catalogue : une base à
+    jour ne coûte qu'une lecture de version, et "vide ?" est un EXISTS (une ligne lue au plus).
+    Migrations et seed sont protégés par un verrou : plusieurs workers peuvent démarrer ensemble.
     """
-    init_db()
-    if not get_all_products():
-        for p in DEMO_PRODUCTS:
-            create_product(
-                name=p["name"],
-                description=p["description"],
-                price=p["price"],
-                stock=p["stock"],
-                category=p["category"],
-            )
+    metrics.cleanup_dead_workers()
+    await repository.startup()
+    await repository.seed_if_empty(DEMO_PRODUCTS)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Termine les flux SSE ouverts, ferme les connexions du pool et retire les gauges du worker de /metrics."""
+    await events.broker.close()
+    await repository.shutdown()
+    metrics.mark_worker_dead()
 
 
 # --- Routes ---
@@ -102,42 +345,370 @@ def startup():
 # HEALTH CHECK — Pas d'auth requise
 # Utile pour Docker (HEALTHCHECK) et le monitoring (Prometheus)
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "ok"}
 
 
-# GET /products — Lister tous les produits
+# GET /products — Lister les produits (paginé)
 # Requires: être authentifié (user ou admin)
 @app.get("/products")
-def list_products(user: CurrentUser):
+async def list_products(
+    request: Request,
+    user: CurrentUser,
+    limit: Annotated[int, Query(ge=1, le=PRODUCTS_MAX_PAGE_SIZE)] = PRODUCTS_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    min_price: Annotated[Optional[float], Query(ge=0)] = None,
+    max_price: Annotated[Optional[float], Query(ge=0)] = None,
+    in_stock: Optional[bool] = None,
+    sort: SortOption = "id",
+):
     """
-    Retourne la liste de tous les produits.
+    Retourne une page de produits (tableau JSON), filtrée et triée par la base.
+
     Le paramètre 'user' est injecté par Depends — on ne l'appelle pas nous-mêmes.
+
+    Pagination par curseur : s'il reste des produits, la réponse contient
+    le header X-Next-Cursor (et un header Link rel="next") ; il suffit de
+    rappeler la même URL avec ?cursor=<valeur> pour obtenir la page suivante.
+
+    ETag = version du catalogue + paramètres : si le client renvoie le même
+    (If-None-Match), on répond 304 sans même exécuter la requête de liste.
     """
-    return get_all_products()
+    state = await repository.get_catalogue_state()
+    validators = {
+        "ETag": conditional.list_etag(state["version"], request.url.query),
+        "Last-Modified": conditional.http_date(state["updated_at"]),
+        "Cache-Control": CACHE_CONTROL,
+    }
+    if conditional.is_not_modified(request.headers, validators["ETag"], state["updated_at"]):
+        return not_modified(validators)
+    encoding = compression.choose_encoding(request.headers.get("accept-encoding"))
+    unfiltered = category is None and min_price is None and max_price is None and in_stock is None
+    try:
+        if encoding and unfiltered:
+            # Liste sans filtre : corps compressé mis en cache jusqu'à la prochaine écriture
+            body, used, next_cursor = await repository.get_compressed_list_page(encoding, limit, cursor, sort)
+            return compressed_page_response(request, body, used, next_cursor, validators)
+        products, next_cursor = await repository.list_products(
+            limit=limit, cursor=cursor, category=category,
+            min_price=min_price, max_price=max_price, in_stock=in_stock, sort=sort,
+        )
+    except InvalidCursorError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return page_response(request, products, next_cursor, validators)
+
+
+# GET /products/search — Recherche plein texte
+# Déclarée AVANT /products/{product_id}, sinon "search" serait pris pour un ID.
+@app.get("/products/search")
+async def search_products(
+    request: Request,
+    user: CurrentUser,
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    limit: Annotated[int, Query(ge=1, le=PRODUCTS_MAX_PAGE_SIZE)] = PRODUCTS_PAGE_SIZE,
+    cursor: Optional[str] = None,
+):
+    """
+    Recherche dans le nom, la description et la catégorie, les plus pertinents d'abord.
+
+    Chaque mot est un préfixe ("clav souris" trouve les produits contenant
+    un mot commençant par "clav" ET un mot commençant par "souris").
+    La base répond via son index plein texte : seuls les produits de la page
+    sont transférés. Même pagination que GET /products (X-Next-Cursor, Link).
+    """
+    try:
+        products, next_cursor = await repository.search_products(q, limit=limit, cursor=cursor)
+    except (InvalidCursorError, InvalidSearchError) as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return page_response(request, products, next_cursor)
+
+
+# GET /products/stats — Statistiques du catalogue (tableaux de bord)
+# Déclarée AVANT /products/{product_id}, sinon "stats" serait pris pour un ID.
+@app.get("/products/stats")
+async def catalogue_stats(request: Request, response: Response, user: CurrentUser):
+    """
+    Totaux du catalogue et détail par catégorie : nombre de produits, produits
+    en stock, stock total, valeur du stock (prix x stock), prix min / max.
+
+    Lu dans une table d'agrégats tenue à jour par la base à chaque écriture :
+    le coût dépend du nombre de catégories, pas du nombre de produits.
+    Même ETag / 304 que GET /products (version du catalogue).
+    """
+    state = await repository.get_catalogue_state()
+    validators = {
+        "ETag": conditional.list_etag(state["version"], "stats"),
+        "Last-Modified": conditional.http_date(state["updated_at"]),
+        "Cache-Control": CACHE_CONTROL,
+    }
+    if conditional.is_not_modified(request.headers, validators["ETag"], state["updated_at"]):
+        return not_modified(validators)
+    response.headers.update(validators)
+    return await repository.get_catalogue_stats()
+
+
+# GET /products/top — Classement des produits filtrés
+# Déclarée AVANT /products/{product_id}, sinon "top" serait pris pour un ID.
+@app.get("/products/top")
+async def top_products(
+    user: CurrentUser,
+    sort: TopOption = "-inventory_value",
+    n: Annotated[int, Query(ge=1, le=TOP_MAX_SIZE)] = 10,
+    category: Optional[str] = None,
+    min_price: Annotated[Optional[float], Query(ge=0)] = None,
+    max_price: Annotated[Optional[float], Query(ge=0)] = None,
+    in_stock: Optional[bool] = None,
+):
+    """
+    Les n premiers produits selon 'sort' parmi ceux qui passent les filtres
+    (mêmes filtres que GET /products). "-inventory_value" (défaut) : les
+    produits qui immobilisent le plus de stock en valeur (prix x stock).
+
+    Servi par l'instantané colonnaire NumPy s'il est disponible (snapshot.py),
+    sinon en SQL. Avec l'instantané, le résultat peut avoir jusqu'à
+    SNAPSHOT_REFRESH_INTERVAL secondes de retard sur les écritures des autres workers.
+    """
+    return await repository.top_products(sort, n, category, min_price, max_price, in_stock)
+
+
+# GET /products/analytics — Agrégats sur les produits filtrés
+@app.get("/products/analytics")
+async def product_analytics(
+    user: CurrentUser,
+    category: Optional[str] = None,
+    min_price: Annotated[Optional[float], Query(ge=0)] = None,
+    max_price: Annotated[Optional[float], Query(ge=0)] = None,
+    in_stock: Optional[bool] = None,
+):
+    """
+    Même réponse que GET /products/stats, mais calculée sur les produits
+    filtrés, plus prix moyen (global et par catégorie) et prix médian.
+    Ex : ?min_price=10&max_price=50 — valeur du stock de la gamme 10-50 €.
+
+    Contrairement à /products/stats (agrégats tenus par triggers), toutes les
+    lignes filtrées sont relues : depuis l'instantané NumPy si disponible, sinon en SQL.
+    """
+    return await repository.get_analytics(category, min_price, max_price, in_stock)
+
+
+# GET /products/changes — Flux des changements depuis un curseur (synchronisation)
+# Déclarée AVANT /products/{product_id}, sinon "changes" serait pris pour un ID.
+@app.get("/products/changes")
+async def product_changes(
+    user: CurrentUser,
+    since: Annotated[int, Query(ge=0)] = 0,
+    limit: Annotated[int, Query(ge=1, le=CHANGES_MAX_PAGE_SIZE)] = CHANGES_PAGE_SIZE,
+):
+    """
+    Ce qui a changé depuis 'since', dans l'ordre des écritures :
+    {"changes": [{"seq", "op": "upsert" | "delete", "id", "product"}], "next_since", "has_more"}.
+
+    Synchronisation d'une copie du catalogue : partir de since=0 (chaque produit
+    existant apparaît une fois), appliquer les changements, garder next_since,
+    rappeler tant que has_more est vrai — puis périodiquement avec le dernier next_since.
+    Seul le dernier changement de chaque produit est gardé : un produit modifié
+    dix fois n'apparaît qu'une fois, avec son état actuel.
+
+    410 Gone : le curseur précède des suppressions déjà purgées (client absent
+    plus de CHANGES_RETENTION_DAYS jours) -> resynchroniser depuis since=0.
+    """
+    try:
+        page = await repository.get_changes(since, limit)
+    except ChangeFeedExpiredError as exc:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail=str(exc))
+    return FastJSONResponse(page)
+
+
+# GET /products/events — Changements en direct (Server-Sent Events)
+# Déclarée AVANT /products/{product_id}, sinon "events" serait pris pour un ID.
+@app.get("/products/events")
+async def product_events(
+    user: CurrentUser,
+    last_event_id: Annotated[int | None, Header(ge=0)] = None,
+):
+    """
+    Flux text/event-stream : un événement "upsert" ou "delete" par changement,
+    dès qu'il est écrit (voir events.py). Reprise après coupure via le header
+    Last-Event-ID (envoyé automatiquement par le navigateur) ; un événement
+    "resync" signale qu'il faut repartir de GET /products/changes?since=0.
+
+    503 : le worker a déjà SSE_MAX_CLIENTS connexions ouvertes.
+    """
+    if events.broker.full:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Trop de flux d'événements ouverts",
+            headers={"Retry-After": "5"},
+        )
+    headers = {
+        "Cache-Control": "no-cache",
+        # nginx : transmettre chaque événement au lieu de le garder en tampon
+        "X-Accel-Buffering": "no",
+    }
+    return StreamingResponse(events.event_stream(last_event_id), media_type=events.MEDIA_TYPE, headers=headers)
+
+
+# GET /products/export — Export complet du catalogue en flux
+# Déclarée AVANT /products/{product_id}, sinon "export" serait pris pour un ID.
+@app.get("/products/export")
+async def export_products(
+    request: Request,
+    user: CurrentUser,
+    format: Literal["ndjson", "json"] = "ndjson",
+):
+    """
+    Exporte tout le catalogue sans le charger en mémoire.
+
+    - format=ndjson (défaut) : un produit JSON par ligne
+    - format=json : un seul tableau JSON, envoyé par morceaux
+
+    Les produits sont lus par lots de EXPORT_BATCH_SIZE et envoyés aussitôt
+    (réponse "chunked") : le premier octet part immédiatement et la mémoire
+    reste constante. Si le client envoie Accept-Encoding: gzip, le flux est compressé.
+    """
+    batches = repository.iter_products(EXPORT_BATCH_SIZE)
+    if format == "ndjson":
+        chunks, media_type = streaming.ndjson_chunks(batches), streaming.NDJSON_MEDIA_TYPE
+    else:
+        chunks, media_type = streaming.json_array_chunks(batches), streaming.JSON_MEDIA_TYPE
+
+    headers = {"Content-Disposition": f'attachment; filename="products.{format}"'}
+    if streaming.accepts_gzip(request.headers.get("accept-encoding", "")):
+        chunks = streaming.gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+
+# POST /products/batch-get — Plusieurs produits par leurs IDs en un aller-retour
+# POST plutôt que GET : la liste d'ids tient dans le body, pas dans une URL de longueur limitée.
+@app.post("/products/batch-get")
+async def batch_get_products(body: ProductIds, user: CurrentUser):
+    """
+    Remplace N appels à GET /products/{id} (panier, commande) par un seul :
+    une vérification du token, une requête SQL (WHERE id IN (...)) pour les
+    produits absents du cache.
+
+    Réponse : {"products": [...], "not_found": [...]}, dans l'ordre des ids
+    demandés, doublons ignorés. 413 au-delà de BATCH_GET_MAX_IDS ids.
+    """
+    if len(body.ids) > BATCH_GET_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Maximum {BATCH_GET_MAX_IDS} ids par requête",
+        )
+    products, missing = await repository.get_products_by_ids(body.ids) if body.ids else ([], [])
+    return {"products": products, "not_found": missing}
+
+
+# --- Opérations en masse (admin uniquement) ---
+# Tout le lot est écrit dans UNE transaction. Les éléments invalides sont
+# ignorés et signalés dans "errors" avec leur position dans la liste envoyée.
+
+# POST /products/bulk — Créer plusieurs produits
+@app.post("/products/bulk")
+async def bulk_create_products(items: Annotated[list[Any], Body()], user: AdminUser):
+    """Crée une liste de produits (même schéma que POST /products pour chaque élément)."""
+    valid, errors = validate_bulk_items(items, ProductCreate)
+    created = await repository.create_products([p.model_dump() for p in valid]) if valid else []
+    return {"created": created, "errors": errors}
+
+
+# PATCH /products/bulk — Modifier plusieurs produits
+@app.patch("/products/bulk")
+async def bulk_update_products(items: Annotated[list[Any], Body()], user: AdminUser):
+    """Met à jour une liste de produits : chaque élément = schéma de PUT + "id"."""
+    valid, errors = validate_bulk_items(items, ProductBulkUpdate)
+    updated, missing = await repository.update_products([p.model_dump() for p in valid]) if valid else ([], [])
+    return {"updated": updated, "not_found": missing, "errors": errors}
+
+
+# DELETE /products/bulk — Supprimer plusieurs produits
+# Déclarée AVANT DELETE /products/{product_id} ("bulk" n'est pas un ID)
+@app.delete("/products/bulk")
+async def bulk_delete_products(body: ProductIds, user: AdminUser):
+    """Supprime une liste d'ids ; les ids inexistants sont listés dans "not_found"."""
+    check_bulk_size(body.ids)
+    deleted, missing = await repository.delete_products(body.ids) if body.ids else ([], [])
+    return {"deleted": deleted, "not_found": missing}
+
+
+# --- Ajustements de stock atomiques (admin uniquement) ---
+# Pour les services de commande : pas de GET + PUT (deux allers-retours et
+# des mises à jour perdues en cas de concurrence), la base vérifie et modifie
+# le stock dans une seule instruction par ligne.
+
+# POST /products/stock — Plusieurs lignes (une commande), tout ou rien
+# Déclarée AVANT /products/{product_id}/stock ("stock" n'est pas un ID)
+@app.post("/products/stock")
+async def adjust_stock_batch(items: Annotated[list[StockAdjustmentItem], Body()], user: AdminUser):
+    """
+    Applique toutes les variations dans UNE transaction.
+    Si une ligne échoue, rien n'est écrit : 409 (ou 404) avec le détail des lignes refusées.
+    """
+    check_bulk_size(items)
+    if not items:
+        return {"updated": []}
+    try:
+        updated = await repository.adjust_stocks([item.model_dump() for item in items])
+    except StockConflictError as exc:
+        raise stock_conflict_error(exc)
+    return {"updated": updated}
+
+
+# POST /products/{product_id}/stock — Un seul produit
+@app.post("/products/{product_id}/stock")
+async def adjust_stock(product_id: ProductId, body: StockAdjustment, user: AdminUser):
+    """
+    Ajoute delta au stock (delta négatif = réservation / sortie) et retourne {"id", "stock"}.
+    409 si le stock ne suffit pas (il n'est jamais rendu négatif) ou dépasserait SQL_INT_MAX.
+    """
+    try:
+        updated = await repository.adjust_stocks([{"id": product_id, "delta": body.delta}])
+    except StockConflictError as exc:
+        if exc.not_found:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=PRODUCT_NOT_FOUND)
+        refused, message = (exc.insufficient, STOCK_INSUFFICIENT) if exc.insufficient else (exc.overflow, STOCK_OVERFLOW)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": message, "available": refused[0]["available"]},
+        )
+    return updated[0]
 
 
 # GET /products/{product_id} — Détail d'un produit
 @app.get("/products/{product_id}")
-def read_product(product_id: int, user: CurrentUser):
+async def read_product(product_id: ProductId, request: Request, response: Response, user: CurrentUser):
     """
     Retourne un produit par son ID.
     {product_id} dans l'URL devient le paramètre product_id de la fonction.
     FastAPI le convertit automatiquement en int.
+
+    Répond 304 (sans corps) si If-None-Match / If-Modified-Since montrent
+    que le client a déjà la version courante.
     """
-    product = get_product_by_id(product_id)
+    product = await repository.get_product_by_id(product_id)
     if not product:
         # 404 = ressource non trouvée, c'est le code HTTP standard
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=PRODUCT_NOT_FOUND
         )
+    validators = {
+        "ETag": conditional.product_etag(product),
+        "Last-Modified": conditional.http_date(product["updated_at"]),
+        "Cache-Control": CACHE_CONTROL,
+    }
+    if conditional.is_not_modified(request.headers, validators["ETag"], product["updated_at"]):
+        return not_modified(validators)
+    response.headers.update(validators)
     return product
 
 
 # POST /products — Créer un produit (admin uniquement)
 @app.post("/products", status_code=status.HTTP_201_CREATED)
-def create_new_product(product: ProductCreate, user: AdminUser):
+async def create_new_product(product: ProductCreate, user: AdminUser):
     """
     Crée un nouveau produit.
 
@@ -145,7 +716,7 @@ def create_new_product(product: ProductCreate, user: AdminUser):
     - 'Depends(require_admin)' : vérifie le JWT ET que le rôle = admin
     - status_code=201 : convention HTTP pour "ressource créée"
     """
-    return create_product(
+    return await repository.create_product(
         name=product.name,
         description=product.description,
         price=product.price,
@@ -156,35 +727,133 @@ def create_new_product(product: ProductCreate, user: AdminUser):
 
 # PUT /products/{product_id} — Modifier un produit (admin uniquement)
 @app.put("/products/{product_id}")
-def update_existing_product(product_id: int, product: ProductUpdate, user: AdminUser):
+async def update_existing_product(
+    product_id: ProductId, product: ProductUpdate, request: Request, response: Response, user: AdminUser
+):
     """
     Met à jour un produit existant.
     Combine un paramètre d'URL (product_id) et un body JSON (product).
+    Avec If-Match, refuse (412) si le produit a changé depuis la lecture du client.
     """
-    updated = update_product(
+    expected = await check_if_match(request, product_id)
+    updated = await repository.update_product(
         product_id=product_id,
         name=product.name,
         description=product.description,
         price=product.price,
         stock=product.stock,
-        category=product.category
+        category=product.category,
+        expected=expected,
     )
     if not updated:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=PRODUCT_NOT_FOUND
         )
+    response.headers["ETag"] = conditional.product_etag(updated)
+    return updated
+
+
+# PATCH /products/{product_id} — Modifier certains champs d'un produit (admin uniquement)
+# Déclarée APRÈS PATCH /products/bulk ("bulk" n'est pas un ID)
+@app.patch("/products/{product_id}")
+async def patch_existing_product(
+    product_id: ProductId, product: ProductPatch, request: Request, response: Response, user: AdminUser
+):
+    """
+    Met à jour seulement les champs envoyés : {"price": 19.9} suffit pour changer un prix,
+    sans relire ni renvoyer tout le produit. Le produit modifié revient de l'UPDATE
+    lui-même (RETURNING). If-Match est supporté comme pour PUT.
+    """
+    fields = product.model_dump(exclude_unset=True)
+    if not fields:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Aucun champ à modifier")
+    expected = await check_if_match(request, product_id)
+    updated = await repository.patch_product(product_id, fields, expected)
+    if not updated:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=PRODUCT_NOT_FOUND)
+    response.headers["ETag"] = conditional.product_etag(updated)
     return updated
 
 
 # DELETE /products/{product_id} — Supprimer un produit (admin uniquement)
 @app.delete("/products/{product_id}")
-def delete_existing_product(product_id: int, user: AdminUser):
-    """Supprime un produit. Retourne 404 s'il n'existe pas."""
-    deleted = delete_product(product_id)
+async def delete_existing_product(product_id: ProductId, request: Request, user: AdminUser):
+    """Supprime un produit. Retourne 404 s'il n'existe pas, 412 si If-Match ne correspond plus."""
+    expected = await check_if_match(request, product_id)
+    deleted = await repository.delete_product(product_id, expected)
     if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=PRODUCT_NOT_FOUND
         )
     return {"message": "Produit supprimé"}
+
+
+# --- Profilage en production (admin uniquement, voir profiling.py) ---
+# Chaque worker a son propre profileur : l'appel profile le worker qui le reçoit.
+
+# POST /admin/profiling/sample — Échantillonner les piles de tous les threads
+@app.post("/admin/profiling/sample", response_class=PlainTextResponse)
+async def sample_stacks(
+    user: AdminUser,
+    duration: Annotated[float, Query(gt=0, le=profiling.PROFILING_MAX_DURATION)] = 5.0,
+    interval_ms: Annotated[float, Query(ge=1, le=1000)] = 5.0,
+):
+    """
+    Relève les piles d'appels pendant 'duration' secondes et les renvoie au format
+    "collapsed stacks" (flamegraph.pl, speedscope). La réponse arrive à la fin de la fenêtre.
+    """
+    try:
+        counts = await profiling.sample_stacks(duration, interval_ms / 1000)
+    except profiling.ProfilerBusyError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
+    return PlainTextResponse(profiling.format_collapsed(counts))
+
+
+# POST /admin/profiling/requests — Profiler une part des requêtes pendant une fenêtre
+@app.post("/admin/profiling/requests")
+async def start_request_profiling(settings: RequestProfilingSettings, user: AdminUser):
+    """
+    Ex: {"rate": 0.05, "duration": 60} -> 5 % des requêtes sous cProfile pendant une minute.
+
+    cProfile suit la boucle d'événements, donc tout ce qui s'y exécute pendant
+    la requête profilée : une requête tirée au sort n'est profilée que si elle
+    est seule en cours, et son profil est jeté si une autre requête démarre
+    avant sa fin ("discarded_requests" dans la réponse). Sous charge, préférer
+    POST /admin/profiling/sample.
+    """
+    profiling.request_profiler.start(settings.rate, settings.duration)
+    return profiling.request_profiler.status()
+
+
+# GET /admin/profiling/requests — Résultat cumulé (texte ou fichier pstats)
+@app.get("/admin/profiling/requests")
+async def request_profile(
+    user: AdminUser,
+    format: Literal["text", "pstats"] = "text",
+    sort: Literal["cumulative", "tottime", "ncalls"] = "cumulative",
+    limit: Annotated[int, Query(ge=1, le=1000)] = 50,
+):
+    """
+    format=text : les fonctions les plus coûteuses (pstats.print_stats).
+    format=pstats : fichier binaire à ouvrir avec snakeviz ou pstats.Stats("fichier").
+    """
+    profiler = profiling.request_profiler
+    if profiler.stats is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Aucune requête profilée")
+    if format == "pstats":
+        return Response(
+            content=profiler.dump(),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": 'attachment; filename="product-api.pstats"'},
+        )
+    return PlainTextResponse(profiler.report(limit, sort))
+
+
+# DELETE /admin/profiling/requests — Arrêter la fenêtre avant son terme
+@app.delete("/admin/profiling/requests")
+async def stop_request_profiling(user: AdminUser):
+    """Arrête le profilage ; les statistiques restent consultables jusqu'à la prochaine fenêtre."""
+    profiling.request_profiler.stop()
+    return profiling.request_profiler.status()
@@ -8,13 +8,22 @@ Comment ça marche (le flux complet) :
 3. Ce fichier vérifie le token, extrait les infos (user_id, role)
 4. Si le token est invalide ou absent -> erreur 401 (non authentifié)
 5. Si le rôle n'est pas suffisant -> erreur 403 (interdit)
+
+Le frontend réutilise le même token pendant toute sa durée de vie (1h) : les
+claims d'un token déjà vérifié sont gardées en cache jusqu'à son "exp", ce qui
+évite de refaire la vérification HMAC à chaque requête.
 """
 
+import hashlib
 import os
+import time
+
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
+from cache import MISSING, TTLCache
+
 # --- Configuration ---
 
 # La clé secrète DOIT être la même que celle utilisée par l'API Auth PHP
@@ -29,6 +38,51 @@ JWT_ALGORITHM = "HS256"
 # Ça apparaît aussi dans la doc Swagger auto-générée (le petit cadenas)
 security = HTTPBearer()
 
+# --- Cache des tokens déjà vérifiés ---
+# Clé = empreinte SHA-256 du token (on ne garde pas les tokens en clair en mémoire),
+# valeur = claims décodées. Une entrée expire au plus tard à l'"exp" du token :
+# un token expiré n'est donc jamais servi par le cache, il repasse par jwt.decode()
+# qui le rejette (401 "Token expiré").
+TOKEN_CACHE_ENABLED = os.environ.get("TOKEN_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "4096"))
+# Durée max d'une entrée, y compris pour un token sans "exp"
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", "300"))
+
+token_cache = TTLCache("token", TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL, TOKEN_CACHE_ENABLED)
+
+
+def _decode_claims(token: str):
+    """
+    Vérifie le token (signature + expiration) et retourne (claims normalisées, exp).
+    Lève jwt.ExpiredSignatureError / jwt.InvalidTokenError si le token est refusé.
+    """
+    # jwt.decode() vérifie la signature ET décode le contenu (payload)
+    # Si la signature ne correspond pas à JWT_SECRET -> exception
+    # Si le token est expiré -> exception
+    raw = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    # L'API Auth PHP enveloppe les claims sous « data » (Firebase JWT)
+    if isinstance(raw.get("data"), dict):
+        claims = dict(raw["data"])
+    else:
+        claims = dict(raw)
+    # Aligner id / user_id pour cohérence avec les tests ou autres clients
+    if "id" in claims and "user_id" not in claims:
+        claims["user_id"] = claims["id"]
+    # Le cache a besoin de l'expiration, qui n'est pas forcément dans "data"
+    return claims, raw.get("exp")
+
+
+def verify_token(token: str) -> dict:
+    """Claims d'un token valide : depuis le cache si déjà vérifié, sinon via jwt.decode()."""
+    key = hashlib.sha256(token.encode()).digest()
+    claims = token_cache.get(key)
+    if claims is MISSING:
+        claims, exp = _decode_claims(token)
+        ttl = None if exp is None else float(exp) - time.time()
+        token_cache.set(key, claims, ttl=ttl)
+    # Copie : une route qui modifierait le dict ne doit pas altérer le cache
+    return dict(claims)
+
 
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """
@@ -48,19 +102,7 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
     token = credentials.credentials  # Le token brut (sans le "Bearer " devant)
 
     try:
-        # jwt.decode() vérifie la signature ET décode le contenu (payload)
-        # Si la signature ne correspond pas à JWT_SECRET -> exception
-        # Si le token est expiré -> exception
-        raw = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        # L'API Auth PHP enveloppe les claims sous « data » (Firebase JWT)
-        if isinstance(raw.get("data"), dict):
-            claims = dict(raw["data"])
-        else:
-            claims = dict(raw)
-        # Aligner id / user_id pour cohérence avec les tests ou autres clients
-        if "id" in claims and "user_id" not in claims:
-            claims["user_id"] = claims["id"]
-        return claims
+        return verify_token(token)
 
     except jwt.ExpiredSignatureError:
         # Le token était valide mais a expiré
@@ -0,0 +1,261 @@
+"""
+bench_api.py — Benchmark de charge et de latence de l'API Produits
+
+Mesure débit (requêtes/s) et latences p50 / p95 / p99 des routes principales
+avec des clients concurrents, pour plusieurs tailles de catalogue, et écrit
+le résultat en JSON pour comparer deux versions entre elles.
+
+Deux modes :
+- en processus (défaut) : l'app FastAPI est appelée directement via
+  httpx.ASGITransport, sur une base SQLite temporaire (products.db n'est pas touché)
+- --url : contre un serveur déjà lancé (ex: python server.py), seedé via POST /products/bulk
+
+Usage (depuis le dossier product-api) :
+  python benchmarks/bench_api.py
+  python benchmarks/bench_api.py --sizes 1000,100000 --requests 2000 --concurrency 32 --output bench.json
+  python benchmarks/bench_api.py --url http://localhost:5000 --sizes 10000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+import jwt
+
+# Même astuce que les tests : rendre app, database, ... importables
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from seed_products import CATEGORIES, generate_products  # noqa: E402
+
+# Taille des lots envoyés à POST /products/bulk pendant le seed
+SEED_BATCH_SIZE = 1000
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Percentile par la méthode du rang le plus proche (valeurs déjà triées)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(name: str, latencies: list, errors: int, elapsed: float, concurrency: int) -> dict:
+    """Statistiques d'un scénario (latences en millisecondes)."""
+    values = sorted(latencies)
+    count = len(values)
+    return {
+        "scenario": name,
+        "requests": count,
+        "errors": errors,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(count / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(values) / count, 3) if count else 0.0,
+            "p50": round(percentile(values, 50), 3),
+            "p95": round(percentile(values, 95), 3),
+            "p99": round(percentile(values, 99), 3),
+            "max": round(values[-1], 3) if count else 0.0,
+        },
+    }
+
+
+async def seed(client: httpx.AsyncClient, headers: dict, count: int, seed_value: int) -> list:
+    """Remplit le catalogue via POST /products/bulk et retourne les ids créés."""
+    ids, batch = [], []
+    for product in generate_products(count, seed_value):
+        batch.append(product)
+        if len(batch) == SEED_BATCH_SIZE:
+            ids += await _post_batch(client, headers, batch)
+            batch = []
+    if batch:
+        ids += await _post_batch(client, headers, batch)
+    return ids
+
+
+async def _post_batch(client, headers, batch) -> list:
+    response = await client.post("/products/bulk", json=batch, headers=headers)
+    response.raise_for_status()
+    return [p["id"] for p in response.json()["created"]]
+
+
+def scenarios(ids: list, admin: dict, user: dict, rng: random.Random) -> dict:
+    """
+    Scénarios mesurés : nom -> fonction qui construit une requête (méthode, url, kwargs).
+    Les écritures admin ciblent des ids existants pris au hasard.
+    """
+    categories = sorted(CATEGORIES)
+    return {
+        "health": lambda: ("GET", "/health", {}),
+        "list_products": lambda: ("GET", "/products", {"headers": user}),
+        "list_filtered": lambda: (
+            "GET",
+            f"/products?category={rng.choice(categories)}&min_price=100&sort=-price",
+            {"headers": user},
+        ),
+        "search": lambda: ("GET", f"/products/search?q={rng.choice(categories)[:4]}", {"headers": user}),
+        "get_product": lambda: ("GET", f"/products/{rng.choice(ids)}", {"headers": user}),
+        "create_product": lambda: (
+            "POST", "/products",
+            {"headers": admin, "json": {"name": "Bench", "price": rng.uniform(1, 100), "stock": 1}},
+        ),
+        "update_product": lambda: (
+            "PUT", f"/products/{rng.choice(ids)}",
+            {"headers": admin, "json": {"name": "Bench maj", "price": rng.uniform(1, 100), "stock": 2}},
+        ),
+    }
+
+
+async def run_scenario(client, name, make_request, total: int, concurrency: int) -> dict:
+    """Lance 'total' requêtes réparties entre 'concurrency' clients simultanés."""
+    latencies, errors = [], 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, url, kwargs = make_request()
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(name, latencies, errors, time.perf_counter() - started, concurrency)
+
+
+def _token(secret: str, role: str) -> dict:
+    token = jwt.encode({"user_id": 1, "role": role}, secret, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def bench_size(client, size: int, args, secret: str) -> dict:
+    """Seed puis mesure tous les scénarios pour une taille de catalogue."""
+    admin, user = _token(secret, "admin"), _token(secret, "user")
+    started = time.perf_counter()
+    ids = await seed(client, admin, size, args.seed)
+    seed_seconds = time.perf_counter() - started
+    rng = random.Random(args.seed)
+    results = []
+    for name, make_request in scenarios(ids, admin, user, rng).items():
+        if args.only and name not in args.only:
+            continue
+        # Échauffement : caches, pool de connexions, JIT des requêtes préparées
+        await run_scenario(client, name, make_request, min(args.warmup, args.requests), args.concurrency)
+        results.append(await run_scenario(client, name, make_request, args.requests, args.concurrency))
+    return {"catalogue_size": size, "seed_seconds": round(seed_seconds, 3), "scenarios": results}
+
+
+async def run_in_process(args) -> list:
+    """Mode par défaut : l'app tourne dans ce processus, sur une base SQLite temporaire par taille."""
+    import auth
+    import database
+    import repository
+    from app import app
+
+    if args.no_cache:
+        repository.product_cache.enabled = False
+        repository.list_cache.enabled = False
+    original_path = database.DATABASE_PATH
+    reports = []
+    try:
+        for size in args.sizes:
+            with tempfile.TemporaryDirectory() as tmp:
+                database.close_pool()
+                repository.clear_caches()
+                database.DATABASE_PATH = os.path.join(tmp, "bench.db")
+                database.init_db()
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                    reports.append(await bench_size(client, size, args, auth.JWT_SECRET))
+                database.close_pool()
+    finally:
+        database.DATABASE_PATH = original_path
+        repository.clear_caches()
+    return reports
+
+
+async def run_against_url(args) -> list:
+    """Mode --url : serveur déjà lancé (le catalogue s'ajoute à ce qui existe déjà)."""
+    secret = os.environ.get("JWT_SECRET", "devops-secret-key")
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    reports = []
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        for size in args.sizes:
+            reports.append(await bench_size(client, size, args, secret))
+    return reports
+
+
+def run_benchmark(args) -> dict:
+    """Exécute le benchmark et retourne le rapport complet (dict sérialisable en JSON)."""
+    runner = run_against_url if args.url else run_in_process
+    reports = asyncio.run(runner(args))
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "mode": "url" if args.url else "in-process",
+        "target": args.url or "asgi",
+        "python": platform.python_version(),
+        "settings": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "cache": not args.no_cache,
+        },
+        "results": reports,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de l'API Produits")
+    parser.add_argument("--sizes", default="1000,10000",
+                        type=lambda v: [int(x) for x in v.split(",") if x],
+                        help="Tailles de catalogue, séparées par des virgules")
+    parser.add_argument("--requests", type=int, default=1000, help="Requêtes mesurées par scénario")
+    parser.add_argument("--concurrency", type=int, default=16, help="Clients simultanés")
+    parser.add_argument("--warmup", type=int, default=50, help="Requêtes d'échauffement (non mesurées)")
+    parser.add_argument("--seed", type=int, default=42, help="Graine aléatoire (résultats reproductibles)")
+    parser.add_argument("--only", type=lambda v: set(v.split(",")), default=None,
+                        help="Limiter à certains scénarios (ex: get_product,list_products)")
+    parser.add_argument("--no-cache", action="store_true", help="Désactiver le cache des lectures (en processus)")
+    parser.add_argument("--url", default=None, help="Cibler un serveur lancé au lieu de l'app en processus")
+    parser.add_argument("--output", default=None, help="Fichier JSON de sortie (défaut : stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmark(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+        for size_report in report["results"]:
+            for s in size_report["scenarios"]:
+                print(
+                    f"[{size_report['catalogue_size']:>8}] {s['scenario']:<15} "
+                    f"{s['throughput_rps']:>9} req/s  p50={s['latency_ms']['p50']}ms  "
+                    f"p95={s['latency_ms']['p95']}ms  p99={s['latency_ms']['p99']}ms",
+                    file=sys.stderr,
+                )
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,79 @@
+"""
+bench_json.py — Coût de la sérialisation JSON d'une page de produits
+
+Compare, pour une page de N produits telle que la renvoie la base :
+- fastapi_default : ce que faisait GET /products (jsonable_encoder + json.dumps)
+- encoder_orjson  : jsonable_encoder + serialization.dumps (classe de réponse par défaut seule)
+- direct          : serialization.dumps directement (chemin actuel des routes de liste)
+
+Les produits existent en deux variantes : dates en str (SQLite) et en datetime (PostgreSQL).
+
+Usage (depuis le dossier product-api) :
+  python benchmarks/bench_json.py
+  python benchmarks/bench_json.py --sizes 100,1000 --repeat 200
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import serialization  # noqa: E402
+from seed_products import generate_products  # noqa: E402
+
+
+def sample_page(size: int, dates_as_text: bool) -> list:
+    """Une page de produits au format des lignes renvoyées par database.py / database_pg.py."""
+    now = datetime(2026, 4, 17, 10, 0, 0)
+    created = now.isoformat(sep=" ") if dates_as_text else now
+    return [
+        {"id": i + 1, **product, "created_at": created, "updated_at": created}
+        for i, product in enumerate(generate_products(size))
+    ]
+
+
+def strategies() -> dict:
+    return {
+        "fastapi_default": lambda page: JSONResponse(jsonable_encoder(page)).body,
+        "encoder_orjson": lambda page: serialization.dumps(jsonable_encoder(page)),
+        "direct": lambda page: serialization.dumps(page),
+    }
+
+
+def run(sizes: list, repeat: int) -> dict:
+    results = []
+    for size in sizes:
+        for backend, as_text in (("sqlite", True), ("postgres", False)):
+            page = sample_page(size, as_text)
+            timings = {}
+            for name, encode in strategies().items():
+                seconds = min(timeit.repeat(lambda: encode(page), number=repeat, repeat=3)) / repeat
+                timings[name] = round(seconds * 1e6, 1)
+            results.append({
+                "page_size": size,
+                "rows": backend,
+                "microseconds": timings,
+                "speedup": round(timings["fastapi_default"] / timings["direct"], 1),
+            })
+    return {"json_backend": serialization.JSON_BACKEND, "results": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de la sérialisation JSON")
+    parser.add_argument("--sizes", default="100,1000",
+                        type=lambda v: [int(x) for x in v.split(",") if x])
+    parser.add_argument("--repeat", type=int, default=100, help="Encodages par mesure")
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.sizes, args.repeat), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,148 @@
+"""
+bench_snapshot.py — Instantané colonnaire NumPy contre SQL (GET /products/top, /products/analytics)
+
+Pour chaque taille de catalogue (base SQLite temporaire, remplie par
+seed_products.bulk_load ; products.db n'est pas touché) :
+- load    : chargement complet de l'instantané (lecture des 4 colonnes + conversion)
+- refresh : application de N changements récents (flux product_changes)
+- chaque requête : durée SQL (database.top_products / get_analytics) contre
+  durée instantané (top_ids + lecture des n produits par id / analytics + summarize),
+  et le chemin choisi par repository.py ("served_by")
+
+Usage (depuis le dossier product-api, NumPy requis) :
+  python benchmarks/bench_snapshot.py
+  python benchmarks/bench_snapshot.py --sizes 100000,1000000 --repeat 5 --output snapshot.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import database  # noqa: E402
+import repository  # noqa: E402
+import snapshot  # noqa: E402
+from seed_products import bulk_load, generate_products  # noqa: E402
+
+# (nom, type de requête, paramètres) — mêmes paramètres que les routes
+QUERIES = (
+    ("top_inventory_value", "top", {"sort": "-inventory_value", "n": 10}),
+    ("top_price_in_range", "top", {"sort": "-price", "n": 10, "min_price": 50, "max_price": 200, "in_stock": True}),
+    ("top_stock_category", "top", {"sort": "-stock", "n": 100, "category": "Périphériques"}),
+    ("analytics_all", "analytics", {}),
+    ("analytics_price_range", "analytics", {"min_price": 20, "max_price": 100}),
+    ("analytics_category_in_stock", "analytics", {"category": "Périphériques", "in_stock": True}),
+)
+
+
+def best_of(func, repeat: int) -> float:
+    """Meilleure durée (ms) sur 'repeat' appels : la moins perturbée par le reste de la machine."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return round(min(timings) * 1000, 2)
+
+
+def sql_query(kind: str, params: dict):
+    if kind == "top":
+        return lambda: database.top_products(**params)
+    return lambda: database.get_analytics(**params)
+
+
+def snapshot_query(current, kind: str, params: dict):
+    if kind == "top":
+        # Même travail que repository.top_products : classement puis lecture des n produits
+        return lambda: database.get_products_by_ids(current.top_ids(**params))
+    return lambda: database.summarize_analytics(*current.analytics(**params))
+
+
+async def bench_size(size: int, args) -> dict:
+    bulk_load(generate_products(size, seed=args.seed))
+
+    started = time.perf_counter()
+    current = await repository._load_snapshot()
+    load_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    # Quelques écritures récentes : c'est leur application que mesure "refresh"
+    changed = [{"id": i, "name": "Modifié", "description": None, "price": 9.99, "stock": 3, "category": "Bench"}
+               for i in range(1, size + 1, max(1, size // args.changes))]
+    database.update_products(changed)
+    started = time.perf_counter()
+    await repository._refresh_snapshot(current)
+    refresh_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    queries = []
+    for name, kind, params in QUERIES:
+        sql_ms = best_of(sql_query(kind, params), args.repeat)
+        snapshot_ms = best_of(snapshot_query(current, kind, params), args.repeat)
+        filters = {key: value for key, value in params.items() if key != "n"}
+        routed = "sql" if kind == "top" and snapshot.index_serves_top(**filters) else "snapshot"
+        queries.append({
+            "query": name,
+            "served_by": routed,
+            "sql_ms": sql_ms,
+            "snapshot_ms": snapshot_ms,
+            "speedup": round(sql_ms / snapshot_ms, 1) if snapshot_ms else None,
+        })
+    return {
+        "catalogue_size": size,
+        "snapshot_load_ms": load_ms,
+        "snapshot_refresh_ms": {"changes": len(changed), "ms": refresh_ms},
+        "snapshot_bytes": sum(column.nbytes for column in current.columns),
+        "queries": queries,
+    }
+
+
+async def run(args) -> list:
+    original_path = database.DATABASE_PATH
+    reports = []
+    try:
+        for size in args.sizes:
+            with tempfile.TemporaryDirectory() as tmp:
+                database.close_pool()
+                repository.clear_caches()
+                database.DATABASE_PATH = os.path.join(tmp, "bench.db")
+                reports.append(await bench_size(size, args))
+                database.close_pool()
+    finally:
+        database.DATABASE_PATH = original_path
+        repository.clear_caches()
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark instantané NumPy contre SQL")
+    parser.add_argument("--sizes", default="100000,1000000",
+                        type=lambda v: [int(x) for x in v.split(",") if x])
+    parser.add_argument("--repeat", type=int, default=5, help="Exécutions par mesure (on garde la meilleure)")
+    parser.add_argument("--changes", type=int, default=1000, help="Produits modifiés avant la mesure du rafraîchissement")
+    parser.add_argument("--seed", type=int, default=42, help="Graine du catalogue généré")
+    parser.add_argument("--output", default=None, help="Fichier JSON de sortie (défaut : stdout)")
+    args = parser.parse_args(argv)
+    if snapshot.np is None:
+        print("NumPy n'est pas installé : pip install -r requirements-snapshot.txt", file=sys.stderr)
+        return 1
+    report = {
+        "python": platform.python_version(),
+        "numpy": snapshot.np.__version__,
+        "results": asyncio.run(run(args)),
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,112 @@
+"""
+cache.py — Cache mémoire LRU + TTL (lectures de produits, JWT vérifiés)
+
+Les lectures (GET /products, GET /products/{id}) sont bien plus fréquentes que
+les écritures admin : on garde les derniers résultats en mémoire pour ne pas
+interroger la base à chaque requête.
+
+- LRU : au-delà de maxsize entrées, on jette la moins récemment utilisée
+- TTL : une entrée plus vieille que ttl secondes est considérée comme absente
+
+Le cache est propre à chaque worker. Les écritures invalident le cache du
+worker qui les traite ; les autres workers (ou réplicas) se mettent à jour
+au plus tard après TTL secondes.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+# Valeur sentinelle : distingue "absent du cache" d'une valeur None
+MISSING = object()
+
+
+class TTLCache:
+    """Cache borné (LRU) dont les entrées expirent après 'ttl' secondes."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float, enabled: bool = True):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.enabled = enabled and maxsize > 0 and ttl > 0
+        self._data = OrderedDict()  # clé -> (expire_à, valeur)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        # Incrémenté à chaque invalidation (voir generation / set)
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        """
+        Numéro d'invalidation courant.
+
+        À lire AVANT d'interroger la base : si une écriture invalide le cache
+        pendant la requête, set(..., generation=ancien) ignore la valeur
+        (devenue potentiellement périmée) au lieu de la remettre en cache.
+        """
+        return self._generation
+
+    def get(self, key):
+        """Retourne la valeur en cache, ou MISSING (absente ou expirée)."""
+        if not self.enabled:
+            return MISSING
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self._hits += 1
+                    self._record(hit=True)
+                    return value
+                del self._data[key]
+                metrics.CACHE_EVICTIONS.labels(self.name, "expired").inc()
+            self._misses += 1
+            self._record(hit=False)
+        return MISSING
+
+    def _record(self, hit: bool):
+        """Met à jour les compteurs Prometheus et le ratio de hits (appelé sous verrou)."""
+        (metrics.CACHE_HITS if hit else metrics.CACHE_MISSES).labels(self.name).inc()
+        metrics.CACHE_HIT_RATIO.labels(self.name).set(self._hits / (self._hits + self._misses))
+
+    def set(self, key, value, generation: int = None, ttl: float = None):
+        """
+        Met une valeur en cache (sauf si le cache a été invalidé depuis 'generation').
+        ttl permet une durée de vie plus COURTE que celle du cache pour cette entrée.
+        """
+        if not self.enabled:
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                metrics.CACHE_EVICTIONS.labels(self.name, "size").inc()
+            metrics.CACHE_ENTRIES.labels(self.name).set(len(self._data))
+
+    def delete(self, *keys):
+        """Invalide des clés précises."""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._data.pop(key, None)
+            metrics.CACHE_ENTRIES.labels(self.name).set(len(self._data))
+
+    def clear(self):
+        """Invalide tout le cache."""
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+            metrics.CACHE_ENTRIES.labels(self.name).set(0)
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,174 @@
+"""
+compression.py — Compression des réponses HTTP (gzip, et brotli / zstd s'ils sont installés)
+
+Une page de 1000 produits pèse plusieurs centaines de Ko en JSON, et se
+compresse d'un facteur 5 à 10 : sur un lien lent ou lointain, c'est le
+transfert et non le serveur qui domine le temps de réponse.
+
+- CompressionMiddleware compresse toute réponse compressible (JSON, NDJSON, texte)
+  d'au moins COMPRESSION_MIN_SIZE octets, dans le meilleur encodage que le client
+  accepte (Accept-Encoding). En dessous du seuil, l'en-tête gzip et le coût CPU
+  ne valent pas le gain.
+- Les réponses qui ont déjà un Content-Encoding (export gzip en flux) ou qui
+  sont envoyées en plusieurs morceaux (flux) passent sans modification.
+- brotli (paquet "Brotli") et zstd (paquet "zstandard") sont optionnels :
+  sans eux, seul gzip (module standard) est proposé.
+- Les pages de GET /products sans filtre sont mises en cache déjà compressées
+  (repository.get_compressed_list_page) : on ne recompresse pas le même
+  mégaoctet à chaque requête, seulement après une écriture.
+
+L'ETag d'une réponse compressée devient "faible" (W/"...") : le contenu décodé
+est identique, pas les octets transmis. Les comparaisons de conditional.py
+ignorent W/, les 304 et If-Match continuent donc de fonctionner.
+"""
+
+import gzip
+import os
+import time
+
+from starlette.datastructures import Headers, MutableHeaders
+
+import timing
+
+try:
+    import brotli
+except ImportError:  # brotli est optionnel
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard est optionnel
+    zstandard = None
+
+# Taille minimale (octets) d'une réponse pour qu'elle soit compressée
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+
+# Niveaux "rapides" : l'essentiel du gain pour une fraction du coût CPU des niveaux max
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+# Types de contenu qui gagnent à être compressés (les autres sont déjà compacts ou binaires)
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def _gzip(data: bytes) -> bytes:
+    # mtime=0 : même entrée -> mêmes octets (pas d'horodatage dans l'en-tête)
+    return gzip.compress(data, GZIP_LEVEL, mtime=0)
+
+
+# Encodages disponibles, par ordre de préférence du serveur à qualité égale côté client
+ENCODERS = {}
+if brotli is not None:
+    ENCODERS["br"] = lambda data: brotli.compress(data, quality=BROTLI_QUALITY)
+if zstandard is not None:
+    # Un compresseur par appel : un ZstdCompressor ne se partage pas entre threads
+    ENCODERS["zstd"] = lambda data: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+ENCODERS["gzip"] = _gzip
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """Accept-Encoding -> {encodage: qualité} (ex: "gzip, br;q=0.8" -> {"gzip": 1.0, "br": 0.8})."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def choose_encoding(header) -> str | None:
+    """Meilleur encodage disponible accepté par le client, ou None (réponse non compressée)."""
+    if not header:
+        return None
+    accepted = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for name in ENCODERS:
+        quality = accepted.get(name, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compresse 'data' (durée ajoutée au header Server-Timing, entrée "compress")."""
+    started = time.perf_counter()
+    body = ENCODERS[encoding](data)
+    timing.record("compress", time.perf_counter() - started)
+    return body
+
+
+def compress_body(data: bytes, encoding: str | None):
+    """(corps, encodage utilisé) : sans compression (None) sous le seuil COMPRESSION_MIN_SIZE."""
+    if encoding is None or len(data) < COMPRESSION_MIN_SIZE:
+        return data, None
+    return compress(data, encoding), encoding
+
+
+def weak_etag(etag: str) -> str:
+    return etag if etag.startswith("W/") else f"W/{etag}"
+
+
+def set_encoding_headers(headers: MutableHeaders, encoding: str, length: int):
+    """Headers d'une réponse compressée : Content-Encoding, Content-Length, Vary, ETag faible."""
+    headers["Content-Encoding"] = encoding
+    headers["Content-Length"] = str(length)
+    headers.add_vary_header("Accept-Encoding")
+    if "etag" in headers:
+        headers["ETag"] = weak_etag(headers["etag"])
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI : retient le début de la réponse jusqu'au premier morceau du corps,
+    puis décide de compresser (corps complet, assez gros, compressible) ou de tout transmettre tel quel.
+    """
+
+    def __init__(self, app, minimum_size: int = None):
+        self.app = app
+        self.minimum_size = COMPRESSION_MIN_SIZE if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding")) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is None:
+                # Décision déjà prise (morceaux suivants d'un flux)
+                await send(message)
+                return
+            head, start = start, None
+            body = message.get("body", b"")
+            headers = MutableHeaders(scope=head)
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+                or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            ):
+                await send(head)
+                await send(message)
+                return
+            compressed = compress(body, encoding)
+            set_encoding_headers(headers, encoding, len(compressed))
+            await send(head)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
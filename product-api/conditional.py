@@ -0,0 +1,91 @@
+"""
+conditional.py — Requêtes HTTP conditionnelles (ETag / Last-Modified / 304)
+
+Un client qui a déjà une réponse la renvoie avec son "validateur" :
+    If-None-Match: "<etag>"            (prioritaire)
+    If-Modified-Since: <date HTTP>
+Si rien n'a changé, l'API répond 304 Not Modified SANS corps : ni sérialisation
+JSON côté serveur, ni téléchargement côté client.
+
+Pour les écritures, If-Match: "<etag>" permet la concurrence optimiste :
+si le produit a changé depuis la lecture du client -> 412 Precondition Failed.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+
+def _digest(*parts) -> str:
+    return hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+
+
+def product_etag(product: dict) -> str:
+    """
+    ETag d'un produit : id + updated_at + contenu.
+
+    updated_at seul est à la seconde près (CURRENT_TIMESTAMP SQLite) : deux
+    modifications dans la même seconde auraient le même ETag. On ajoute donc
+    une empreinte des champs, ce qui reste très bon marché.
+    """
+    fields = tuple(product.get(key) for key in ("name", "description", "price", "stock", "category"))
+    return f'"p{product["id"]}-{_digest(product.get("updated_at"), fields)}"'
+
+
+def list_etag(catalogue_version: int, query: str) -> str:
+    """
+    ETag d'une page de liste : version du catalogue + paramètres de la requête.
+
+    La version est incrémentée (par trigger SQL) à chaque écriture sur products :
+    elle change dès qu'une page quelconque peut avoir changé.
+    """
+    return f'"c{catalogue_version}-{_digest(query)}"'
+
+
+def _to_utc(value) -> datetime:
+    """updated_at vient en str (SQLite, UTC) ou en datetime (PostgreSQL)."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def http_date(value) -> str:
+    """Formate un timestamp au format des headers HTTP (Last-Modified)."""
+    return format_datetime(_to_utc(value), usegmt=True)
+
+
+def _etag_in(header: str, etag: str) -> bool:
+    """Comparaison "faible" (W/ ignoré) d'un ETag avec une liste If-None-Match / If-Match."""
+    if header.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def is_not_modified(headers, etag: str, last_modified=None) -> bool:
+    """
+    Vrai si la requête GET peut recevoir un 304.
+
+    Comme le prévoit la RFC 9110, If-Modified-Since est ignoré quand If-None-Match est présent.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_in(if_none_match, etag)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return _to_utc(last_modified) <= since
+    return False
+
+
+def precondition_failed(headers, etag: str) -> bool:
+    """Vrai si If-Match est présent et ne correspond pas à l'ETag courant (-> 412)."""
+    if_match = headers.get("if-match")
+    return if_match is not None and not _etag_in(if_match, etag)
@@ -5,129 +5,1429 @@ Ce fichier isole TOUTE la logique base de données.
 Si un jour on passe de SQLite à PostgreSQL, on ne modifie QUE ce fichier.
 """
 
-import sqlite3
+import base64
+import functools
+import inspect
+import json
 import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import metrics
+import timing
 
 # Chemin vers le fichier de base de données
 # os.path.dirname(__file__) = le dossier où se trouve CE fichier (product-api/)
 # Donc products.db sera créé dans product-api/products.db
 DATABASE_PATH = os.path.join(os.path.dirname(__file__), "products.db")
 
+# --- Configuration du pool de connexions ---
+# Nombre max de connexions ouvertes par worker uvicorn
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+# Temps max (secondes) qu'une requête attend une connexion libre avant d'échouer
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "5"))
+# Taille du cache de pages SQLite PAR connexion, en Kio
+DB_CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", "16384"))
+
+
+class PoolTimeoutError(Exception):
+    """Aucune connexion libre dans le pool avant DB_POOL_TIMEOUT."""
+
+
+# --- Instrumentation des accès à la base ---
+# Chaque fonction d'accès est décorée par @instrumented("<operation>") :
+# durée (Histogram), nombre de lignes et erreurs dans /metrics, et cumul dans
+# le header Server-Timing de la requête (timing.py). Le même décorateur sert
+# aux fonctions async de database_pg.py.
+
+# Attente du pool pendant l'appel instrumenté en cours, à retirer de sa durée :
+# une requête SQL lente et un pool saturé ne se corrigent pas de la même façon.
+_pool_wait: ContextVar = ContextVar("pool_wait", default=None)
+
+
+def record_pool_wait(seconds: float):
+    """Appelé par les pools à chaque emprunt de connexion."""
+    metrics.DB_POOL_WAIT.observe(seconds)
+    timing.record("db-wait", seconds)
+    pending = _pool_wait.get()
+    if pending is not None:
+        pending[0] += seconds
+
+
+def _row_count(result) -> int:
+    """Lignes renvoyées / écrites : liste, (liste, ...), dict (une ligne) ou None."""
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        result = result[0]
+    if isinstance(result, list):
+        return len(result)
+    return 0 if result is None else 1
+
+
+def _record_query(operation: str, query: str, seconds: float, rows, failed: bool):
+    metrics.DB_QUERY_DURATION.labels(operation, query).observe(seconds)
+    if failed:
+        metrics.DB_QUERY_ERRORS.labels(operation, query).inc()
+    else:
+        metrics.DB_QUERY_ROWS.labels(operation, query).observe(rows)
+    timing.record("db", seconds)
+
+
+def instrumented(operation: str):
+    """Décorateur : mesure une fonction d'accès à la base (sync ou async)."""
+    def decorator(func):
+        query = func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                waited = [0.0]
+                token = _pool_wait.set(waited)
+                started = time.perf_counter()
+                result, failed = None, True
+                try:
+                    result = await func(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    _pool_wait.reset(token)
+                    elapsed = time.perf_counter() - started - waited[0]
+                    _record_query(operation, query, elapsed, _row_count(result), failed)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            waited = [0.0]
+            token = _pool_wait.set(waited)
+            started = time.perf_counter()
+            result, failed = None, True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                _pool_wait.reset(token)
+                elapsed = time.perf_counter() - started - waited[0]
+                _record_query(operation, query, elapsed, _row_count(result), failed)
+        return wrapper
+    return decorator
+
+
+class ConnectionPool:
+    """
+    Pool borné et thread-safe de connexions SQLite.
+
+    Ouvrir une connexion SQLite coûte cher (ouverture du fichier, lecture du
+    schéma, cache vide) : on les ouvre une seule fois puis on les réutilise.
+    Les appels passent par l'exécuteur de repository.py (plusieurs threads) :
+    plusieurs threads empruntent des connexions en même temps : d'où la file (queue.Queue) et le verrou.
+
+    Le pool est propre à chaque processus (un par worker uvicorn).
+    """
+
+    def __init__(self, path: str, size: int, timeout: float):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        # LIFO : on réutilise la connexion la plus "chaude" (cache de pages rempli)
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._opened = 0
+        metrics.DB_POOL_SIZE.set(size)
+
+    def _connect(self):
+        """Ouvre une connexion et applique les réglages de performance."""
+        # check_same_thread=False : la connexion est rendue au pool puis
+        # réutilisée par un autre thread (jamais par deux threads à la fois)
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # WAL : les lecteurs ne bloquent plus l'écrivain (et inversement)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL suffit en WAL : pas de fsync à chaque commit, seulement aux checkpoints
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Valeur négative = taille en Kio plutôt qu'en nombre de pages
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _timed_connect(self):
+        started = time.perf_counter()
+        conn = self._connect()
+        elapsed = time.perf_counter() - started
+        metrics.DB_CONNECT_DURATION.observe(elapsed)
+        timing.record("db-connect", elapsed)
+        return conn
+
+    def acquire(self):
+        """Emprunte une connexion (en ouvre une nouvelle si le pool n'est pas plein)."""
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn = self._timed_connect()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+                metrics.DB_POOL_OPEN.inc()
+            else:
+                # Pool plein : on attend qu'une autre requête rende sa connexion
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    metrics.DB_POOL_TIMEOUTS.inc()
+                    raise PoolTimeoutError(
+                        f"Aucune connexion libre après {self.timeout}s (pool de {self.size})"
+                    )
+        record_pool_wait(time.perf_counter() - started)
+        metrics.DB_POOL_IN_USE.inc()
+        return conn
+
+    def release(self, conn):
+        """Rend une connexion au pool (en annulant une transaction restée ouverte)."""
+        metrics.DB_POOL_IN_USE.dec()
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager : emprunte une connexion, commit si tout s'est bien passé,
+        rollback sinon, puis rend la connexion au pool.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Ferme toutes les connexions inactives (arrêt du serveur, tests)."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+            metrics.DB_POOL_OPEN.dec()
+
+    def stats(self):
+        """Photographie de l'état du pool (utile pour le debug et les tests)."""
+        with self._lock:
+            opened = self._opened
+        idle = self._idle.qsize()
+        return {"size": self.size, "open": opened, "idle": idle, "in_use": opened - idle}
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Retourne le pool du processus courant (créé à la première utilisation).
+
+    On mémorise le PID : après un fork (workers uvicorn/gunicorn), le processus
+    enfant ne doit pas réutiliser les connexions ouvertes par le parent.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool(DATABASE_PATH, DB_POOL_SIZE, DB_POOL_TIMEOUT)
+                _pool_pid = pid
+    return _pool
+
+
+def close_pool():
+    """Ferme le pool du processus (appelé à l'arrêt de l'app et par les tests)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.close()
+        _pool = None
+
 
 def get_db():
     """
-    Ouvre une connexion vers la base SQLite.
+    Emprunte une connexion SQLite au pool, à utiliser avec "with" :
+
+        with get_db() as conn:
+            conn.execute(...)
 
     row_factory = sqlite3.Row permet d'accéder aux colonnes par nom :
         row["name"] au lieu de row[1]
 
-    C'est comme un dictionnaire pour chaque ligne retournée.
+    À la sortie du bloc, la transaction est validée (ou annulée en cas
+    d'exception) et la connexion retourne dans le pool au lieu d'être fermée.
     """
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return get_pool().connection()
 
 
 def init_db():
     """
-    Crée la table 'products' si elle n'existe pas.
-
-    On appelle cette fonction au démarrage de l'app.
-    IF NOT EXISTS = si la table existe déjà, ne rien faire (pas d'erreur).
-    """
-    conn = get_db()
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT,
-            price REAL NOT NULL,
-            stock INTEGER NOT NULL DEFAULT 0,
-            category TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    Met le schéma de la base à jour (voir migrate()).
+
+    On appelle cette fonction au démarrage de l'app : sur une base déjà à jour,
+    elle se contente de lire le numéro de version, quelle que soit la taille du catalogue.
+    """
+    return migrate()
+
+
+def create_schema(conn):
+    """
+    Recrée les tables, index et triggers manquants (IF NOT EXISTS), sans recalcul des données.
+    Sert au chargement en masse de seed_products.py, qui supprime puis rétablit index et triggers.
+    """
+    for _version, _name, schema, _backfill in MIGRATIONS:
+        for statement in schema:
+            conn.execute(statement)
+
+
+# Index qui servent la pagination / les filtres de list_products().
+# Chaque tri se termine par "id" : c'est la clé de départage du curseur (keyset).
+# Syntaxe commune SQLite / PostgreSQL (réutilisée par database_pg.py).
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_products_category_id ON products (category, id)",
+    "CREATE INDEX IF NOT EXISTS idx_products_price_id ON products (price, id)",
+    "CREATE INDEX IF NOT EXISTS idx_products_name_id ON products (name, id)",
+    "CREATE INDEX IF NOT EXISTS idx_products_stock_id ON products (stock, id)",
+    # Prix min / max d'une catégorie (GET /products/stats) : une descente d'index
+    "CREATE INDEX IF NOT EXISTS idx_products_category_price ON products (category, price)",
+)
+
+
+# Version du catalogue : un compteur incrémenté par trigger à CHAQUE écriture
+# sur products (quel que soit le worker ou le processus qui écrit).
+# Sert à calculer l'ETag de GET /products sans relire la liste.
+CATALOGUE_STATE_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS catalogue_state (
+           id INTEGER PRIMARY KEY CHECK (id = 1),
+           version INTEGER NOT NULL,
+           updated_at TIMESTAMP NOT NULL
+       )""",
+    "INSERT OR IGNORE INTO catalogue_state (id, version, updated_at) VALUES (1, 0, CURRENT_TIMESTAMP)",
+) + tuple(
+    f"""CREATE TRIGGER IF NOT EXISTS trg_products_version_{event.lower()}
+        AFTER {event} ON products
+        BEGIN
+            UPDATE catalogue_state SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+        END"""
+    for event in ("INSERT", "UPDATE", "DELETE")
+)
+
+
+# Statistiques du catalogue (GET /products/stats) : une ligne par catégorie,
+# tenue à jour par triggers à chaque INSERT / UPDATE / DELETE sur products.
+# Lire les statistiques coûte donc O(catégories), jamais un parcours de la table.
+# - les produits sans catégorie (NULL) sont comptés sous la clé '' (avec les '')
+# - la valeur du stock est gardée en centimes entiers : des additions /
+#   soustractions de flottants répétées finiraient par dériver
+# - prix min / max ne se maintiennent pas par différence (que devient le min
+#   quand on supprime le produit le moins cher ?) : ils sont lus via l'index (category, price)
+_STATS_KEY = "coalesce({row}.category, '')"
+_STATS_CENTS = "CAST(ROUND({row}.price * {row}.stock * 100) AS INTEGER)"
+
+
+def _stats_add(row: str) -> str:
+    """SQL (SQLite) qui ajoute la ligne new/old aux statistiques de sa catégorie."""
+    key, cents = _STATS_KEY.format(row=row), _STATS_CENTS.format(row=row)
+    return f"""
+            INSERT INTO category_stats (category, product_count, in_stock_count, total_stock, inventory_cents)
+            VALUES ({key}, 1, {row}.stock > 0, {row}.stock, {cents})
+            ON CONFLICT (category) DO UPDATE SET
+                product_count = product_count + 1,
+                in_stock_count = in_stock_count + excluded.in_stock_count,
+                total_stock = total_stock + excluded.total_stock,
+                inventory_cents = inventory_cents + excluded.inventory_cents;"""
+
+
+def _stats_remove(row: str) -> str:
+    """SQL (SQLite) qui retire la ligne new/old des statistiques (et la catégorie si elle est vide)."""
+    key, cents = _STATS_KEY.format(row=row), _STATS_CENTS.format(row=row)
+    return f"""
+            UPDATE category_stats SET
+                product_count = product_count - 1,
+                in_stock_count = in_stock_count - ({row}.stock > 0),
+                total_stock = total_stock - {row}.stock,
+                inventory_cents = inventory_cents - {cents}
+            WHERE category = {key};
+            DELETE FROM category_stats WHERE category = {key} AND product_count = 0;"""
+
+
+CATEGORY_STATS_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS category_stats (
+           category TEXT PRIMARY KEY,
+           product_count INTEGER NOT NULL,
+           in_stock_count INTEGER NOT NULL,
+           total_stock INTEGER NOT NULL,
+           inventory_cents INTEGER NOT NULL
+       )""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_products_stats_insert
+        AFTER INSERT ON products
+        BEGIN{_stats_add("new")}
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_products_stats_delete
+        AFTER DELETE ON products
+        BEGIN{_stats_remove("old")}
+        END""",
+    # UPDATE OF : renommer un produit ne touche pas aux statistiques
+    f"""CREATE TRIGGER IF NOT EXISTS trg_products_stats_update
+        AFTER UPDATE OF category, price, stock ON products
+        BEGIN{_stats_remove("old")}{_stats_add("new")}
+        END""",
+)
+
+# Recalcul complet (création de la table sur une base existante, chargement en masse).
+# Syntaxe commune SQLite / PostgreSQL.
+CATEGORY_STATS_REBUILD = (
+    "DELETE FROM category_stats",
+    """INSERT INTO category_stats (category, product_count, in_stock_count, total_stock, inventory_cents)
+       SELECT coalesce(category, ''), COUNT(*),
+              SUM(CASE WHEN stock > 0 THEN 1 ELSE 0 END), SUM(stock),
+              SUM(CAST(ROUND(price * stock * 100) AS BIGINT))
+       FROM products
+       GROUP BY coalesce(category, '')""",
+)
+
+CATEGORY_STATS_QUERY = (
+    "SELECT category, product_count, in_stock_count, total_stock, inventory_cents "
+    "FROM category_stats ORDER BY category"
+)
+
+
+# Recherche plein texte (GET /products/search) : table virtuelle FTS5 "external content".
+# Elle ne stocke que l'index inversé ; le texte reste dans products (content=...).
+# - remove_diacritics : "ecran" trouve "Écran"
+# - prefix='2 3' : index des préfixes de 2 et 3 lettres, pour que "cla*" reste rapide
+# Les triggers la tiennent à jour à chaque écriture, quel que soit le chemin (API, bulk, seed).
+SEARCH_SCHEMA = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+           name, description, category,
+           content='products', content_rowid='id',
+           tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+       )""",
+    """CREATE TRIGGER IF NOT EXISTS trg_products_fts_insert
+        AFTER INSERT ON products
+        BEGIN
+            INSERT INTO products_fts (rowid, name, description, category)
+            VALUES (new.id, new.name, new.description, new.category);
+        END""",
+    # Une table external content se met à jour avec la commande spéciale 'delete'
+    # (en redonnant les anciennes valeurs), jamais avec DELETE / UPDATE.
+    """CREATE TRIGGER IF NOT EXISTS trg_products_fts_delete
+        AFTER DELETE ON products
+        BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, description, category)
+            VALUES ('delete', old.id, old.name, old.description, old.category);
+        END""",
+    # UPDATE OF : un changement de prix ou de stock ne touche pas l'index
+    """CREATE TRIGGER IF NOT EXISTS trg_products_fts_update
+        AFTER UPDATE OF name, description, category ON products
+        BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, description, category)
+            VALUES ('delete', old.id, old.name, old.description, old.category);
+            INSERT INTO products_fts (rowid, name, description, category)
+            VALUES (new.id, new.name, new.description, new.category);
+        END""",
+)
+
+
+# Flux de changements (GET /products/changes) : chaque écriture sur products
+# reçoit un numéro de séquence croissant (seq). Un client qui synchronise une
+# copie du catalogue garde le dernier seq vu et ne redemande que ce qui a changé.
+# - une seule ligne par produit, celle de son dernier changement : REPLACE
+#   supprime l'ancienne, la table ne grossit pas à chaque modification
+# - AUTOINCREMENT : un seq n'est jamais réutilisé, même après suppression de lignes
+# - une suppression laisse une "tombstone" (op = 'delete'), purgée après
+#   CHANGES_RETENTION_DAYS ; change_feed_state.purged_seq retient le plus grand
+#   seq purgé : un curseur plus ancien a pu manquer des suppressions (410)
+# Les triggers couvrent tous les chemins d'écriture (CRUD, bulk, stock, PATCH).
+CHANGES_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS product_changes (
+           seq INTEGER PRIMARY KEY AUTOINCREMENT,
+           product_id INTEGER NOT NULL UNIQUE,
+           op TEXT NOT NULL,
+           changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+       )""",
+    # Sert la purge des tombstones (seulement les lignes op = 'delete')
+    """CREATE INDEX IF NOT EXISTS idx_product_changes_tombstones
+       ON product_changes (changed_at) WHERE op = 'delete'""",
+    """CREATE TABLE IF NOT EXISTS change_feed_state (
+           id INTEGER PRIMARY KEY CHECK (id = 1),
+           purged_seq INTEGER NOT NULL
+       )""",
+    "INSERT OR IGNORE INTO change_feed_state (id, purged_seq) VALUES (1, 0)",
+) + tuple(
+    f"""CREATE TRIGGER IF NOT EXISTS trg_products_changes_{event.lower()}
+        AFTER {event} ON products
+        BEGIN
+            INSERT OR REPLACE INTO product_changes (product_id, op) VALUES ({row}.id, '{op}');
+        END"""
+    for event, row, op in (("INSERT", "new", "upsert"), ("UPDATE", "new", "upsert"), ("DELETE", "old", "delete"))
+)
+
+# Produits sans entrée dans le flux (base existante, chargement en masse sans triggers)
+CHANGES_BACKFILL = (
+    """INSERT INTO product_changes (product_id, op)
+       SELECT id, 'upsert' FROM products
+       WHERE NOT EXISTS (SELECT 1 FROM product_changes c WHERE c.product_id = products.id)
+       ORDER BY id""",
+)
+
+CHANGES_QUERY = (
+    "SELECT c.seq AS change_seq, c.op AS change_op, c.product_id AS change_product_id, p.* "
+    "FROM product_changes c LEFT JOIN products p ON p.id = c.product_id "
+    "WHERE c.seq > ? ORDER BY c.seq LIMIT ?"
+)
+
+LATEST_CHANGE_SQL = "SELECT coalesce(max(seq), 0) FROM product_changes"
+
+# Durée de conservation des tombstones : un client absent plus longtemps doit tout resynchroniser
+CHANGES_RETENTION_DAYS = float(os.environ.get("CHANGES_RETENTION_DAYS", "7"))
+
+# --- Migrations du schéma ---
+# Le schéma évolue par migrations numérotées, appliquées une seule fois et dans
+# l'ordre. La table schema_migrations garde la trace de celles déjà passées :
+# au démarrage, une base à jour ne coûte qu'une lecture de max(version).
+#
+# Chaque migration : (version, nom, instructions du schéma, recalcul des données).
+# - le schéma est en IF NOT EXISTS : une base créée avant le suivi des versions
+#   (tables déjà là) passe ses migrations sans erreur
+# - le recalcul remplit les tables dérivées à partir des produits existants
+# Une migration déjà publiée ne se modifie plus : on en ajoute une nouvelle.
+PRODUCTS_TABLE = """CREATE TABLE IF NOT EXISTS products (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           name TEXT NOT NULL,
+           description TEXT,
+           price REAL NOT NULL,
+           stock INTEGER NOT NULL DEFAULT 0,
+           category TEXT,
+           created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+           updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+       )"""
+
+SEARCH_REBUILD = "INSERT INTO products_fts (products_fts) VALUES ('rebuild')"
+
+MIGRATIONS = (
+    (1, "products", (PRODUCTS_TABLE,), ()),
+    (2, "list_indexes", INDEXES, ()),
+    (3, "catalogue_state", CATALOGUE_STATE_SCHEMA, ()),
+    (4, "category_stats", CATEGORY_STATS_SCHEMA, CATEGORY_STATS_REBUILD),
+    (5, "search_fts", SEARCH_SCHEMA, (SEARCH_REBUILD,)),
+    (6, "product_changes", CHANGES_SCHEMA, CHANGES_BACKFILL),
+    # Propres aux triggers PostgreSQL (voir database_pg.CATALOGUE_VERSION_PER_ROW) :
+    # SQLite incrémente déjà la version ligne par ligne et sérialise toutes les
+    # écritures. Gardées pour que les numéros restent alignés.
+    (7, "catalogue_lock_first", (), ()),
+    (8, "changes_trigger_unlocked", (), ()),
+    (9, "catalogue_version_per_row", (), ()),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+SCHEMA_MIGRATIONS_TABLE = """CREATE TABLE IF NOT EXISTS schema_migrations (
+           version INTEGER PRIMARY KEY,
+           name TEXT NOT NULL,
+           applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+       )"""
+
+# Attente max (secondes) du verrou d'écriture pendant qu'un autre worker migre.
+# Plus long que DB_POOL_TIMEOUT : reconstruire un index sur un gros catalogue prend du temps.
+DB_MIGRATION_TIMEOUT = float(os.environ.get("DB_MIGRATION_TIMEOUT", "300"))
+
+
+def schema_version(conn) -> int:
+    """Dernière migration appliquée (0 pour une base neuve ou antérieure au suivi des versions)."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'"
+    ).fetchone()
+    if not exists:
+        return 0
+    return conn.execute("SELECT coalesce(max(version), 0) FROM schema_migrations").fetchone()[0]
+
+
+def migrate() -> list:
+    """
+    Applique les migrations manquantes et retourne leurs numéros ([] si la base est à jour).
+
+    Plusieurs workers démarrent en même temps : BEGIN IMMEDIATE prend le verrou
+    d'écriture de la base AVANT de relire la version. Le premier worker migre,
+    les autres attendent le verrou, relisent la version et n'ont plus rien à faire.
+    Tout se passe dans une transaction : une migration qui échoue ne laisse rien à moitié.
+    """
+    # Connexion dédiée en autocommit (isolation_level=None) : c'est nous qui ouvrons la transaction
+    conn = sqlite3.connect(DATABASE_PATH, timeout=DB_MIGRATION_TIMEOUT, isolation_level=None)
+    try:
+        if schema_version(conn) >= SCHEMA_VERSION:
+            return []
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(SCHEMA_MIGRATIONS_TABLE)
+            current = schema_version(conn)
+            applied = []
+            for version, name, schema, backfill in MIGRATIONS:
+                if version <= current:
+                    continue
+                for statement in schema + backfill:
+                    conn.execute(statement)
+                conn.execute("INSERT INTO schema_migrations (version, name) VALUES (?, ?)", (version, name))
+                applied.append(version)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return applied
+    finally:
+        conn.close()
+
+
+# Poids BM25 des colonnes (name, description, category) : un mot du nom compte plus
+SEARCH_WEIGHTS = (10.0, 1.0, 5.0)
+# Au-delà, les mots de la recherche sont ignorés (chaque mot coûte un parcours d'index)
+SEARCH_MAX_TERMS = 8
+
+
+# --- Pagination par curseur (keyset) ---
+# Au lieu de OFFSET (qui relit et jette toutes les lignes précédentes),
+# on retient la dernière ligne renvoyée et on repart "après" elle :
+#     WHERE (price, id) > (dernier_prix, dernier_id) ORDER BY price, id LIMIT n
+# Le coût d'une page ne dépend donc pas de sa position dans le catalogue.
+
+# Tris autorisés : "price" = croissant, "-price" = décroissant.
+# Seules des colonnes NOT NULL (comparaison de tuples sans piège sur NULL).
+SORT_COLUMNS = ("id", "price", "name", "stock")
+SORT_OPTIONS = tuple(SORT_COLUMNS) + tuple(f"-{col}" for col in SORT_COLUMNS)
+
+
+class StockConflictError(Exception):
+    """
+    Ajustement de stock refusé (rien n'a été écrit) :
+    - not_found : ids introuvables
+    - insufficient : [{"id", "delta", "available"}] lignes dont le stock ne suffit pas
+    - overflow : [{"id", "delta", "available"}] lignes qui dépasseraient SQL_INT_MAX
+    """
+
+    def __init__(self, not_found: list, insufficient: list, overflow: list = ()):
+        super().__init__("Ajustement de stock impossible")
+        self.not_found = not_found
+        self.insufficient = insufficient
+        self.overflow = list(overflow)
+
+
+class InvalidCursorError(ValueError):
+    """Curseur de pagination illisible ou émis pour un autre tri."""
+
+
+def encode_cursor(sort: str, row: dict) -> str:
+    """Curseur opaque (base64 URL-safe) à partir de la dernière ligne d'une page."""
+    column = sort.lstrip("-")
+    payload = [sort, row["id"]] if column == "id" else [sort, row[column], row["id"]]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> list:
+    """Retourne les valeurs de départ [valeur_tri, id] (ou [id]) contenues dans le curseur."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        cursor_sort, *values = payload
+    except (ValueError, TypeError):
+        raise InvalidCursorError("Curseur invalide")
+    expected = 1 if sort.lstrip("-") == "id" else 2
+    if cursor_sort != sort or len(values) != expected:
+        raise InvalidCursorError("Curseur émis pour un autre tri")
+    return values
+
+
+def list_filters(category: str = None, min_price: float = None, max_price: float = None,
+                 in_stock: bool = None):
+    """Conditions WHERE des filtres de liste : (conditions, params), à joindre par AND."""
+    where, params = [], []
+    if category is not None:
+        where.append("category = ?")
+        params.append(category)
+    if min_price is not None:
+        where.append("price >= ?")
+        params.append(min_price)
+    if max_price is not None:
+        where.append("price <= ?")
+        params.append(max_price)
+    if in_stock is True:
+        where.append("stock > 0")
+    elif in_stock is False:
+        where.append("stock <= 0")
+    return where, params
+
+
+def build_list_query(
+    limit: int,
+    cursor: str = None,
+    category: str = None,
+    min_price: float = None,
+    max_price: float = None,
+    in_stock: bool = None,
+    sort: str = "id",
+):
+    """
+    Construit la requête paginée de list_products() : (sql, params) avec des "?".
+
+    Les noms de colonnes viennent de SORT_COLUMNS (liste blanche), jamais
+    de l'entrée utilisateur : les valeurs passent toutes par des placeholders.
+    On demande limit + 1 lignes pour savoir s'il existe une page suivante.
+    """
+    if sort not in SORT_OPTIONS:
+        raise ValueError(f"Tri inconnu : {sort}")
+    column = sort.lstrip("-")
+    descending = sort.startswith("-")
+
+    where, params = list_filters(category, min_price, max_price, in_stock)
+    if cursor:
+        values = decode_cursor(cursor, sort)
+        op = "<" if descending else ">"
+        if column == "id":
+            where.append(f"id {op} ?")
+        else:
+            where.append(f"({column}, id) {op} (?, ?)")
+        params.extend(values)
+
+    direction = "DESC" if descending else "ASC"
+    order = f"id {direction}" if column == "id" else f"{column} {direction}, id {direction}"
+    sql = "SELECT * FROM products"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {order} LIMIT ?"
+    params.append(limit + 1)
+    return sql, params
+
+
+def paginate(rows: list, limit: int, sort: str):
+    """Coupe la ligne "en trop" et calcule le curseur de la page suivante (ou None)."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(sort, rows[-1])
+
+
+# --- Statistiques du catalogue ---
+
+
+def price_range_query(category: str):
+    """
+    (sql, params) du prix min / max d'une catégorie de category_stats.
+
+    Deux sous-requêtes séparées : chacune est une simple descente de l'index
+    (category, price), alors que MIN() et MAX() dans le même SELECT
+    parcourraient toute la catégorie.
+    """
+    if category:
+        condition, params = "category = ?", [category, category]
+    else:
+        condition, params = "(category IS NULL OR category = '')", []
+    sql = (
+        f"SELECT (SELECT MIN(price) FROM products WHERE {condition}) AS min_price, "
+        f"(SELECT MAX(price) FROM products WHERE {condition}) AS max_price"
+    )
+    return sql, params
+
+
+def summarize_stats(categories: list) -> dict:
+    """
+    Réponse de GET /products/stats à partir des lignes de category_stats
+    (complétées par min_price / max_price) : totaux du catalogue + détail par catégorie.
+    """
+    details = []
+    for row in categories:
+        details.append({
+            "category": row["category"] or None,
+            "product_count": row["product_count"],
+            "in_stock_count": row["in_stock_count"],
+            "total_stock": row["total_stock"],
+            "inventory_value": row["inventory_cents"] / 100,
+            "min_price": row["min_price"],
+            "max_price": row["max_price"],
+        })
+    min_prices = [d["min_price"] for d in details if d["min_price"] is not None]
+    max_prices = [d["max_price"] for d in details if d["max_price"] is not None]
+    return {
+        "product_count": sum(d["product_count"] for d in details),
+        "in_stock_count": sum(d["in_stock_count"] for d in details),
+        "total_stock": sum(d["total_stock"] for d in details),
+        "inventory_value": sum(row["inventory_cents"] for row in categories) / 100,
+        "min_price": min(min_prices, default=None),
+        "max_price": max(max_prices, default=None),
+        "categories": details,
+    }
+
+
+# --- Classements et agrégats filtrés (GET /products/top, GET /products/analytics) ---
+# Mêmes filtres que GET /products, mais sur tout l'ensemble filtré : aucun index
+# ne peut servir un tri par prix * stock ou une médiane, la base parcourt donc
+# toutes les lignes retenues. Quand NumPy est installé, repository.py sert ces
+# requêtes depuis l'instantané colonnaire de snapshot.py ; ces fonctions SQL
+# restent la référence (et le repli sans NumPy).
+
+# Classements autorisés : "inventory_value" = prix * stock (valeur du stock d'un produit)
+TOP_EXPRESSIONS = {"price": "price", "stock": "stock", "inventory_value": "price * stock"}
+TOP_OPTIONS = tuple(TOP_EXPRESSIONS) + tuple(f"-{key}" for key in TOP_EXPRESSIONS)
+
+
+def build_top_query(sort: str, n: int, category: str = None, min_price: float = None,
+                    max_price: float = None, in_stock: bool = None):
+    """(sql, params) des n premiers produits filtrés selon 'sort' (égalités départagées par id)."""
+    if sort not in TOP_OPTIONS:
+        raise ValueError(f"Classement inconnu : {sort}")
+    expression = TOP_EXPRESSIONS[sort.lstrip("-")]
+    direction = "DESC" if sort.startswith("-") else "ASC"
+    where, params = list_filters(category, min_price, max_price, in_stock)
+    sql = "SELECT * FROM products"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {expression} {direction}, id {direction} LIMIT ?"
+    return sql, params + [n]
+
+
+def build_analytics_queries(category: str = None, min_price: float = None,
+                            max_price: float = None, in_stock: bool = None):
+    """
+    ((sql_par_catégorie, params), (sql_médiane, params)) pour les produits filtrés.
+    Les colonnes par catégorie sont celles de category_stats (+ min / max / somme des prix),
+    ce qui permet de réutiliser summarize_stats. Le paramètre de la médiane (OFFSET) est ajouté par l'appelant.
+    """
+    where, params = list_filters(category, min_price, max_price, in_stock)
+    condition = " WHERE " + " AND ".join(where) if where else ""
+    per_category = f"""
+        SELECT coalesce(category, '') AS category, COUNT(*) AS product_count,
+               SUM(CASE WHEN stock > 0 THEN 1 ELSE 0 END) AS in_stock_count,
+               SUM(stock) AS total_stock,
+               CAST(SUM(CAST(ROUND(price * stock * 100) AS BIGINT)) AS BIGINT) AS inventory_cents,
+               MIN(price) AS min_price, MAX(price) AS max_price, SUM(price) AS price_sum
+        FROM products{condition}
+        GROUP BY coalesce(category, '')"""
+    # Médiane "basse" (élément (n - 1) // 2 une fois triés) : la même définition côté NumPy
+    median = f"SELECT price FROM products{condition} ORDER BY price LIMIT 1 OFFSET ?"
+    return (per_category, params), (median, list(params))
+
+
+def median_offset(categories: list) -> int:
+    """Position de la médiane basse parmi les produits comptés dans 'categories'."""
+    return (sum(row["product_count"] for row in categories) - 1) // 2
+
+
+def _average(total: float, count: int):
+    return round(total / count, 2) if count else None
+
+
+def summarize_analytics(categories: list, median_price) -> dict:
+    """
+    Réponse de GET /products/analytics : celle de GET /products/stats restreinte
+    aux produits filtrés, plus prix moyen (global et par catégorie) et prix médian.
+    """
+    categories = sorted(categories, key=lambda row: row["category"])
+    summary = summarize_stats(categories)
+    for detail, row in zip(summary["categories"], categories):
+        detail["avg_price"] = _average(row["price_sum"], row["product_count"])
+    summary["avg_price"] = _average(sum(row["price_sum"] for row in categories), summary["product_count"])
+    summary["median_price"] = median_price
+    return summary
+
+
+# --- Recherche plein texte ---
+
+
+class InvalidSearchError(ValueError):
+    """Recherche sans aucun mot exploitable (ex: q="!!!")."""
+
+
+def search_terms(q: str) -> list:
+    """
+    Découpe la recherche en mots (minuscules, SEARCH_MAX_TERMS au plus).
+
+    On ne garde que des caractères "mot" : la saisie utilisateur n'est jamais
+    interprétée comme de la syntaxe FTS5 / tsquery (AND, OR, NEAR, guillemets...).
+    """
+    terms = re.findall(r"\w+", q.lower())[:SEARCH_MAX_TERMS]
+    if not terms:
+        raise InvalidSearchError("La recherche doit contenir au moins un mot")
+    return terms
+
+
+def build_search_query(q: str, limit: int, cursor: str = None):
+    """
+    Requête FTS5 paginée de search_products() : (sql, params).
+
+    Chaque mot devient un préfixe ("clav" trouve "clavier") et tous doivent
+    être présents. Tri par pertinence BM25 (plus petit = plus pertinent),
+    puis par id ; la pagination est un curseur keyset sur (score, id).
+    """
+    match = " ".join(f'"{term}"*' for term in search_terms(q))
+    weights = ", ".join(str(w) for w in SEARCH_WEIGHTS)
+    params = [match]
+    sql = f"""
+        SELECT * FROM (
+            SELECT p.*, bm25(products_fts, {weights}) AS score
+            FROM products_fts JOIN products p ON p.id = products_fts.rowid
+            WHERE products_fts MATCH ?
+        )"""
+    if cursor:
+        sql += " WHERE (score, id) > (?, ?)"
+        params.extend(decode_cursor(cursor, "score"))
+    sql += " ORDER BY score, id LIMIT ?"
+    params.append(limit + 1)
+    return sql, params
+
+
+def paginate_search(rows: list, limit: int):
+    """Comme paginate(), puis retire la colonne technique "score" des produits renvoyés."""
+    rows, next_cursor = paginate(rows, limit, "score")
+    for row in rows:
+        row.pop("score", None)
+    return rows, next_cursor
+
+
+# --- Flux de changements ---
+
+
+class ChangeFeedExpiredError(Exception):
+    """Curseur antérieur à des tombstones purgées : le client doit repartir de since=0."""
+
+
+def check_change_cursor(since: int, purged_seq: int):
+    """since=0 (synchronisation complète) est toujours valable ; sinon il doit suivre la dernière purge."""
+    if 0 < since < purged_seq:
+        raise ChangeFeedExpiredError(
+            f"Curseur {since} trop ancien (suppressions purgées jusqu'à {purged_seq}) : resynchronisez depuis since=0"
         )
-    """)
-    conn.commit()
-    conn.close()
+
+
+def paginate_changes(rows: list, since: int, limit: int) -> dict:
+    """
+    Page du flux : {"changes": [...], "next_since": ..., "has_more": ...}.
+
+    Chaque changement : {"seq", "op": "upsert" | "delete", "id", "product"}
+    ("product" = état actuel du produit, None pour une suppression).
+    next_since est toujours renvoyé : c'est le curseur à garder pour le prochain appel.
+    """
+    has_more = len(rows) > limit
+    changes = []
+    for row in rows[:limit]:
+        seq, op, product_id = row.pop("change_seq"), row.pop("change_op"), row.pop("change_product_id")
+        changes.append({"seq": seq, "op": op, "id": product_id, "product": row if op == "upsert" else None})
+    return {
+        "changes": changes,
+        "next_since": changes[-1]["seq"] if changes else since,
+        "has_more": has_more,
+    }
+
+
+@instrumented("select_all")
+def get_changes(since: int, limit: int) -> dict:
+    """Changements de seq > since, dans l'ordre (voir paginate_changes)."""
+    with get_db() as conn:
+        # Une transaction de lecture : la vérification du curseur et la page voient le même état
+        conn.execute("BEGIN")
+        check_change_cursor(since, conn.execute("SELECT purged_seq FROM change_feed_state WHERE id = 1").fetchone()[0])
+        rows = [dict(row) for row in conn.execute(CHANGES_QUERY, (since, limit + 1)).fetchall()]
+    return paginate_changes(rows, since, limit)
+
+
+@instrumented("select_one")
+def latest_change_seq() -> int:
+    """Dernier seq du flux (0 s'il est vide) : une descente de la clé primaire."""
+    with get_db() as conn:
+        return conn.execute(LATEST_CHANGE_SQL).fetchone()[0]
+
+
+@instrumented("delete")
+def purge_tombstones(retention_days: float = None) -> int:
+    """Supprime les tombstones plus anciennes que la rétention ; retourne leur nombre."""
+    days = CHANGES_RETENTION_DAYS if retention_days is None else retention_days
+    with get_db() as conn:
+        purged = conn.execute(
+            "DELETE FROM product_changes WHERE op = 'delete' AND changed_at <= datetime('now', ?) RETURNING seq",
+            (f"-{days * 86400:.0f} seconds",),
+        ).fetchall()
+        if purged:
+            conn.execute(
+                "UPDATE change_feed_state SET purged_seq = max(purged_seq, ?) WHERE id = 1",
+                (max(row[0] for row in purged),),
+            )
+    return len(purged)
 
 
 # --- Fonctions CRUD ---
 # CRUD = Create, Read, Update, Delete
 # Ce sont les 4 opérations de base sur une base de données.
 
+# Colonnes renvoyées par les RETURNING SQLite. Pas "RETURNING *" : SQLite y
+# renvoie la valeur AVANT conversion dans le type de la colonne (un prix 1.0
+# revient en 1), ce qui changerait l'ETag par rapport à une relecture.
+RETURNING_COLUMNS = (
+    "RETURNING id, name, description, CAST(price AS REAL) AS price, stock, category, created_at, updated_at"
+)
+
 
+@instrumented("select_all")
 def get_all_products():
     """Récupère TOUS les produits de la table."""
-    conn = get_db()
-    # fetchall() retourne une liste de toutes les lignes
-    products = conn.execute("SELECT * FROM products").fetchall()
-    conn.close()
+    with get_db() as conn:
+        # fetchall() retourne une liste de toutes les lignes
+        products = conn.execute("SELECT * FROM products").fetchall()
     # dict(row) convertit chaque Row SQLite en dictionnaire Python
     # pour que FastAPI puisse le sérialiser en JSON
     return [dict(row) for row in products]
 
 
+@instrumented("select_all")
+def list_products(limit: int, cursor: str = None, category: str = None,
+                  min_price: float = None, max_price: float = None,
+                  in_stock: bool = None, sort: str = "id"):
+    """
+    Une page de produits filtrée et triée côté SQL.
+    Retourne (produits, curseur_suivant) — curseur_suivant vaut None sur la dernière page.
+    """
+    sql, params = build_list_query(limit, cursor, category, min_price, max_price, in_stock, sort)
+    with get_db() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return paginate([dict(row) for row in rows], limit, sort)
+
+
+@instrumented("select_all")
+def top_products(sort: str, n: int, category: str = None, min_price: float = None,
+                 max_price: float = None, in_stock: bool = None):
+    """Les n premiers produits filtrés selon 'sort' (voir TOP_OPTIONS)."""
+    sql, params = build_top_query(sort, n, category, min_price, max_price, in_stock)
+    with get_db() as conn:
+        return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+
+@instrumented("select_all")
+def get_analytics(category: str = None, min_price: float = None, max_price: float = None,
+                  in_stock: bool = None) -> dict:
+    """Agrégats des produits filtrés (voir summarize_analytics), lus dans un même instantané."""
+    (sql, params), (median_sql, median_params) = build_analytics_queries(category, min_price, max_price, in_stock)
+    median = None
+    with get_db() as conn:
+        # Une transaction de lecture : la médiane est prise parmi les lignes comptées
+        conn.execute("BEGIN")
+        categories = [dict(row) for row in conn.execute(sql, params).fetchall()]
+        if categories:
+            median = conn.execute(median_sql, median_params + [median_offset(categories)]).fetchone()[0]
+    return summarize_analytics(categories, median)
+
+
+def iter_columns(batch_size: int = 10000):
+    """
+    Parcourt (id, price, stock, category) de tout le catalogue par lots de tuples,
+    triés par id : le chargement de l'instantané colonnaire (snapshot.py).
+    Pas de sqlite3.Row ni de dict par ligne : seulement les 4 colonnes utiles.
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute("SELECT id, price, stock, category FROM products ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+
+
+def iter_products(batch_size: int = 1000):
+    """
+    Parcourt TOUT le catalogue par lots de batch_size produits (générateur).
+
+    Contrairement à get_all_products(), on ne charge jamais toute la table :
+    fetchmany() ne lit que le lot suivant. La connexion reste empruntée au pool
+    pendant tout le parcours (et la lecture voit un instantané cohérent de la base).
+    """
+    with get_db() as conn:
+        cursor = conn.execute("SELECT * FROM products ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [dict(row) for row in rows]
+
+
+@instrumented("select_all")
+def search_products(q: str, limit: int, cursor: str = None):
+    """
+    Recherche plein texte, servie par l'index FTS5 (jamais de parcours de toute la table).
+    Retourne (produits, curseur_suivant), les plus pertinents d'abord.
+    """
+    sql, params = build_search_query(q, limit, cursor)
+    with get_db() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return paginate_search([dict(row) for row in rows], limit)
+
+
+@instrumented("select_all")
+def get_catalogue_stats():
+    """Statistiques du catalogue, lues dans category_stats : O(catégories)."""
+    with get_db() as conn:
+        categories = [dict(row) for row in conn.execute(CATEGORY_STATS_QUERY).fetchall()]
+        for row in categories:
+            sql, params = price_range_query(row["category"])
+            row.update(dict(conn.execute(sql, params).fetchone()))
+    return summarize_stats(categories)
+
+
+@instrumented("select_one")
+def get_catalogue_state():
+    """Version du catalogue et date de la dernière écriture : {"version": ..., "updated_at": ...}."""
+    with get_db() as conn:
+        row = conn.execute("SELECT version, updated_at FROM catalogue_state WHERE id = 1").fetchone()
+    return dict(row)
+
+
+@instrumented("select_one")
 def get_product_by_id(product_id: int):
     """Récupère UN produit par son ID."""
-    conn = get_db()
-    # Le ? est un placeholder — JAMAIS de f-string dans une requête SQL !
-    # Sinon c'est une faille d'injection SQL.
-    product = conn.execute(
-        "SELECT * FROM products WHERE id = ?", (product_id,)
-    ).fetchone()
-    conn.close()
+    with get_db() as conn:
+        # Le ? est un placeholder — JAMAIS de f-string dans une requête SQL !
+        # Sinon c'est une faille d'injection SQL.
+        product = conn.execute(
+            "SELECT * FROM products WHERE id = ?", (product_id,)
+        ).fetchone()
     # fetchone() retourne None si aucun résultat
     return dict(product) if product else None
 
 
+@instrumented("select_all")
+def get_products_by_ids(product_ids: list) -> list:
+    """
+    Plusieurs produits par leurs IDs, en UNE requête (ordre quelconque, ids inconnus absents).
+    L'appelant borne le nombre d'ids (BATCH_GET_MAX_IDS), bien en dessous de la
+    limite de paramètres de SQLite (32766).
+    """
+    with get_db() as conn:
+        rows = conn.execute(
+            f"SELECT * FROM products WHERE id IN ({_placeholders(len(product_ids))})", product_ids
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+@instrumented("insert")
 def create_product(name: str, description: str, price: float, stock: int, category: str):
     """
     Insère un nouveau produit dans la base.
     Retourne le produit créé (avec son ID auto-généré).
     """
-    conn = get_db()
-    cursor = conn.execute(
-        """INSERT INTO products (name, description, price, stock, category)
-           VALUES (?, ?, ?, ?, ?)""",
-        (name, description, price, stock, category)
-    )
-    conn.commit()
-    # lastrowid = l'ID auto-généré par AUTOINCREMENT
-    product_id = cursor.lastrowid
-    conn.close()
-    # On retourne le produit complet en le relisant
-    return get_product_by_id(product_id)
+    with get_db() as conn:
+        # RETURNING renvoie la ligne créée (id AUTOINCREMENT, dates par défaut)
+        # dans la même instruction : pas besoin de la relire avec get_product_by_id()
+        product = conn.execute(
+            """INSERT INTO products (name, description, price, stock, category)
+               VALUES (?, ?, ?, ?, ?)
+               """ + RETURNING_COLUMNS,
+            (name, description, price, stock, category)
+        ).fetchone()
+    return dict(product)
+
 
+class PreconditionFailedError(Exception):
+    """If-Match : le produit a changé depuis la lecture du client (rien n'a été écrit)."""
 
-def update_product(product_id: int, name: str, description: str, price: float, stock: int, category: str):
+
+# Concurrence optimiste (If-Match) : l'écriture elle-même est conditionnelle.
+# Vérifier l'ETag PUIS écrire laisserait deux clients avec le même ETag passer
+# la vérification, le second écrasant le premier sans le savoir. La clause
+# "la ligne est encore celle lue" (mêmes champs, même updated_at : exactement
+# ce dont dépend l'ETag) est ajoutée au WHERE de l'UPDATE / DELETE ; 0 ligne
+# touchée alors que le produit existe = il a changé entre-temps -> 412.
+
+
+def expected_clause(expected: dict, same: str = "IS") -> tuple:
+    """
+    (" AND ...", params) qui restreint l'écriture à la version 'expected' de la ligne.
+    'same' : égalité qui vaut aussi pour NULL ("IS" en SQLite, "IS NOT DISTINCT FROM" en PostgreSQL).
+    ("", []) sans If-Match.
+    """
+    if expected is None:
+        return "", []
+    columns = PRODUCT_FIELDS + ("updated_at",)
+    sql = "".join(f" AND {column} {same} ?" for column in columns)
+    return sql, [expected[column] for column in columns]
+
+
+def _precondition_failed(conn, product_id: int):
+    """Écriture conditionnelle sans effet : 412 si le produit existe encore, sinon 404 (None)."""
+    if conn.execute("SELECT 1 FROM products WHERE id = ?", (product_id,)).fetchone():
+        raise PreconditionFailedError(f"Le produit {product_id} a été modifié")
+
+
+@instrumented("update")
+def update_product(product_id: int, name: str, description: str, price: float, stock: int, category: str,
+                   expected: dict = None):
     """
     Met à jour un produit existant.
     Retourne le produit modifié, ou None s'il n'existe pas.
+    expected (If-Match) : n'écrit que si la ligne est encore celle-ci, PreconditionFailedError sinon.
     """
-    conn = get_db()
-    # On met aussi à jour updated_at pour tracer la dernière modification
-    cursor = conn.execute(
-        """UPDATE products
-           SET name = ?, description = ?, price = ?, stock = ?, category = ?, updated_at = CURRENT_TIMESTAMP
-           WHERE id = ?""",
-        (name, description, price, stock, category, product_id)
-    )
-    conn.commit()
-    conn.close()
-    # rowcount = nombre de lignes affectées. Si 0, le produit n'existait pas.
-    if cursor.rowcount == 0:
-        return None
-    return get_product_by_id(product_id)
+    condition, condition_params = expected_clause(expected)
+    with get_db() as conn:
+        # On met aussi à jour updated_at pour tracer la dernière modification
+        product = conn.execute(
+            """UPDATE products
+               SET name = ?, description = ?, price = ?, stock = ?, category = ?, updated_at = CURRENT_TIMESTAMP
+               WHERE id = ?""" + condition + "\n" + RETURNING_COLUMNS,
+            (name, description, price, stock, category, product_id, *condition_params)
+        ).fetchone()
+        if product is None and expected is not None:
+            _precondition_failed(conn, product_id)
+    # Aucune ligne retournée = le produit n'existait pas
+    return dict(product) if product else None
+
+
+def build_patch_query(product_id: int, fields: dict, returning: str = "RETURNING *",
+                      expected: dict = None, same: str = "IS"):
+    """
+    UPDATE partiel de patch_product() : (sql, params) avec des "?".
+
+    Seules les colonnes présentes dans 'fields' sont écrites. Les noms de
+    colonnes sont vérifiés contre PRODUCT_FIELDS : jamais d'entrée utilisateur dans le SQL.
+    expected / same : condition If-Match (voir expected_clause).
+    """
+    unknown = set(fields) - set(PRODUCT_FIELDS)
+    if not fields or unknown:
+        raise ValueError(f"Champs à modifier invalides : {sorted(unknown) or 'aucun'}")
+    columns = [field for field in PRODUCT_FIELDS if field in fields]
+    assignments = ", ".join(f"{column} = ?" for column in columns)
+    condition, condition_params = expected_clause(expected, same)
+    sql = f"UPDATE products SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?{condition} {returning}"
+    return sql, [fields[column] for column in columns] + [product_id] + condition_params
+
 
+@instrumented("update")
+def patch_product(product_id: int, fields: dict, expected: dict = None):
+    """
+    Modifie seulement les champs fournis ({"price": 19.9}, ...).
+    Retourne le produit modifié (RETURNING, même instruction), ou None s'il n'existe pas.
+    expected : comme pour update_product.
+    """
+    sql, params = build_patch_query(product_id, fields, RETURNING_COLUMNS, expected)
+    with get_db() as conn:
+        product = conn.execute(sql, params).fetchone()
+        if product is None and expected is not None:
+            _precondition_failed(conn, product_id)
+    return dict(product) if product else None
 
-def delete_product(product_id: int):
+
+@instrumented("delete")
+def delete_product(product_id: int, expected: dict = None):
     """
     Supprime un produit par son ID.
     Retourne True si supprimé, False si le produit n'existait pas.
+    expected : comme pour update_product.
     """
-    conn = get_db()
-    cursor = conn.execute("DELETE FROM products WHERE id = ?", (product_id,))
-    conn.commit()
-    conn.close()
+    condition, condition_params = expected_clause(expected)
+    with get_db() as conn:
+        cursor = conn.execute("DELETE FROM products WHERE id = ?" + condition, (product_id, *condition_params))
+        if cursor.rowcount == 0 and expected is not None:
+            _precondition_failed(conn, product_id)
     return cursor.rowcount > 0
+
+
+# --- Opérations en masse (bulk) ---
+# Une seule connexion et UNE seule transaction (donc un seul commit / fsync)
+# pour tout le lot, au lieu d'une connexion + un commit par produit.
+
+# Lignes par INSERT multi-valeurs : 500 x 5 placeholders reste loin de la
+# limite de variables SQLite (32766).
+BULK_CHUNK_SIZE = 500
+
+PRODUCT_FIELDS = ("name", "description", "price", "stock", "category")
+
+
+def _chunks(items: list, size: int = BULK_CHUNK_SIZE):
+    """Découpe une liste en morceaux de 'size' éléments."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _placeholders(count: int) -> str:
+    return ", ".join("?" * count)
+
+
+@instrumented("insert")
+def create_products(products: list):
+    """
+    Insère une liste de produits (dicts avec les clés de PRODUCT_FIELDS) en une transaction.
+
+    INSERT multi-lignes + RETURNING : les lignes créées (avec leur id) reviennent
+    directement de l'INSERT, sans les relire une par une avec get_product_by_id().
+    """
+    with get_db() as conn:
+        return _insert_products(conn, products)
+
+
+def _insert_products(conn, products: list) -> list:
+    created = []
+    for chunk in _chunks(products):
+        values = ", ".join(["(?, ?, ?, ?, ?)"] * len(chunk))
+        params = [p[field] for p in chunk for field in PRODUCT_FIELDS]
+        rows = conn.execute(
+            f"INSERT INTO products ({', '.join(PRODUCT_FIELDS)}) VALUES {values} {RETURNING_COLUMNS}",
+            params,
+        ).fetchall()
+        created.extend(dict(row) for row in rows)
+    # L'ordre de RETURNING n'est pas garanti : on le remet dans l'ordre d'insertion
+    created.sort(key=lambda p: p["id"])
+    return created
+
+
+# EXISTS s'arrête à la première ligne : O(1), contrairement à COUNT(*) ou à get_all_products()
+HAS_PRODUCTS_SQL = "SELECT EXISTS (SELECT 1 FROM products)"
+
+
+@instrumented("select_one")
+def has_products() -> bool:
+    """Vrai si le catalogue contient au moins un produit."""
+    with get_db() as conn:
+        return bool(conn.execute(HAS_PRODUCTS_SQL).fetchone()[0])
+
+
+@instrumented("insert")
+def seed_if_empty(products: list) -> list:
+    """
+    Insère 'products' seulement si le catalogue est vide ; retourne les lignes créées ([] sinon).
+
+    Plusieurs workers démarrent en même temps : la vérification est refaite
+    sous le verrou d'écriture (BEGIN IMMEDIATE), un seul d'entre eux insère.
+    """
+    with get_db() as conn:
+        if conn.execute(HAS_PRODUCTS_SQL).fetchone()[0]:
+            return []
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute(HAS_PRODUCTS_SQL).fetchone()[0]:
+            return []
+        return _insert_products(conn, products)
+
+
+@instrumented("update")
+def update_products(products: list):
+    """
+    Met à jour une liste de produits (dicts avec "id" + PRODUCT_FIELDS) en une transaction.
+
+    executemany() réutilise la même requête préparée pour chaque ligne.
+    Retourne (produits_modifiés, ids_introuvables).
+    """
+    ids = [p["id"] for p in products]
+    with get_db() as conn:
+        conn.executemany(
+            """UPDATE products
+               SET name = ?, description = ?, price = ?, stock = ?, category = ?, updated_at = CURRENT_TIMESTAMP
+               WHERE id = ?""",
+            [tuple(p[field] for field in PRODUCT_FIELDS) + (p["id"],) for p in products],
+        )
+        updated = []
+        for chunk in _chunks(ids):
+            rows = conn.execute(
+                f"SELECT * FROM products WHERE id IN ({_placeholders(len(chunk))})", chunk
+            ).fetchall()
+            updated.extend(dict(row) for row in rows)
+    found = {p["id"] for p in updated}
+    updated.sort(key=lambda p: p["id"])
+    return updated, [i for i in dict.fromkeys(ids) if i not in found]
+
+
+@instrumented("delete")
+def delete_products(product_ids: list):
+    """
+    Supprime une liste d'ids en une transaction.
+    Retourne (ids_supprimés, ids_introuvables).
+    """
+    deleted = set()
+    with get_db() as conn:
+        for chunk in _chunks(product_ids):
+            rows = conn.execute(
+                f"DELETE FROM products WHERE id IN ({_placeholders(len(chunk))}) RETURNING id", chunk
+            ).fetchall()
+            deleted.update(row[0] for row in rows)
+    unique_ids = list(dict.fromkeys(product_ids))
+    return sorted(deleted), [i for i in unique_ids if i not in deleted]
+
+
+# --- Ajustements de stock atomiques ---
+# Pas de lecture-modification-écriture côté Python : la base vérifie et modifie
+# le stock dans la MÊME instruction. Deux commandes simultanées sur le dernier
+# article ne peuvent donc pas le vendre deux fois.
+# Plus grand stock possible : la colonne est un INTEGER 32 bits en PostgreSQL.
+# Le garde-fou est dans le WHERE (jamais "stock + delta" calculé hors bornes,
+# ce qui ferait échouer l'UPDATE PostgreSQL) et vaut aussi pour SQLite.
+SQL_INT_MAX = 2**31 - 1
+
+ADJUST_STOCK_SQL = """
+    UPDATE products SET stock = stock + ?, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ? AND stock >= ? AND stock <= ?
+    RETURNING id, stock
+"""
+
+
+def adjust_stock_params(item: dict) -> tuple:
+    """Paramètres de ADJUST_STOCK_SQL : ni sous zéro, ni au-delà de SQL_INT_MAX (|delta| <= SQL_INT_MAX)."""
+    delta = item["delta"]
+    return delta, item["id"], -delta, SQL_INT_MAX - max(delta, 0)
+
+
+def stock_conflict(failed: list, current: dict) -> StockConflictError:
+    """Construit l'erreur à partir des lignes refusées et des stocks actuels {id: stock}."""
+    not_found = [item["id"] for item in failed if item["id"] not in current]
+    refused = [
+        {"id": item["id"], "delta": item["delta"], "available": current[item["id"]]}
+        for item in failed if item["id"] in current
+    ]
+    insufficient = [row for row in refused if row["available"] + row["delta"] < 0]
+    overflow = [row for row in refused if row["available"] + row["delta"] > SQL_INT_MAX]
+    return StockConflictError(list(dict.fromkeys(not_found)), insufficient, overflow)
+
+
+@instrumented("update")
+def adjust_stocks(items: list):
+    """
+    Applique des variations de stock [{"id", "delta"}] (delta < 0 = sortie) en une transaction.
+
+    Une instruction par ligne : UPDATE ... SET stock = stock + delta WHERE stock >= -delta
+    (et stock <= SQL_INT_MAX - delta). Si une seule ligne échoue (produit absent,
+    stock insuffisant ou trop grand), toute la
+    transaction est annulée et StockConflictError décrit les lignes refusées.
+    Retourne [{"id", "stock"}] : le nouveau stock de chaque ligne, dans l'ordre reçu.
+    """
+    with get_db() as conn:
+        updated, failed = [], []
+        for item in items:
+            row = conn.execute(ADJUST_STOCK_SQL, adjust_stock_params(item)).fetchone()
+            if row:
+                updated.append(dict(row))
+            else:
+                failed.append(item)
+        if failed:
+            ids = list({item["id"] for item in failed})
+            rows = conn.execute(
+                f"SELECT id, stock FROM products WHERE id IN ({_placeholders(len(ids))})", ids
+            ).fetchall()
+            # L'exception fait annuler la transaction par get_db()
+            raise stock_conflict(failed, {row["id"]: row["stock"] for row in rows})
+    return updated
@@ -0,0 +1,733 @@
+"""
+database_pg.py — Couche d'accès aux données (PostgreSQL)
+
+Même surface que database.py (init_db, get_all_products, get_product_by_id,
+create_product, update_product, delete_product), mais en async avec asyncpg :
+les fonctions sont des coroutines à appeler avec "await".
+
+Ce backend est sélectionné par repository.py quand DB_HOST est défini
+(docker-compose, Render). Plusieurs conteneurs product-api peuvent alors
+partager la même base, ce qui est impossible avec un fichier SQLite.
+"""
+
+import asyncio
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+import metrics
+from database import (
+    ADJUST_STOCK_SQL,
+    CATEGORY_STATS_QUERY,
+    CATEGORY_STATS_REBUILD,
+    CHANGES_BACKFILL,
+    CHANGES_QUERY,
+    CHANGES_RETENTION_DAYS,
+    INDEXES,
+    HAS_PRODUCTS_SQL,
+    LATEST_CHANGE_SQL,
+    PRODUCT_FIELDS,
+    PoolTimeoutError,
+    PreconditionFailedError,
+    adjust_stock_params,
+    build_analytics_queries,
+    build_list_query,
+    build_top_query,
+    build_patch_query,
+    check_change_cursor,
+    decode_cursor,
+    expected_clause,
+    instrumented,
+    median_offset,
+    paginate,
+    paginate_changes,
+    paginate_search,
+    price_range_query,
+    record_pool_wait,
+    search_terms,
+    stock_conflict,
+    summarize_analytics,
+    summarize_stats,
+)
+
+# --- Configuration (mêmes variables que docker-compose.yml / render.yaml) ---
+DB_HOST = os.environ.get("DB_HOST", "localhost")
+DB_PORT = int(os.environ.get("DB_PORT", "5432"))
+DB_NAME = os.environ.get("DB_NAME", "devopscorp_products")
+DB_USER = os.environ.get("DB_USER", "postgres")
+DB_PASSWORD = os.environ.get("DB_PASSWORD", "")
+
+# Taille du pool asyncpg (par worker) et attente max d'une connexion libre
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "5"))
+
+_pool = None
+
+
+async def init_pool():
+    """Crée le pool asyncpg (une fois par worker, au démarrage de l'app)."""
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            host=DB_HOST,
+            port=DB_PORT,
+            database=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            min_size=min(DB_POOL_MIN_SIZE, DB_POOL_SIZE),
+            max_size=DB_POOL_SIZE,
+        )
+    return _pool
+
+
+async def close_pool():
+    """Ferme le pool (arrêt de l'app)."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+@asynccontextmanager
+async def _acquire():
+    """
+    Emprunte une connexion au pool, à utiliser avec "async with".
+
+    Même contrat que le pool SQLite : au-delà de DB_POOL_TIMEOUT on lève
+    PoolTimeoutError, que app.py transforme en 503.
+    """
+    pool = await init_pool()
+    started = time.perf_counter()
+    try:
+        conn = await pool.acquire(timeout=DB_POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        metrics.DB_POOL_TIMEOUTS.inc()
+        raise PoolTimeoutError(
+            f"Aucune connexion libre après {DB_POOL_TIMEOUT}s (pool de {DB_POOL_SIZE})"
+        )
+    record_pool_wait(time.perf_counter() - started)
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+async def init_db():
+    """Met le schéma à jour (équivalent de database.init_db, voir migrate())."""
+    return await migrate()
+
+
+# Recherche plein texte (équivalent de la table FTS5 de SQLite) : un index GIN
+# sur une EXPRESSION tsvector. PostgreSQL le tient à jour tout seul, sans trigger.
+# La requête doit reprendre exactement la même expression pour utiliser l'index.
+# Poids A/B/C : nom > catégorie > description (comme database.SEARCH_WEIGHTS).
+# Configuration 'simple' : pas de racinisation ni de suppression des accents.
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A')"
+    " || setweight(to_tsvector('simple', coalesce(category, '')), 'B')"
+    " || setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+)
+
+
+# --- Migrations du schéma (mêmes numéros et noms que database.MIGRATIONS) ---
+PRODUCTS_TABLE = """CREATE TABLE IF NOT EXISTS products (
+        id SERIAL PRIMARY KEY,
+        name TEXT NOT NULL,
+        description TEXT,
+        price DOUBLE PRECISION NOT NULL,
+        stock INTEGER NOT NULL DEFAULT 0,
+        category TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )"""
+
+# Version du catalogue (ETag de GET /products), voir database.CATALOGUE_STATE_SCHEMA.
+# Trigger "FOR EACH STATEMENT" : un seul incrément par requête, même en bulk
+# (depuis la migration 9 : un incrément par ligne modifiée, comme SQLite).
+CATALOGUE_STATE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS catalogue_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version BIGINT NOT NULL,
+        updated_at TIMESTAMP NOT NULL
+    );
+    INSERT INTO catalogue_state (id, version, updated_at)
+    VALUES (1, 0, CURRENT_TIMESTAMP)
+    ON CONFLICT (id) DO NOTHING;
+
+    CREATE OR REPLACE FUNCTION bump_catalogue_version() RETURNS trigger AS $$
+    BEGIN
+        UPDATE catalogue_state SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE TRIGGER trg_products_version
+        AFTER INSERT OR UPDATE OR DELETE ON products
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_catalogue_version();
+"""
+
+# Statistiques par catégorie (GET /products/stats), voir database.CATEGORY_STATS_SCHEMA.
+# Trigger "FOR EACH ROW" cette fois : chaque ligne ajoute / retire sa contribution.
+CATEGORY_STATS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS category_stats (
+        category TEXT PRIMARY KEY,
+        product_count BIGINT NOT NULL,
+        in_stock_count BIGINT NOT NULL,
+        total_stock BIGINT NOT NULL,
+        inventory_cents BIGINT NOT NULL
+    );
+
+    CREATE OR REPLACE FUNCTION update_category_stats() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE category_stats SET
+                product_count = product_count - 1,
+                in_stock_count = in_stock_count - (OLD.stock > 0)::int,
+                total_stock = total_stock - OLD.stock,
+                inventory_cents = inventory_cents - ROUND(OLD.price * OLD.stock * 100)::bigint
+            WHERE category = coalesce(OLD.category, '');
+            DELETE FROM category_stats
+            WHERE category = coalesce(OLD.category, '') AND product_count = 0;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO category_stats AS s
+                (category, product_count, in_stock_count, total_stock, inventory_cents)
+            VALUES (coalesce(NEW.category, ''), 1, (NEW.stock > 0)::int, NEW.stock,
+                    ROUND(NEW.price * NEW.stock * 100)::bigint)
+            ON CONFLICT (category) DO UPDATE SET
+                product_count = s.product_count + 1,
+                in_stock_count = s.in_stock_count + excluded.in_stock_count,
+                total_stock = s.total_stock + excluded.total_stock,
+                inventory_cents = s.inventory_cents + excluded.inventory_cents;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE TRIGGER trg_products_stats
+        AFTER INSERT OR DELETE OR UPDATE OF category, price, stock ON products
+        FOR EACH ROW EXECUTE FUNCTION update_category_stats();
+"""
+
+# Flux de changements (GET /products/changes), voir database.CHANGES_SCHEMA.
+# Avec PostgreSQL, plusieurs transactions écrivent en parallèle : un seq tiré
+# par l'une peut être validé APRÈS un seq plus grand tiré par l'autre, et un
+# lecteur entre les deux sauterait le plus petit. Les numéros doivent donc être
+# tirés pendant que la transaction tient la ligne de catalogue_state (verrou
+# gardé jusqu'au COMMIT) : ils sont alors tirés dans l'ordre des validations.
+# Ce trigger a évolué (migrations 7 à 9) : depuis la migration 9, c'est lui qui
+# incrémente la version, juste avant de tirer son numéro (CATALOGUE_VERSION_PER_ROW).
+CHANGES_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS product_changes (
+        seq BIGSERIAL PRIMARY KEY,
+        product_id INTEGER NOT NULL UNIQUE,
+        op TEXT NOT NULL,
+        changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_product_changes_tombstones
+        ON product_changes (changed_at) WHERE op = 'delete';
+    CREATE TABLE IF NOT EXISTS change_feed_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        purged_seq BIGINT NOT NULL
+    );
+    INSERT INTO change_feed_state (id, purged_seq) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+
+    CREATE OR REPLACE FUNCTION record_product_change() RETURNS trigger AS $$
+    DECLARE
+        changed_id INTEGER := CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END;
+    BEGIN
+        PERFORM 1 FROM catalogue_state WHERE id = 1 FOR UPDATE;
+        DELETE FROM product_changes WHERE product_id = changed_id;
+        INSERT INTO product_changes (product_id, op)
+        VALUES (changed_id, CASE WHEN TG_OP = 'DELETE' THEN 'delete' ELSE 'upsert' END);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE TRIGGER trg_products_changes
+        AFTER INSERT OR UPDATE OR DELETE ON products
+        FOR EACH ROW EXECUTE FUNCTION record_product_change();
+"""
+
+# Ordre des verrous : le trigger de version prenait la ligne de catalogue_state
+# APRÈS chaque instruction, donc après les lignes de products qu'elle venait de
+# verrouiller. Deux transactions à plusieurs instructions (commandes de stock,
+# PATCH /products/bulk) qui se recouvrent s'interbloquaient : A tient p1 et
+# catalogue_state, B tient p2 et attend catalogue_state, A attend p2.
+# En BEFORE STATEMENT, la première écriture d'une transaction verrouillait
+# catalogue_state avant toute ligne de products. Remplacé par la migration 9
+# (version incrémentée par ligne, verrous des lignes pris par id croissant).
+CATALOGUE_LOCK_FIRST = """
+    DROP TRIGGER IF EXISTS trg_products_version ON products;
+    CREATE TRIGGER trg_products_version
+        BEFORE INSERT OR UPDATE OR DELETE ON products
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_catalogue_version();
+"""
+
+# Le trigger du flux sans "PERFORM ... FOR UPDATE" répété pour chaque ligne
+# (la migration 9 y remet l'incrément de version, une fois par ligne).
+CHANGES_TRIGGER_UNLOCKED = """
+    CREATE OR REPLACE FUNCTION record_product_change() RETURNS trigger AS $$
+    DECLARE
+        changed_id INTEGER := CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END;
+    BEGIN
+        DELETE FROM product_changes WHERE product_id = changed_id;
+        INSERT INTO product_changes (product_id, op)
+        VALUES (changed_id, CASE WHEN TG_OP = 'DELETE' THEN 'delete' ELSE 'upsert' END);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+# Version du catalogue incrémentée LIGNE par ligne, dans le trigger du flux,
+# comme les triggers SQLite (le trigger BEFORE STATEMENT de la migration 7
+# l'incrémentait aussi pour une instruction sans effet, un 409 de stock par exemple).
+# - l'UPDATE de catalogue_state précède le tirage du seq : les numéros restent
+#   tirés dans l'ordre des validations
+# - les triggers AFTER ROW s'exécutent en fin d'instruction : catalogue_state
+#   est verrouillée APRÈS les lignes de products de l'instruction
+# Pour éviter l'interblocage "A tient p1 et catalogue_state, B tient p2 et
+# attend catalogue_state, A attend p2", les écritures à plusieurs lignes
+# verrouillent toutes leurs lignes d'abord, par id croissant (_lock_products) :
+# une transaction qui tient catalogue_state n'attend plus aucune ligne de products.
+CATALOGUE_VERSION_PER_ROW = """
+    DROP TRIGGER IF EXISTS trg_products_version ON products;
+    DROP FUNCTION IF EXISTS bump_catalogue_version();
+
+    CREATE OR REPLACE FUNCTION record_product_change() RETURNS trigger AS $$
+    DECLARE
+        changed_id INTEGER := CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END;
+    BEGIN
+        UPDATE catalogue_state SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+        DELETE FROM product_changes WHERE product_id = changed_id;
+        INSERT INTO product_changes (product_id, op)
+        VALUES (changed_id, CASE WHEN TG_OP = 'DELETE' THEN 'delete' ELSE 'upsert' END);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+SEARCH_INDEX = f"CREATE INDEX IF NOT EXISTS idx_products_search ON products USING GIN (({SEARCH_VECTOR}))"
+
+MIGRATIONS = (
+    (1, "products", (PRODUCTS_TABLE,), ()),
+    (2, "list_indexes", INDEXES, ()),
+    (3, "catalogue_state", (CATALOGUE_STATE_SCHEMA,), ()),
+    (4, "category_stats", (CATEGORY_STATS_SCHEMA,), CATEGORY_STATS_REBUILD),
+    (5, "search_fts", (SEARCH_INDEX,), ()),
+    (6, "product_changes", (CHANGES_SCHEMA,), CHANGES_BACKFILL),
+    (7, "catalogue_lock_first", (CATALOGUE_LOCK_FIRST,), ()),
+    (8, "changes_trigger_unlocked", (CHANGES_TRIGGER_UNLOCKED,), ()),
+    (9, "catalogue_version_per_row", (CATALOGUE_VERSION_PER_ROW,), ()),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+SCHEMA_MIGRATIONS_TABLE = """CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )"""
+
+# Clés des verrous consultatifs (pg_advisory_xact_lock) : des entiers propres à l'application
+MIGRATION_LOCK_KEY = 0x5052_4F44_0001
+SEED_LOCK_KEY = 0x5052_4F44_0002
+
+
+async def schema_version(conn) -> int:
+    """Dernière migration appliquée (0 pour une base neuve ou antérieure au suivi des versions)."""
+    if not await conn.fetchval("SELECT to_regclass('schema_migrations') IS NOT NULL"):
+        return 0
+    return await conn.fetchval("SELECT coalesce(max(version), 0) FROM schema_migrations")
+
+
+async def migrate() -> list:
+    """
+    Applique les migrations manquantes (équivalent de database.migrate).
+
+    Plusieurs workers ou réplicas démarrent en même temps : un verrou consultatif
+    de transaction sérialise les migrations ; chacun relit la version une fois le
+    verrou obtenu. Le DDL PostgreSQL est transactionnel : tout ou rien.
+    """
+    async with _acquire() as conn:
+        if await schema_version(conn) >= SCHEMA_VERSION:
+            return []
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock($1)", MIGRATION_LOCK_KEY)
+            await conn.execute(SCHEMA_MIGRATIONS_TABLE)
+            current = await schema_version(conn)
+            applied = []
+            for version, name, schema, backfill in MIGRATIONS:
+                if version <= current:
+                    continue
+                for statement in schema + backfill:
+                    await conn.execute(statement)
+                await conn.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)", version, name
+                )
+                applied.append(version)
+        return applied
+
+
+def _to_pg(sql: str) -> str:
+    """Convertit les placeholders "?" (SQLite) en $1, $2... (PostgreSQL)."""
+    counter = iter(range(1, sql.count("?") + 1))
+    return re.sub(r"\?", lambda _: f"${next(counter)}", sql)
+
+
+# --- Fonctions CRUD ---
+# Les placeholders PostgreSQL sont $1, $2... (au lieu de ? pour SQLite).
+# RETURNING * renvoie la ligne écrite : pas besoin de la relire ensuite.
+
+
+@instrumented("select_all")
+async def get_all_products():
+    """Récupère TOUS les produits de la table."""
+    async with _acquire() as conn:
+        rows = await conn.fetch("SELECT * FROM products ORDER BY id")
+    return [dict(row) for row in rows]
+
+
+@instrumented("select_all")
+async def list_products(limit: int, cursor: str = None, category: str = None,
+                        min_price: float = None, max_price: float = None,
+                        in_stock: bool = None, sort: str = "id"):
+    """Une page de produits (même requête keyset que database.list_products)."""
+    sql, params = build_list_query(limit, cursor, category, min_price, max_price, in_stock, sort)
+    async with _acquire() as conn:
+        rows = await conn.fetch(_to_pg(sql), *params)
+    return paginate([dict(row) for row in rows], limit, sort)
+
+
+@instrumented("select_all")
+async def top_products(sort: str, n: int, category: str = None, min_price: float = None,
+                       max_price: float = None, in_stock: bool = None):
+    """Les n premiers produits filtrés selon 'sort' (voir database.top_products)."""
+    sql, params = build_top_query(sort, n, category, min_price, max_price, in_stock)
+    async with _acquire() as conn:
+        return [dict(row) for row in await conn.fetch(_to_pg(sql), *params)]
+
+
+@instrumented("select_all")
+async def get_analytics(category: str = None, min_price: float = None, max_price: float = None,
+                        in_stock: bool = None) -> dict:
+    """Agrégats des produits filtrés (voir database.get_analytics), sur un instantané cohérent."""
+    (sql, params), (median_sql, median_params) = build_analytics_queries(category, min_price, max_price, in_stock)
+    median = None
+    async with _acquire() as conn:
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            categories = [dict(row) for row in await conn.fetch(_to_pg(sql), *params)]
+            if categories:
+                median = await conn.fetchval(_to_pg(median_sql), *median_params, median_offset(categories))
+    return summarize_analytics(categories, median)
+
+
+async def iter_columns(batch_size: int = 10000):
+    """(id, price, stock, category) de tout le catalogue par lots, triés par id (voir database.iter_columns)."""
+    async with _acquire() as conn:
+        async with conn.transaction(readonly=True):
+            cursor = await conn.cursor("SELECT id, price, stock, category FROM products ORDER BY id")
+            while True:
+                rows = await cursor.fetch(batch_size)
+                if not rows:
+                    break
+                yield [tuple(row) for row in rows]
+
+
+async def iter_products(batch_size: int = 1000):
+    """
+    Parcourt tout le catalogue par lots (générateur async).
+    Un curseur serveur PostgreSQL exige une transaction : elle garantit
+    aussi un instantané cohérent pendant tout l'export.
+    """
+    async with _acquire() as conn:
+        async with conn.transaction(readonly=True):
+            cursor = await conn.cursor("SELECT * FROM products ORDER BY id")
+            while True:
+                rows = await cursor.fetch(batch_size)
+                if not rows:
+                    break
+                yield [dict(row) for row in rows]
+
+
+@instrumented("select_all")
+async def search_products(q: str, limit: int, cursor: str = None):
+    """
+    Recherche plein texte (index GIN), même contrat que database.search_products.
+    score = -ts_rank : plus petit = plus pertinent, comme bm25() côté SQLite,
+    ce qui permet de garder le même curseur keyset (score, id).
+    """
+    query = " & ".join(f"{term}:*" for term in search_terms(q))
+    params = [query]
+    sql = f"""
+        SELECT * FROM (
+            SELECT p.*, -ts_rank({SEARCH_VECTOR}, query) AS score
+            FROM products p, to_tsquery('simple', $1) AS query
+            WHERE {SEARCH_VECTOR} @@ query
+        ) AS results"""
+    if cursor:
+        sql += " WHERE (score, id) > ($2::real, $3)"
+        params.extend(decode_cursor(cursor, "score"))
+    sql += f" ORDER BY score, id LIMIT ${len(params) + 1}"
+    params.append(limit + 1)
+    async with _acquire() as conn:
+        rows = await conn.fetch(sql, *params)
+    return paginate_search([dict(row) for row in rows], limit)
+
+
+@instrumented("select_all")
+async def get_catalogue_stats():
+    """Statistiques du catalogue, lues dans category_stats : O(catégories)."""
+    async with _acquire() as conn:
+        categories = [dict(row) for row in await conn.fetch(CATEGORY_STATS_QUERY)]
+        for row in categories:
+            sql, params = price_range_query(row["category"])
+            row.update(dict(await conn.fetchrow(_to_pg(sql), *params)))
+    return summarize_stats(categories)
+
+
+@instrumented("select_all")
+async def get_changes(since: int, limit: int) -> dict:
+    """Changements de seq > since (voir database.get_changes), sur un instantané cohérent."""
+    async with _acquire() as conn:
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            check_change_cursor(since, await conn.fetchval("SELECT purged_seq FROM change_feed_state WHERE id = 1"))
+            rows = [dict(row) for row in await conn.fetch(_to_pg(CHANGES_QUERY), since, limit + 1)]
+    return paginate_changes(rows, since, limit)
+
+
+@instrumented("select_one")
+async def latest_change_seq() -> int:
+    """Dernier seq du flux (0 s'il est vide)."""
+    async with _acquire() as conn:
+        return await conn.fetchval(LATEST_CHANGE_SQL)
+
+
+@instrumented("delete")
+async def purge_tombstones(retention_days: float = None) -> int:
+    """Supprime les tombstones plus anciennes que la rétention ; retourne leur nombre."""
+    days = CHANGES_RETENTION_DAYS if retention_days is None else retention_days
+    async with _acquire() as conn:
+        async with conn.transaction():
+            purged = await conn.fetch(
+                "DELETE FROM product_changes WHERE op = 'delete' "
+                "AND changed_at <= CURRENT_TIMESTAMP - make_interval(secs => $1) RETURNING seq",
+                days * 86400,
+            )
+            if purged:
+                await conn.execute(
+                    "UPDATE change_feed_state SET purged_seq = greatest(purged_seq, $1) WHERE id = 1",
+                    max(row["seq"] for row in purged),
+                )
+    return len(purged)
+
+
+@instrumented("select_one")
+async def get_catalogue_state():
+    """Version du catalogue et date de la dernière écriture."""
+    async with _acquire() as conn:
+        row = await conn.fetchrow("SELECT version, updated_at FROM catalogue_state WHERE id = 1")
+    return dict(row)
+
+
+@instrumented("select_one")
+async def get_product_by_id(product_id: int):
+    """Récupère UN produit par son ID."""
+    async with _acquire() as conn:
+        row = await conn.fetchrow("SELECT * FROM products WHERE id = $1", product_id)
+    return dict(row) if row else None
+
+
+@instrumented("select_all")
+async def get_products_by_ids(product_ids: list) -> list:
+    """Plusieurs produits par leurs IDs, en une requête (ordre quelconque, ids inconnus absents)."""
+    async with _acquire() as conn:
+        rows = await conn.fetch("SELECT * FROM products WHERE id = ANY($1::int[])", product_ids)
+    return [dict(row) for row in rows]
+
+
+@instrumented("insert")
+async def create_product(name: str, description: str, price: float, stock: int, category: str):
+    """Insère un nouveau produit et retourne la ligne créée."""
+    async with _acquire() as conn:
+        row = await conn.fetchrow(
+            """INSERT INTO products (name, description, price, stock, category)
+               VALUES ($1, $2, $3, $4, $5)
+               RETURNING *""",
+            name, description, price, stock, category,
+        )
+    return dict(row)
+
+
+# Égalité qui vaut aussi pour NULL (équivalent du "IS" de SQLite), pour les clauses If-Match
+NULL_SAFE_EQUAL = "IS NOT DISTINCT FROM"
+
+
+async def _precondition_failed(conn, product_id: int):
+    """Écriture conditionnelle sans effet : 412 si le produit existe encore, sinon 404 (None)."""
+    if await conn.fetchval("SELECT 1 FROM products WHERE id = $1", product_id):
+        raise PreconditionFailedError(f"Le produit {product_id} a été modifié")
+
+
+@instrumented("update")
+async def update_product(product_id: int, name: str, description: str, price: float, stock: int, category: str,
+                         expected: dict = None):
+    """Met à jour un produit (conditionnel avec expected, voir database.update_product). None s'il n'existe pas."""
+    condition, condition_params = expected_clause(expected, NULL_SAFE_EQUAL)
+    sql = _to_pg(
+        """UPDATE products
+           SET name = ?, description = ?, price = ?, stock = ?, category = ?,
+               updated_at = CURRENT_TIMESTAMP
+           WHERE id = ?""" + condition + " RETURNING *"
+    )
+    async with _acquire() as conn:
+        row = await conn.fetchrow(sql, name, description, price, stock, category, product_id, *condition_params)
+        if row is None and expected is not None:
+            await _precondition_failed(conn, product_id)
+    return dict(row) if row else None
+
+
+@instrumented("update")
+async def patch_product(product_id: int, fields: dict, expected: dict = None):
+    """Modifie seulement les champs fournis (UPDATE partiel + RETURNING). None si le produit n'existe pas."""
+    sql, params = build_patch_query(product_id, fields, expected=expected, same=NULL_SAFE_EQUAL)
+    async with _acquire() as conn:
+        row = await conn.fetchrow(_to_pg(sql), *params)
+        if row is None and expected is not None:
+            await _precondition_failed(conn, product_id)
+    return dict(row) if row else None
+
+
+@instrumented("delete")
+async def delete_product(product_id: int, expected: dict = None):
+    """Supprime un produit. Retourne True si supprimé, False s'il n'existait pas."""
+    condition, condition_params = expected_clause(expected, NULL_SAFE_EQUAL)
+    async with _acquire() as conn:
+        status = await conn.execute(_to_pg("DELETE FROM products WHERE id = ?" + condition), product_id, *condition_params)
+        # asyncpg retourne le tag de commande : "DELETE 1" ou "DELETE 0"
+        if status == "DELETE 0" and expected is not None:
+            await _precondition_failed(conn, product_id)
+    return status != "DELETE 0"
+
+
+# --- Opérations en masse (bulk) ---
+# Une transaction pour tout le lot ; les tableaux PostgreSQL (unnest / ANY)
+# évitent de générer une requête avec des milliers de placeholders.
+
+
+@instrumented("insert")
+async def create_products(products: list):
+    """Insère une liste de produits en une requête et retourne les lignes créées (RETURNING)."""
+    async with _acquire() as conn:
+        return await _insert_products(conn, products)
+
+
+async def _insert_products(conn, products: list) -> list:
+    columns = [[p[field] for p in products] for field in PRODUCT_FIELDS]
+    rows = await conn.fetch(
+        """INSERT INTO products (name, description, price, stock, category)
+           SELECT * FROM unnest($1::text[], $2::text[], $3::float8[], $4::int[], $5::text[])
+           RETURNING *""",
+        *columns,
+    )
+    return sorted((dict(row) for row in rows), key=lambda p: p["id"])
+
+
+@instrumented("select_one")
+async def has_products() -> bool:
+    """Vrai si le catalogue contient au moins un produit (EXISTS : O(1))."""
+    async with _acquire() as conn:
+        return await conn.fetchval(HAS_PRODUCTS_SQL)
+
+
+@instrumented("insert")
+async def seed_if_empty(products: list) -> list:
+    """Insère 'products' seulement si le catalogue est vide (un seul worker, grâce à un verrou consultatif)."""
+    async with _acquire() as conn:
+        if await conn.fetchval(HAS_PRODUCTS_SQL):
+            return []
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock($1)", SEED_LOCK_KEY)
+            if await conn.fetchval(HAS_PRODUCTS_SQL):
+                return []
+            return await _insert_products(conn, products)
+
+
+async def _lock_products(conn, product_ids: list):
+    """
+    Verrouille les lignes par id croissant, avant toute écriture de la transaction.
+    Toutes les écritures à plusieurs lignes prennent leurs verrous dans le même
+    ordre, puis catalogue_state (trigger) : elles ne peuvent pas s'interbloquer.
+    """
+    await conn.execute(
+        "SELECT 1 FROM products WHERE id = ANY($1::int[]) ORDER BY id FOR UPDATE", product_ids
+    )
+
+
+@instrumented("update")
+async def update_products(products: list):
+    """
+    Met à jour une liste de produits en une transaction. Retourne (modifiés, ids_introuvables).
+    Plusieurs instructions : les lignes sont verrouillées d'abord (_lock_products).
+    """
+    ids = [p["id"] for p in products]
+    async with _acquire() as conn:
+        async with conn.transaction():
+            await _lock_products(conn, ids)
+            await conn.executemany(
+                """UPDATE products
+                   SET name = $1, description = $2, price = $3, stock = $4, category = $5,
+                       updated_at = CURRENT_TIMESTAMP
+                   WHERE id = $6""",
+                [tuple(p[field] for field in PRODUCT_FIELDS) + (p["id"],) for p in products],
+            )
+            rows = await conn.fetch("SELECT * FROM products WHERE id = ANY($1::int[]) ORDER BY id", ids)
+    updated = [dict(row) for row in rows]
+    found = {p["id"] for p in updated}
+    return updated, [i for i in dict.fromkeys(ids) if i not in found]
+
+
+@instrumented("delete")
+async def delete_products(product_ids: list):
+    """Supprime une liste d'ids en une requête. Retourne (ids_supprimés, ids_introuvables)."""
+    async with _acquire() as conn:
+        async with conn.transaction():
+            # L'ordre de parcours du DELETE n'est pas garanti : verrous pris d'abord, par id
+            await _lock_products(conn, product_ids)
+            rows = await conn.fetch("DELETE FROM products WHERE id = ANY($1::int[]) RETURNING id", product_ids)
+    deleted = {row["id"] for row in rows}
+    return sorted(deleted), [i for i in dict.fromkeys(product_ids) if i not in deleted]
+
+
+@instrumented("update")
+async def adjust_stocks(items: list):
+    """
+    Variations de stock atomiques en une transaction (voir database.adjust_stocks).
+
+    Les lignes de la commande sont verrouillées d'abord, par id croissant
+    (_lock_products) : deux commandes qui se recouvrent passent l'une après
+    l'autre au lieu de s'interbloquer. Les variations sont ensuite appliquées
+    dans l'ordre reçu.
+    """
+    sql = _to_pg(ADJUST_STOCK_SQL)
+    results, failed = [], []
+    async with _acquire() as conn:
+        async with conn.transaction():
+            await _lock_products(conn, [item["id"] for item in items])
+            for item in items:
+                row = await conn.fetchrow(sql, *adjust_stock_params(item))
+                if row:
+                    results.append(dict(row))
+                else:
+                    failed.append(item)
+            if failed:
+                rows = await conn.fetch(
+                    "SELECT id, stock FROM products WHERE id = ANY($1::int[])",
+                    [item["id"] for item in failed],
+                )
+                # L'exception annule la transaction
+                raise stock_conflict(failed, {row["id"]: row["stock"] for row in rows})
+    return results
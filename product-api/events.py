@@ -0,0 +1,220 @@
+"""
+events.py — Diffusion des changements du catalogue en Server-Sent Events (GET /products/events)
+
+Le client garde UNE connexion HTTP ouverte et reçoit chaque changement dès
+qu'il est écrit, au lieu d'interroger GET /products/changes en boucle.
+
+- Un seul diffuseur (ChangeBroker) par worker : il lit le flux de changements
+  (product_changes, voir database.py) toutes les SSE_POLL_INTERVAL secondes,
+  formate chaque changement UNE fois et le pousse dans la file de chaque abonné.
+  Que 10 ou 5000 clients soient connectés, la base voit une requête par intervalle
+  et par worker — et aucune quand personne n'écoute.
+- Un client inactif ne coûte qu'une petite tâche asyncio et une file vide :
+  pas de thread, pas de connexion à la base.
+- Toutes les SSE_HEARTBEAT_INTERVAL secondes sans changement, un commentaire
+  ": ping" garde la connexion ouverte à travers les proxys et révèle les clients partis.
+- Chaque événement porte son seq en "id:" : à la reconnexion, le navigateur
+  renvoie Last-Event-ID et le flux reprend là où il s'était arrêté (rattrapage
+  lu dans product_changes, sans doublon ni trou).
+- Contre-pression : la file d'un abonné est bornée (SSE_QUEUE_SIZE). Un client
+  trop lent pour la vider est déconnecté plutôt que de faire grossir la mémoire
+  du worker ; il se reconnecte avec Last-Event-ID et rattrape son retard.
+
+Format d'un événement (data = même objet que dans GET /products/changes) :
+
+    id: 42
+    event: upsert
+    data: {"seq":42,"op":"upsert","id":7,"product":{...}}
+"""
+
+import asyncio
+import contextvars
+import os
+
+import repository
+from database import ChangeFeedExpiredError
+from metrics import SSE_CLIENTS, SSE_DROPPED
+from serialization import dumps
+
+# Intervalle (secondes) entre deux lectures du flux de changements par le diffuseur
+SSE_POLL_INTERVAL = float(os.environ.get("SSE_POLL_INTERVAL", "0.5"))
+# Commentaire ": ping" envoyé après ce délai (secondes) sans événement
+SSE_HEARTBEAT_INTERVAL = float(os.environ.get("SSE_HEARTBEAT_INTERVAL", "15"))
+# Événements en attente par client avant de le déconnecter (client trop lent)
+SSE_QUEUE_SIZE = int(os.environ.get("SSE_QUEUE_SIZE", "256"))
+# Connexions SSE simultanées par worker (au-delà : 503 + Retry-After)
+SSE_MAX_CLIENTS = int(os.environ.get("SSE_MAX_CLIENTS", "5000"))
+# Délai de reconnexion conseillé au navigateur (champ "retry:", en millisecondes)
+SSE_RETRY_MS = int(os.environ.get("SSE_RETRY_MS", "3000"))
+# Changements lus par requête (diffuseur et rattrapage Last-Event-ID)
+SSE_BATCH_SIZE = 500
+
+MEDIA_TYPE = "text/event-stream"
+HEARTBEAT = b": ping\n\n"
+RESYNC = b"event: resync\ndata: {}\n\n"
+
+# Marqueur placé dans la file d'un abonné déconnecté par le diffuseur
+DROPPED = object()
+
+
+def format_event(change: dict) -> bytes:
+    """Un changement du flux -> événement SSE ("id", "event", "data" puis une ligne vide)."""
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (change["seq"], change["op"].encode(), dumps(change))
+
+
+class Subscription:
+    """Un client connecté : sa file d'événements (seq, octets) bornée."""
+
+    def __init__(self, size: int):
+        self.queue = asyncio.Queue(size)
+        self.dropped = False
+
+
+class ChangeBroker:
+    """
+    Diffuseur d'un worker : une tâche de fond lit le flux de changements et
+    le répartit entre les abonnés. Elle démarre avec le premier abonné et
+    s'arrête quand le dernier se déconnecte.
+    """
+
+    def __init__(self, poll_interval: float = None, queue_size: int = None, max_clients: int = None):
+        self.poll_interval = SSE_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.queue_size = SSE_QUEUE_SIZE if queue_size is None else queue_size
+        self.max_clients = SSE_MAX_CLIENTS if max_clients is None else max_clients
+        self.subscribers = set()
+        self.last_seq = 0
+        self._task = None
+        self._start_lock = asyncio.Lock()
+
+    @property
+    def full(self) -> bool:
+        return len(self.subscribers) >= self.max_clients
+
+    async def subscribe(self) -> Subscription:
+        """Nouvel abonné : il reçoit les changements écrits à partir de maintenant."""
+        async with self._start_lock:
+            if self._task is None:
+                # Personne n'écoutait : on repart de la fin actuelle du flux
+                self.last_seq = await repository.latest_change_seq()
+                # Contexte vide : la tâche survit à la requête qui l'a lancée
+                # (sinon elle hériterait, entre autres, de son Server-Timing)
+                self._task = asyncio.create_task(self._poll(), context=contextvars.Context())
+            subscription = Subscription(self.queue_size)
+            self.subscribers.add(subscription)
+        SSE_CLIENTS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """Appelé une fois par abonné, à la fin de son flux (déconnexion, abandon ou arrêt)."""
+        self.subscribers.discard(subscription)
+        SSE_CLIENTS.dec()
+
+    def publish(self, changes: list):
+        """Formate chaque changement une fois et le dépose dans la file de chaque abonné."""
+        for change in changes:
+            item = (change["seq"], format_event(change))
+            for subscription in list(self.subscribers):
+                try:
+                    subscription.queue.put_nowait(item)
+                except asyncio.QueueFull:
+                    self._drop(subscription)
+                    SSE_DROPPED.inc()
+
+    def _drop(self, subscription: Subscription):
+        """Retire un abonné : ses événements en attente sont jetés, il ne lira plus que DROPPED."""
+        self.subscribers.discard(subscription)
+        subscription.dropped = True
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(DROPPED)
+
+    async def _poll(self):
+        try:
+            while self.subscribers:
+                try:
+                    page = await repository.get_changes(self.last_seq, SSE_BATCH_SIZE)
+                except ChangeFeedExpiredError:
+                    # Plus rien à rattraper d'utile : on repart de la fin du flux
+                    self.last_seq = await repository.latest_change_seq()
+                    continue
+                except Exception:
+                    # Base momentanément indisponible : les abonnés restent connectés, on réessaie
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                if page["changes"]:
+                    self.publish(page["changes"])
+                    self.last_seq = page["next_since"]
+                # Page pleine : la suite est lue tout de suite, sans attendre l'intervalle
+                if not page["has_more"]:
+                    await asyncio.sleep(self.poll_interval)
+        finally:
+            self._task = None
+
+    async def close(self):
+        """Arrêt du worker : stoppe la lecture et termine tous les flux ouverts."""
+        for subscription in list(self.subscribers):
+            self._drop(subscription)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+broker = ChangeBroker()
+
+
+def _next_messages(subscription: Subscription, first) -> tuple:
+    """Premier élément + tout ce qui attend déjà dans la file : (éléments, abandonné ?)."""
+    items = [first]
+    while not subscription.queue.empty():
+        items.append(subscription.queue.get_nowait())
+    if DROPPED in items:
+        return items[:items.index(DROPPED)], True
+    return items, False
+
+
+async def event_stream(last_event_id: int = None, broker: ChangeBroker = broker, heartbeat: float = None):
+    """
+    Corps de la réponse SSE : "retry:", rattrapage depuis Last-Event-ID si fourni,
+    puis les événements en direct et les heartbeats jusqu'à la déconnexion.
+    """
+    heartbeat = SSE_HEARTBEAT_INTERVAL if heartbeat is None else heartbeat
+    # Abonné AVANT le rattrapage : ce qui est écrit pendant la relecture attend dans la file
+    subscription = await broker.subscribe()
+    try:
+        yield b"retry: %d\n\n" % SSE_RETRY_MS
+        sent = 0
+        if last_event_id is not None:
+            sent = last_event_id
+            while True:
+                try:
+                    page = await repository.get_changes(sent, SSE_BATCH_SIZE)
+                except ChangeFeedExpiredError:
+                    # Suppressions déjà purgées : le client doit repartir de GET /products/changes?since=0
+                    yield RESYNC
+                    return
+                if page["changes"]:
+                    yield b"".join(format_event(change) for change in page["changes"])
+                sent = page["next_since"]
+                if not page["has_more"]:
+                    break
+
+        while True:
+            try:
+                async with asyncio.timeout(heartbeat):
+                    first = await subscription.queue.get()
+            except TimeoutError:
+                yield HEARTBEAT
+                continue
+            items, dropped = _next_messages(subscription, first)
+            # Un seq déjà envoyé par le rattrapage n'est pas renvoyé
+            chunk = b"".join(message for seq, message in items if seq > sent)
+            if chunk:
+                sent = items[-1][0]
+                yield chunk
+            if dropped:
+                return
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,161 @@
+"""
+metrics.py — Métriques Prometheus propres à l'API Produits
+
+Instrumentator() (dans app.py) fournit déjà les métriques HTTP.
+Ici on déclare les métriques "métier" / internes (pool de connexions, ...).
+
+Elles sont enregistrées dans le registre par défaut de prometheus_client,
+celui qu'Instrumentator expose sur /metrics : pas de route supplémentaire à créer.
+
+Avec plusieurs workers (server.py), prometheus_client passe en mode
+multiprocessus : multiprocess_mode indique comment agréger une Gauge entre
+workers ("livesum" = somme des workers vivants, "liveall" = une série par worker).
+Il est ignoré avec un seul processus. "Vivant" veut dire : dont les fichiers
+gauge_live* n'ont pas été retirés par mark_process_dead(), voir mark_worker_dead().
+"""
+
+import glob
+import os
+import re
+
+from prometheus_client import Counter, Gauge, Histogram, multiprocess
+
+# --- Pool de connexions (database.py / database_pg.py) ---
+
+DB_POOL_SIZE = Gauge(
+    "product_api_db_pool_size",
+    "Nombre maximal de connexions SQLite dans le pool",
+    multiprocess_mode="livesum",
+)
+DB_POOL_OPEN = Gauge(
+    "product_api_db_pool_connections_open",
+    "Connexions SQLite actuellement ouvertes par le pool",
+    multiprocess_mode="livesum",
+)
+DB_POOL_IN_USE = Gauge(
+    "product_api_db_pool_connections_in_use",
+    "Connexions SQLite actuellement empruntées par une requête",
+    multiprocess_mode="livesum",
+)
+DB_POOL_WAIT = Histogram(
+    "product_api_db_pool_wait_seconds",
+    "Temps d'attente pour obtenir une connexion du pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+DB_POOL_TIMEOUTS = Counter(
+    "product_api_db_pool_timeouts_total",
+    "Demandes de connexion abandonnées faute de connexion libre",
+)
+
+DB_CONNECT_DURATION = Histogram(
+    "product_api_db_connect_seconds",
+    "Temps d'ouverture d'une nouvelle connexion SQLite (fichier, PRAGMA)",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0),
+)
+
+# --- Requêtes SQL (database.py / database_pg.py, décorateur instrumented) ---
+# operation : select_all, select_one, insert, update, delete
+# query     : fonction d'accès aux données (list_products, get_product_by_id, ...)
+
+DB_QUERY_DURATION = Histogram(
+    "product_api_db_query_duration_seconds",
+    "Durée des accès à la base (exécution + lecture des lignes, hors attente du pool)",
+    ["operation", "query"],
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+DB_QUERY_ROWS = Histogram(
+    "product_api_db_query_rows",
+    "Lignes renvoyées ou écrites par accès à la base",
+    ["operation", "query"],
+    buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000),
+)
+DB_QUERY_ERRORS = Counter(
+    "product_api_db_query_errors_total",
+    "Accès à la base terminés par une exception",
+    ["operation", "query"],
+)
+
+# --- Caches mémoire (cache.py) ---
+# Label "cache" : "product" (GET /products/{id}), "list" (GET /products)
+# ou "token" (JWT déjà vérifiés, auth.py)
+
+CACHE_HITS = Counter(
+    "product_api_cache_hits_total",
+    "Lectures servies depuis le cache mémoire",
+    ["cache"],
+)
+CACHE_MISSES = Counter(
+    "product_api_cache_misses_total",
+    "Lectures absentes du cache (la base a été interrogée)",
+    ["cache"],
+)
+CACHE_EVICTIONS = Counter(
+    "product_api_cache_evictions_total",
+    "Entrées retirées du cache (reason=size : LRU plein, reason=expired : TTL dépassé)",
+    ["cache", "reason"],
+)
+CACHE_HIT_RATIO = Gauge(
+    "product_api_cache_hit_ratio",
+    "Part des lectures servies par le cache depuis le démarrage du worker",
+    ["cache"],
+    multiprocess_mode="liveall",
+)
+CACHE_ENTRIES = Gauge(
+    "product_api_cache_entries",
+    "Nombre d'entrées actuellement en cache",
+    ["cache"],
+    multiprocess_mode="livesum",
+)
+
+# --- Flux d'événements SSE (events.py, GET /products/events) ---
+
+SSE_CLIENTS = Gauge(
+    "product_api_sse_clients",
+    "Connexions SSE ouvertes",
+    multiprocess_mode="livesum",
+)
+SSE_DROPPED = Counter(
+    "product_api_sse_dropped_clients_total",
+    "Clients SSE déconnectés parce qu'ils ne lisaient pas assez vite (file pleine)",
+)
+
+
+# --- Mode multiprocessus : gauges des workers arrêtés ---
+
+def mark_worker_dead(pid: int = None):
+    """
+    Retire les gauges "live" d'un worker de l'agrégat de /metrics (par défaut : ce processus).
+    Appelé à l'arrêt du worker ; sans effet hors mode multiprocessus.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid() if pid is None else pid)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def cleanup_dead_workers() -> list:
+    """
+    Retire les gauges des workers morts sans passer par leur arrêt (crash, kill -9).
+    uvicorn relance un worker à leur place : appelé à son démarrage.
+    Retourne les pids nettoyés.
+    """
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        return []
+    pids = set()
+    for name in glob.glob(os.path.join(path, "gauge_live*_*.db")):
+        match = re.search(r"_(\d+)\.db$", name)
+        if match:
+            pids.add(int(match.group(1)))
+    dead = sorted(pid for pid in pids if not _pid_alive(pid))
+    for pid in dead:
+        mark_worker_dead(pid)
+    return dead
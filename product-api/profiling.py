@@ -0,0 +1,216 @@
+"""
+profiling.py — Profilage à la demande en production (routes /admin/profiling, admin uniquement)
+
+Deux outils complémentaires, désactivés par défaut :
+
+1. Échantillonneur de piles (POST /admin/profiling/sample)
+   Pendant N secondes, un thread relève toutes les X ms la pile d'appels de
+   chaque thread du worker (sys._current_frames). Résultat au format
+   "collapsed stacks" (une pile par ligne + nombre d'échantillons), à passer
+   tel quel à flamegraph.pl ou à coller dans speedscope.app.
+   Voit TOUS les threads : boucle d'événements ET threads "db_N" (accès SQLite).
+
+2. cProfile sur un pourcentage de requêtes (POST /admin/profiling/requests)
+   Pendant N secondes, une requête sur 1/rate est exécutée sous cProfile ;
+   les statistiques sont cumulées et récupérables en texte ou au format pstats
+   (snakeviz, pstats.Stats). Limites : cProfile ne suit que le thread de la
+   boucle d'événements (le temps passé dans les threads SQLite apparaît comme
+   une attente), et il y enregistre TOUT ce qui s'exécute pendant les await de
+   la requête profilée, y compris les autres requêtes. Pour que le profil ne
+   décrive que la requête tirée au sort, elle n'est profilée que si aucune
+   autre requête n'est en cours ; si une autre arrive avant la fin, le profil
+   est jeté (compté dans "discarded_requests"). Sous forte charge, peu de
+   requêtes sont donc retenues : l'échantillonneur de piles est alors l'outil
+   à utiliser.
+
+Désactivé, le coût se limite à un compteur de requêtes en cours et à une
+comparaison par requête dans le middleware.
+Chaque worker a son propre profileur : avec plusieurs workers, on profile
+celui qui reçoit l'appel.
+"""
+
+import asyncio
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+# Durée max d'une fenêtre de profilage (échantillonnage ou requêtes), en secondes
+PROFILING_MAX_DURATION = float(os.environ.get("PROFILING_MAX_DURATION", "60"))
+
+
+class ProfilerBusyError(Exception):
+    """Un échantillonnage est déjà en cours dans ce worker."""
+
+
+# --- 1. Échantillonneur de piles ---
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame, thread_name: str) -> str:
+    """Pile d'un thread, de la racine à la fonction en cours, séparée par des ";"."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ";".join(reversed(labels))
+
+
+def sample_stacks_blocking(duration: float, interval: float) -> Counter:
+    """Relève les piles de tous les threads (sauf le sien) pendant 'duration' secondes."""
+    counts = Counter()
+    own = threading.get_ident()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != own:
+                counts[collapse_stack(frame, names.get(ident, f"thread-{ident}"))] += 1
+        time.sleep(interval)
+    return counts
+
+
+_sampling_lock = threading.Lock()
+
+
+async def sample_stacks(duration: float, interval: float) -> Counter:
+    """
+    Échantillonne pendant 'duration' secondes sans bloquer la boucle d'événements
+    (le relevé tourne dans un thread à part). Un seul échantillonnage à la fois.
+    """
+    if not _sampling_lock.acquire(blocking=False):
+        raise ProfilerBusyError("Un échantillonnage est déjà en cours")
+    try:
+        return await asyncio.to_thread(sample_stacks_blocking, duration, interval)
+    finally:
+        _sampling_lock.release()
+
+
+def format_collapsed(counts: Counter) -> str:
+    """Format "collapsed stacks" : "racine;...;feuille <nombre>" par ligne, les plus fréquentes d'abord."""
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+# --- 2. cProfile sur un pourcentage de requêtes ---
+
+class RequestProfiler:
+    """Fenêtre de profilage des requêtes et statistiques cumulées (pstats)."""
+
+    def __init__(self):
+        self.rate = 0.0
+        self.until = 0.0
+        self.profiled = 0
+        self.discarded = 0
+        self.stats = None
+        self.in_flight = 0
+        self._running = False
+        self._overlapped = False
+
+    @property
+    def active(self) -> bool:
+        return self.rate > 0 and time.monotonic() < self.until
+
+    def start(self, rate: float, duration: float):
+        """Ouvre une nouvelle fenêtre (les statistiques précédentes sont effacées)."""
+        self.stats = None
+        self.profiled = 0
+        self.discarded = 0
+        self.rate = rate
+        self.until = time.monotonic() + duration
+
+    def stop(self):
+        self.rate = 0.0
+        self.until = 0.0
+
+    def should_profile(self) -> bool:
+        """
+        Appelé pour chaque requête, après l'avoir comptée dans in_flight : doit
+        rester quasi gratuit quand rien n'est actif. Une requête n'est profilée
+        que si elle est seule en cours (sinon cProfile mesurerait aussi les autres).
+        """
+        if not self.rate:
+            return False
+        if time.monotonic() >= self.until:
+            self.stop()
+            return False
+        return self.in_flight == 1 and random.random() < self.rate
+
+    def add(self, profile: cProfile.Profile):
+        if self.stats is None:
+            self.stats = pstats.Stats(profile)
+        else:
+            self.stats.add(profile)
+        self.profiled += 1
+
+    def status(self) -> dict:
+        return {
+            "active": self.active,
+            "rate": self.rate,
+            "remaining_seconds": round(max(0.0, self.until - time.monotonic()), 1) if self.active else 0.0,
+            "profiled_requests": self.profiled,
+            "discarded_requests": self.discarded,
+        }
+
+    def dump(self) -> bytes:
+        """Statistiques au format des fichiers .pstats (ce qu'écrit Stats.dump_stats)."""
+        return marshal.dumps(self.stats.stats)
+
+    def report(self, limit: int, sort: str) -> str:
+        """Les 'limit' fonctions les plus coûteuses, en texte (pstats.print_stats)."""
+        stream = io.StringIO()
+        stats = pstats.Stats(stream=stream)
+        stats.add(self.stats)
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+
+request_profiler = RequestProfiler()
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI : exécute sous cProfile les requêtes tirées au sort par request_profiler."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profiler = request_profiler
+        profiler.in_flight += 1
+        try:
+            if profiler._running:
+                # Le profil en cours enregistrerait aussi cette requête : il sera jeté
+                profiler._overlapped = True
+            if not profiler.should_profile():
+                await self.app(scope, receive, send)
+                return
+            await self._profile(scope, receive, send)
+        finally:
+            profiler.in_flight -= 1
+
+    async def _profile(self, scope, receive, send):
+        profiler = request_profiler
+        profiler._running = True
+        profiler._overlapped = False
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profile.disable()
+            profiler._running = False
+            if profiler._overlapped:
+                profiler.discarded += 1
+            else:
+                profiler.add(profile)
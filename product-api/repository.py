@@ -0,0 +1,479 @@
+"""
+repository.py — Point d'entrée unique (async) vers la base de données
+
+app.py n'importe plus database.py directement : il passe par ce module,
+qui choisit le backend au démarrage :
+
+- PostgreSQL (database_pg.py, asyncpg) si DB_HOST est défini — docker-compose, Render.
+  C'est ce qui permet de lancer plusieurs réplicas de l'API sur la même base.
+- SQLite (database.py) sinon — développement local et tests.
+
+DB_BACKEND=sqlite|postgres force le choix (ex: tests locaux avec un .env qui définit DB_HOST).
+
+Toutes les fonctions sont des coroutines. Pour SQLite, les appels bloquants
+de database.py sont exécutés dans un pool de threads DÉDIÉ à la base
+(DB_EXECUTOR_THREADS, par défaut la taille du pool de connexions) plutôt que
+dans le threadpool partagé d'anyio (40 threads, aussi utilisé par les
+dépendances synchrones) : la concurrence des accès SQLite est fixée par la
+configuration, et les requêtes au-delà attendent leur tour dans la file de
+l'exécuteur sans occuper de thread.
+
+C'est aussi ici que se trouve le cache des lectures (cache.py) : il est donc
+commun aux deux backends. Chaque écriture invalide exactement ce qu'elle touche :
+l'entrée du produit concerné et les pages de liste (qu'un produit modifié
+peut faire apparaître, disparaître ou changer de place).
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import compression
+import database
+import snapshot
+from cache import MISSING, TTLCache
+from database import ChangeFeedExpiredError
+from serialization import dumps
+
+
+def select_backend(environ=os.environ):
+    """Retourne "postgres" ou "sqlite" selon les variables d'environnement."""
+    backend = environ.get("DB_BACKEND", "").strip().lower()
+    if backend in ("sqlite", "postgres"):
+        return backend
+    return "postgres" if environ.get("DB_HOST") else "sqlite"
+
+
+BACKEND = select_backend()
+
+if BACKEND == "postgres":
+    import database_pg
+
+# --- Cache des lectures ---
+# PRODUCT_CACHE_ENABLED=false le désactive complètement (tests, debug)
+PRODUCT_CACHE_ENABLED = os.environ.get("PRODUCT_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+PRODUCT_CACHE_SIZE = int(os.environ.get("PRODUCT_CACHE_SIZE", "2048"))
+PRODUCT_CACHE_TTL = float(os.environ.get("PRODUCT_CACHE_TTL", "30"))
+
+product_cache = TTLCache("product", PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL, PRODUCT_CACHE_ENABLED)
+list_cache = TTLCache("list", PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL, PRODUCT_CACHE_ENABLED)
+
+
+def clear_caches():
+    """Vide les caches de lecture (tests, ou après une écriture hors de l'API)."""
+    global _snapshot
+    product_cache.clear()
+    list_cache.clear()
+    _snapshot = None
+
+
+def _invalidate(*product_ids):
+    """Après une écriture : retire les produits touchés et toutes les pages de liste."""
+    global _snapshot_dirty
+    if product_ids:
+        product_cache.delete(*product_ids)
+    list_cache.clear()
+    # L'instantané colonnaire relira le flux de changements avant la prochaine requête
+    _snapshot_dirty = True
+
+
+# --- Exécuteur des appels SQLite ---
+# Plus de threads que de connexions ne sert à rien : les threads en trop
+# attendraient une connexion libre dans le pool.
+DB_EXECUTOR_THREADS = int(os.environ.get("DB_EXECUTOR_THREADS", str(database.DB_POOL_SIZE)))
+
+_executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Crée l'exécuteur au premier appel (et de nouveau après shutdown())."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_THREADS, thread_name_prefix="db")
+    return _executor
+
+
+async def run_in_db_thread(func, /, *args, **kwargs):
+    """
+    Exécute func(*args, **kwargs) dans un thread de l'exécuteur et attend le résultat.
+
+    Le contexte (ContextVars) est copié, comme le fait run_in_threadpool :
+    les durées SQL arrivent bien dans le Server-Timing de la requête en cours.
+    """
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), call)
+
+
+_EXHAUSTED = object()
+
+
+async def iterate_in_db_thread(iterator):
+    """Itérateur async sur un générateur synchrone, chaque next() dans l'exécuteur."""
+    try:
+        while True:
+            item = await run_in_db_thread(next, iterator, _EXHAUSTED)
+            if item is _EXHAUSTED:
+                return
+            yield item
+    finally:
+        # Client déconnecté en cours d'export : on ferme le générateur pour rendre sa connexion au pool
+        await run_in_db_thread(iterator.close)
+
+
+async def _call(func_name, /, *args, **kwargs):
+    """Appelle la fonction 'func_name' du backend actif (await direct ou via l'exécuteur)."""
+    if BACKEND == "postgres":
+        return await getattr(database_pg, func_name)(*args, **kwargs)
+    return await run_in_db_thread(getattr(database, func_name), *args, **kwargs)
+
+
+# --- Cycle de vie ---
+
+async def startup():
+    """Ouvre le pool (PostgreSQL) puis applique les migrations du schéma manquantes."""
+    if BACKEND == "postgres":
+        await database_pg.init_pool()
+    await _call("init_db")
+
+
+async def shutdown():
+    """Ferme le pool du backend actif, puis l'exécuteur SQLite."""
+    global _executor
+    await _call("close_pool")
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+async def seed_if_empty(products: list) -> list:
+    """Produits de démo au premier démarrage : insérés seulement si le catalogue est vide."""
+    created = await _call("seed_if_empty", products)
+    if created:
+        _invalidate()
+    return created
+
+
+# --- CRUD (même surface que database.py) ---
+# get_all_products() n'est plus utilisée par l'API : les routes passent par list_products().
+
+async def get_all_products():
+    return await _call("get_all_products")
+
+
+async def has_products() -> bool:
+    """Vrai si le catalogue contient au moins un produit (sans lire la table)."""
+    return await _call("has_products")
+
+
+async def list_products(limit: int, cursor: str = None, category: str = None,
+                        min_price: float = None, max_price: float = None,
+                        in_stock: bool = None, sort: str = "id"):
+    """Une page de produits — (produits, curseur_suivant), servie depuis le cache si possible."""
+    key = (limit, cursor, category, min_price, max_price, in_stock, sort)
+    page = list_cache.get(key)
+    if page is MISSING:
+        generation = list_cache.generation
+        page = await _call(
+            "list_products",
+            limit=limit, cursor=cursor, category=category,
+            min_price=min_price, max_price=max_price, in_stock=in_stock, sort=sort,
+        )
+        list_cache.set(key, page, generation)
+    return page
+
+
+async def get_compressed_list_page(encoding: str, limit: int, cursor: str = None, sort: str = "id"):
+    """
+    Une page de la liste SANS filtre, déjà encodée en JSON puis compressée —
+    (corps, encodage utilisé ou None sous le seuil, curseur_suivant).
+
+    C'est la page que tous les clients demandent : elle est compressée une fois
+    par encodage puis servie depuis list_cache jusqu'à la prochaine écriture.
+    """
+    key = ("compressed", encoding, limit, cursor, sort)
+    entry = list_cache.get(key)
+    if entry is MISSING:
+        generation = list_cache.generation
+        products, next_cursor = await list_products(limit=limit, cursor=cursor, sort=sort)
+        body, used = compression.compress_body(dumps(products), encoding)
+        entry = (body, used, next_cursor)
+        list_cache.set(key, entry, generation)
+    return entry
+
+
+async def search_products(q: str, limit: int, cursor: str = None):
+    """
+    Recherche plein texte — (produits, curseur_suivant).
+    Pas de cache : les recherches sont trop variées pour qu'il serve souvent.
+    """
+    return await _call("search_products", q, limit=limit, cursor=cursor)
+
+
+# Purge des tombstones du flux de changements : au plus une fois par intervalle et par worker,
+# à l'occasion d'une lecture du flux (pas de tâche de fond à gérer)
+CHANGES_PURGE_INTERVAL = float(os.environ.get("CHANGES_PURGE_INTERVAL", "3600"))
+_last_purge = None
+
+
+async def get_changes(since: int, limit: int) -> dict:
+    """
+    Une page du flux de changements (GET /products/changes).
+    Pas de cache : chaque client lit depuis son propre curseur.
+    """
+    global _last_purge
+    now = time.monotonic()
+    if _last_purge is None or now - _last_purge >= CHANGES_PURGE_INTERVAL:
+        _last_purge = now
+        await _call("purge_tombstones")
+    return await _call("get_changes", since, limit)
+
+
+async def latest_change_seq() -> int:
+    """Position actuelle du flux de changements (point de départ du diffuseur SSE)."""
+    return await _call("latest_change_seq")
+
+
+def iter_columns(batch_size: int = snapshot.SNAPSHOT_LOAD_BATCH_SIZE):
+    """Itérateur async sur (id, price, stock, category), lot par lot (chargement de l'instantané)."""
+    if BACKEND == "postgres":
+        return database_pg.iter_columns(batch_size)
+    return iterate_in_db_thread(database.iter_columns(batch_size))
+
+
+def iter_products(batch_size: int = 1000):
+    """Itérateur async sur le catalogue, lot par lot (pour l'export en flux)."""
+    if BACKEND == "postgres":
+        return database_pg.iter_products(batch_size)
+    # Chaque lot SQLite est lu dans l'exécuteur : la boucle d'événements reste libre
+    return iterate_in_db_thread(database.iter_products(batch_size))
+
+
+# Clé réservée dans list_cache : les statistiques y sont invalidées en même
+# temps que les pages de liste.
+_CATALOGUE_STATS_KEY = ("catalogue_stats",)
+
+# Dernière version du catalogue vue par ce worker
+_catalogue_version = None
+
+
+async def get_catalogue_state():
+    """
+    Version du catalogue (pour l'ETag de GET /products), toujours relue en base.
+
+    Elle est partagée par tous les workers et réplicas : en cache, un worker
+    répondrait 304 à un ETag périmé après une écriture faite par un autre.
+    La lecture est une recherche par clé primaire sur une ligne unique.
+    Une version différente de la dernière vue signale une écriture, peut-être
+    d'un autre worker : on ne sait pas quels produits elle a touchés, les pages
+    de liste ET les produits en cache de ce worker sont donc invalidés.
+    """
+    global _catalogue_version
+    state = await _call("get_catalogue_state")
+    if state["version"] != _catalogue_version:
+        _catalogue_version = state["version"]
+        product_cache.clear()
+        _invalidate()
+    return state
+
+
+async def get_catalogue_stats():
+    """Statistiques du catalogue (GET /products/stats), servies depuis le cache si possible."""
+    stats = list_cache.get(_CATALOGUE_STATS_KEY)
+    if stats is MISSING:
+        generation = list_cache.generation
+        stats = await _call("get_catalogue_stats")
+        list_cache.set(_CATALOGUE_STATS_KEY, stats, generation)
+    return stats
+
+
+# --- Instantané colonnaire (snapshot.py) ---
+# Chargé au premier classement / agrégat demandé (pas au démarrage, qui reste
+# O(1)), puis tenu à jour par le flux de changements : au plus tous les
+# SNAPSHOT_REFRESH_INTERVAL secondes, et dès la requête suivante après une
+# écriture de ce worker. Les calculs NumPy tournent hors de la boucle d'événements.
+
+_snapshot = None
+_snapshot_dirty = False
+_snapshot_checked = 0.0
+_snapshot_lock = asyncio.Lock()
+
+
+async def _load_snapshot():
+    """Charge tout le catalogue en colonnes, puis rattrape les écritures faites pendant la lecture."""
+    # Seq lu AVANT les lignes : un changement écrit pendant la lecture sera rejoué
+    # (rejouer un changement déjà vu ne change rien, le flux donne le dernier état)
+    loaded = snapshot.CatalogueSnapshot(await latest_change_seq())
+    async for rows in iter_columns():
+        await asyncio.to_thread(loaded.append_rows, rows)
+    await asyncio.to_thread(loaded.finish_load)
+    await _refresh_snapshot(loaded)
+    return loaded
+
+
+async def _refresh_snapshot(current):
+    """Applique les changements écrits depuis current.seq ; recharge tout si le flux a été purgé entre-temps."""
+    while True:
+        try:
+            page = await get_changes(current.seq, snapshot.SNAPSHOT_CHANGES_BATCH_SIZE)
+        except ChangeFeedExpiredError:
+            return await _load_snapshot()
+        if page["changes"]:
+            await asyncio.to_thread(current.apply_changes, page["changes"], page["next_since"])
+        if not page["has_more"]:
+            return current
+
+
+async def get_snapshot():
+    """L'instantané à jour, ou None s'il est désactivé (NumPy absent ou CATALOGUE_SNAPSHOT=false)."""
+    global _snapshot, _snapshot_dirty, _snapshot_checked
+    if not snapshot.SNAPSHOT_ENABLED:
+        return None
+    if (
+        _snapshot is not None
+        and not _snapshot_dirty
+        and time.monotonic() - _snapshot_checked < snapshot.SNAPSHOT_REFRESH_INTERVAL
+    ):
+        return _snapshot
+    async with _snapshot_lock:
+        checked = time.monotonic()
+        # Une requête concurrente a pu rafraîchir pendant qu'on attendait le verrou
+        if _snapshot is None or _snapshot_dirty or checked - _snapshot_checked >= snapshot.SNAPSHOT_REFRESH_INTERVAL:
+            # Remis à zéro AVANT de lire le flux : une écriture pendant la lecture le repositionne
+            _snapshot_dirty = False
+            _snapshot = await (_load_snapshot() if _snapshot is None else _refresh_snapshot(_snapshot))
+            _snapshot_checked = checked
+    return _snapshot
+
+
+async def top_products(sort: str, n: int, category: str = None, min_price: float = None,
+                       max_price: float = None, in_stock: bool = None):
+    """
+    Les n premiers produits filtrés selon 'sort' (GET /products/top).
+    Avec l'instantané, seuls les n produits retenus sont lus (get_products_by_ids) ;
+    en SQL quand un index donne directement le résultat (snapshot.index_serves_top).
+    """
+    use_index = snapshot.index_serves_top(sort, category, min_price, max_price, in_stock)
+    current = None if use_index else await get_snapshot()
+    if current is None:
+        return await _call("top_products", sort, n, category, min_price, max_price, in_stock)
+    ids = await asyncio.to_thread(current.top_ids, sort, n, category, min_price, max_price, in_stock)
+    products, _missing = await get_products_by_ids(ids) if ids else ([], [])
+    return products
+
+
+async def get_analytics(category: str = None, min_price: float = None, max_price: float = None,
+                        in_stock: bool = None) -> dict:
+    """Agrégats des produits filtrés (GET /products/analytics), depuis l'instantané si disponible."""
+    current = await get_snapshot()
+    if current is None:
+        return await _call("get_analytics", category, min_price, max_price, in_stock)
+    categories, median = await asyncio.to_thread(current.analytics, category, min_price, max_price, in_stock)
+    return database.summarize_analytics(categories, median)
+
+
+async def get_product_by_id(product_id: int, use_cache: bool = True):
+    """
+    Un produit (ou None), servi depuis le cache si possible. Les 404 ne sont pas mis en cache.
+    use_cache=False force la lecture en base (vérification d'un If-Match avant écriture).
+    """
+    if not use_cache:
+        return await _call("get_product_by_id", product_id)
+    product = product_cache.get(product_id)
+    if product is MISSING:
+        generation = product_cache.generation
+        product = await _call("get_product_by_id", product_id)
+        if product is not None:
+            product_cache.set(product_id, product, generation)
+    return product
+
+
+async def get_products_by_ids(product_ids: list):
+    """
+    Plusieurs produits dans l'ordre demandé (doublons ignorés) + les ids introuvables.
+    Les produits en cache ne sont pas relus ; les autres le sont en UNE requête.
+    """
+    unique_ids = list(dict.fromkeys(product_ids))
+    found, missing = {}, []
+    for product_id in unique_ids:
+        product = product_cache.get(product_id)
+        if product is MISSING:
+            missing.append(product_id)
+        else:
+            found[product_id] = product
+    if missing:
+        generation = product_cache.generation
+        for product in await _call("get_products_by_ids", missing):
+            found[product["id"]] = product
+            product_cache.set(product["id"], product, generation)
+    return [found[i] for i in unique_ids if i in found], [i for i in unique_ids if i not in found]
+
+
+async def create_product(name: str, description: str, price: float, stock: int, category: str):
+    product = await _call(
+        "create_product",
+        name=name, description=description, price=price, stock=stock, category=category,
+    )
+    _invalidate(product["id"])
+    return product
+
+
+# expected : le produit tel que lu pour vérifier If-Match. L'écriture n'a lieu
+# que si la ligne n'a pas changé depuis (PreconditionFailedError sinon).
+
+async def update_product(product_id: int, name: str, description: str, price: float, stock: int, category: str,
+                         expected: dict = None):
+    product = await _call(
+        "update_product",
+        product_id=product_id,
+        name=name, description=description, price=price, stock=stock, category=category,
+        expected=expected,
+    )
+    if product is not None:
+        _invalidate(product_id)
+    return product
+
+
+async def patch_product(product_id: int, fields: dict, expected: dict = None):
+    """Mise à jour partielle : seuls les champs de 'fields' sont écrits."""
+    product = await _call("patch_product", product_id, fields, expected)
+    if product is not None:
+        _invalidate(product_id)
+    return product
+
+
+async def delete_product(product_id: int, expected: dict = None):
+    deleted = await _call("delete_product", product_id, expected)
+    if deleted:
+        _invalidate(product_id)
+    return deleted
+
+
+# --- Opérations en masse ---
+
+async def create_products(products: list):
+    created = await _call("create_products", products)
+    _invalidate(*(p["id"] for p in created))
+    return created
+
+
+async def update_products(products: list):
+    updated, missing = await _call("update_products", products)
+    _invalidate(*(p["id"] for p in updated))
+    return updated, missing
+
+
+async def adjust_stocks(items: list):
+    """Variations de stock atomiques [{"id", "delta"}] -> [{"id", "stock"}] (StockConflictError sinon)."""
+    updated = await _call("adjust_stocks", items)
+    _invalidate(*(row["id"] for row in updated))
+    return updated
+
+
+async def delete_products(product_ids: list):
+    deleted, missing = await _call("delete_products", product_ids)
+    _invalidate(*deleted)
+    return deleted, missing
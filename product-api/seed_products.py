@@ -1,18 +1,27 @@
 """
-Insère des produits de démonstration dans products.db (SQLite).
+Insère des produits dans products.db (SQLite) : les démos, ou un gros catalogue synthétique.
 
 Usage (depuis le dossier product-api) :
   python seed_products.py
   python seed_products.py --force   # ajoute même si la table contient déjà des lignes
+  python seed_products.py --count 1000000            # catalogue synthétique (tests de capacité)
+  python seed_products.py --count 1000000 --seed 7   # même graine = mêmes produits
 
 Dans Docker (conteneur product-api arrêté ou depuis l’hôte avec le volume monté) :
   docker compose exec product-api python /app/seed_products.py
+
+Le mode --count est un chargement en masse : à lancer API arrêtée
+(les index et triggers de products sont suspendus pendant le chargement).
 """
 
 import argparse
+import random
+import sqlite3
 import sys
+import time
 
-from database import init_db, get_all_products, create_product
+import database
+from database import init_db, create_products, get_db
 
 DEMO_PRODUCTS = [
     {
@@ -53,33 +62,201 @@ DEMO_PRODUCTS = [
 ]
 
 
-def main():
+# --- Catalogue synthétique (--count) ---
+# Vocabulaire par catégorie : (noms, qualificatifs, phrases de description, prix min, prix max).
+# Assez varié pour que la recherche, les filtres et les tris aient des données réalistes.
+CATALOGUE = {
+    "Périphériques": (
+        ["Clavier", "Souris", "Casque", "Webcam", "Micro", "Tapis de souris"],
+        ["mécanique", "sans fil", "ergonomique", "USB-C", "Bluetooth", "silencieux"],
+        ["Compatible Windows, macOS et Linux.", "Garantie deux ans.", "Câble tressé amovible.",
+         "Idéal pour le télétravail.", "Rétroéclairage RGB réglable."],
+        9.0, 250.0,
+    ),
+    "Affichage": (
+        ["Écran", "Moniteur", "Projecteur", "Bras d'écran", "Dock"],
+        ["27 pouces", "4K", "QHD", "incurvé", "144 Hz", "portable"],
+        ["Dalle IPS anti-reflets.", "Compatible VESA.", "Entrées HDMI et DisplayPort.",
+         "Réglable en hauteur.", "Parfait pour les tableaux de bord Grafana."],
+        40.0, 1500.0,
+    ),
+    "Stockage": (
+        ["NAS", "SSD", "Disque dur", "Clé USB", "Baie de stockage"],
+        ["NVMe", "2 To", "4 baies", "externe", "chiffré", "RAID"],
+        ["Pour les artefacts de build et les backups.", "Chiffrement matériel AES-256.",
+         "Lecture jusqu'à 3500 Mo/s.", "Snapshots automatiques.", "Format compact."],
+        15.0, 2500.0,
+    ),
+    "Réseau": (
+        ["Switch", "Routeur", "Point d'accès", "Câble Ethernet", "Pare-feu"],
+        ["manageable", "PoE", "Wi-Fi 6", "10 GbE", "rackable", "Cat 6"],
+        ["Administration web et SNMP.", "Supporte les VLAN.", "Faible consommation.",
+         "Montage en baie 19 pouces.", "Mises à jour de firmware incluses."],
+        5.0, 3000.0,
+    ),
+    "Services": (
+        ["Licence", "Support", "Formation", "Audit", "Abonnement"],
+        ["monitoring", "CI/CD", "Kubernetes", "sécurité", "annuel", "premium"],
+        ["Accès à la documentation en ligne.", "Support en heures ouvrées.",
+         "Session à distance ou sur site.", "Rapport détaillé fourni.", "Sans engagement."],
+        0.0, 5000.0,
+    ),
+}
+CATEGORIES = tuple(CATALOGUE)
+
+# Produits insérés par transaction en mode --count
+SEED_BATCH_SIZE = 50_000
+# Cache de pages SQLite pendant le chargement (Kio) : les index tiennent en mémoire
+SEED_CACHE_SIZE_KB = 262_144
+
+
+def generate_products(count: int, seed: int = 42):
+    """
+    Génère 'count' produits synthétiques (générateur de dicts, clés de PRODUCT_FIELDS).
+
+    Déterministe : la même graine donne toujours le même catalogue,
+    ce qui rend les mesures de capacité comparables d'une exécution à l'autre.
+    Seul rng.random() est utilisé (choice / sample / randint sont plusieurs fois
+    plus lents) : la génération ne doit pas devenir le goulot du chargement.
+    """
+    rand = random.Random(seed).random
+    catalogue = [(category, *CATALOGUE[category]) for category in CATEGORIES]
+    for i in range(1, count + 1):
+        category, nouns, qualifiers, phrases, low, high = catalogue[int(rand() * len(catalogue))]
+        # Deux phrases distinctes de la catégorie
+        first = int(rand() * len(phrases))
+        second = (first + 1 + int(rand() * (len(phrases) - 1))) % len(phrases)
+        yield {
+            "name": f"{nouns[int(rand() * len(nouns))]} {qualifiers[int(rand() * len(qualifiers))]} #{i}",
+            "description": f"{phrases[first]} {phrases[second]}",
+            # Prix concentrés vers le bas de la fourchette : beaucoup de petits prix, peu de chers
+            "price": round(low + (high - low) * rand() ** 3, 2),
+            # ~10 % de ruptures de stock
+            "stock": 0 if rand() < 0.1 else 1 + int(rand() * 500),
+            "category": category,
+        }
+
+
+def _batches(products, size: int):
+    """Regroupe un itérable de produits en listes de tuples (ordre de PRODUCT_FIELDS)."""
+    batch = []
+    for product in products:
+        batch.append(tuple(product[field] for field in database.PRODUCT_FIELDS))
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def bulk_load(products, batch_size: int = SEED_BATCH_SIZE, progress=None) -> int:
+    """
+    Chargement en masse (SQLite) : retourne le nombre de produits insérés.
+
+    Ce qui rend le chargement rapide :
+    - une connexion dédiée, une transaction par lot de batch_size lignes (executemany)
+    - PRAGMA synchronous=OFF et gros cache : pas de fsync à chaque commit
+    - index et triggers de products supprimés pendant le chargement, puis
+      recréés par init_db() : un index se construit bien plus vite en une fois
+      que ligne par ligne, et les triggers (version du catalogue, index FTS5)
+      ne s'exécutent pas un million de fois
+    - l'index plein texte et les statistiques par catégorie sont recalculés en une passe à la fin,
+      et les nouveaux produits ajoutés au flux de changements
+
+    progress(insérés, écoulé_s) est appelé après chaque lot.
+    """
+    init_db()
+    columns = ", ".join(database.PRODUCT_FIELDS)
+    sql = f"INSERT INTO products ({columns}) VALUES ({', '.join('?' * len(database.PRODUCT_FIELDS))})"
+    conn = sqlite3.connect(database.DATABASE_PATH, isolation_level=None)
+    inserted, started = 0, time.perf_counter()
+    try:
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(f"PRAGMA cache_size = -{SEED_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        suspended = conn.execute(
+            "SELECT type, name FROM sqlite_master "
+            "WHERE tbl_name = 'products' AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+        ).fetchall()
+        for kind, name in suspended:
+            conn.execute(f'DROP {kind.upper()} "{name}"')
+        for batch in _batches(products, batch_size):
+            conn.execute("BEGIN")
+            conn.executemany(sql, batch)
+            conn.execute("COMMIT")
+            inserted += len(batch)
+            if progress:
+                progress(inserted, time.perf_counter() - started)
+    finally:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        # Toujours exécuté, même après une erreur : index et triggers recréés,
+        # index plein texte, statistiques et version du catalogue remis en cohérence.
+        # Sur la connexion de chargement : elle profite du gros cache pour trier les index.
+        conn.execute("BEGIN")
+        database.create_schema(conn)
+        for statement in database.CATEGORY_STATS_REBUILD + database.CHANGES_BACKFILL:
+            conn.execute(statement)
+        conn.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+        conn.execute("UPDATE catalogue_state SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1")
+        conn.execute("COMMIT")
+        conn.close()
+    return inserted
+
+
+def _print_progress(total: int):
+    def report(inserted: int, elapsed: float):
+        rate = inserted / elapsed if elapsed else 0
+        print(f"\r  {inserted:>10,} / {total:,} ({inserted * 100 // total} %) — {rate:,.0f} lignes/s",
+              end="", file=sys.stderr, flush=True)
+        if inserted >= total:
+            print("\n  construction des index et de l'index plein texte...", file=sys.stderr)
+    return report
+
+
+def count_products() -> int:
+    with get_db() as conn:
+        return conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Seed produits de démo")
     parser.add_argument(
         "--force",
         action="store_true",
         help="Insérer les démos même si des produits existent déjà",
     )
-    args = parser.parse_args()
+    parser.add_argument("--count", type=int, default=None,
+                        help="Générer N produits synthétiques au lieu des démos")
+    parser.add_argument("--seed", type=int, default=42, help="Graine du générateur (--count)")
+    parser.add_argument("--batch-size", type=int, default=SEED_BATCH_SIZE,
+                        help="Produits par transaction (--count)")
+    args = parser.parse_args(argv)
 
     init_db()
-    existing = get_all_products()
+    existing = count_products()
     if existing and not args.force:
         print(
-            f"La base contient déjà {len(existing)} produit(s). "
+            f"La base contient déjà {existing} produit(s). "
             "Rien n'a été ajouté. Utilisez --force pour ajouter quand même.",
             file=sys.stderr,
         )
         return 1
 
-    for p in DEMO_PRODUCTS:
-        create_product(
-            name=p["name"],
-            description=p["description"],
-            price=p["price"],
-            stock=p["stock"],
-            category=p["category"],
+    if args.count is not None:
+        if args.count <= 0:
+            parser.error("--count doit être positif")
+        started = time.perf_counter()
+        inserted = bulk_load(
+            generate_products(args.count, args.seed), args.batch_size, _print_progress(args.count)
         )
+        elapsed = time.perf_counter() - started
+        print(f"OK — {inserted} produit(s) inséré(s) en {elapsed:.1f} s "
+              f"({inserted / elapsed:,.0f} lignes/s, index compris).")
+        return 0
+
+    # Une seule transaction pour les démos (au lieu d'un commit par produit)
+    for p in create_products(DEMO_PRODUCTS):
         print(f"  + {p['name']}")
 
     print(f"OK — {len(DEMO_PRODUCTS)} produit(s) inséré(s).")
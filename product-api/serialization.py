@@ -0,0 +1,57 @@
+"""
+serialization.py — Sérialisation JSON rapide des réponses
+
+Par défaut, FastAPI encode une réponse en deux passes :
+1. jsonable_encoder() parcourt récursivement chaque produit, champ par champ
+2. json.dumps() (module standard, en Python) produit le texte
+Sur une page de 100 ou 1000 produits, c'est la première dépense CPU de GET /products.
+
+Ici :
+- orjson (bibliothèque en Rust) encode directement dicts, listes et datetime,
+  s'il est installé ; sinon on retombe sur json.dumps, sans dépendance obligatoire
+- FastJSONResponse est la classe de réponse par défaut de l'app (app.py)
+- les routes de liste renvoient directement une FastJSONResponse : les produits
+  (dicts de types JSON natifs venant de la base) ne passent plus par jsonable_encoder
+"""
+
+import json
+import time
+from datetime import date, datetime
+
+from fastapi.responses import JSONResponse
+
+import timing
+
+try:
+    import orjson
+except ImportError:  # orjson est optionnel : repli sur le module standard
+    orjson = None
+
+# Utile dans les logs / le benchmark pour savoir quel encodeur est actif
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def _json_default(value):
+    """Les dates PostgreSQL (datetime) sont encodées en ISO 8601, comme le fait FastAPI."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Type non sérialisable : {type(value).__name__}")
+
+
+def dumps(content) -> bytes:
+    """Encode en JSON compact (UTF-8, sans échappement des accents)."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_json_default)
+    return json.dumps(
+        content, ensure_ascii=False, separators=(",", ":"), default=_json_default
+    ).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encodée avec orjson quand il est disponible."""
+
+    def render(self, content) -> bytes:
+        started = time.perf_counter()
+        body = dumps(content)
+        timing.record("json", time.perf_counter() - started)
+        return body
@@ -0,0 +1,165 @@
+"""
+server.py — Lanceur de production de l'API Produits
+
+En développement : uvicorn app:app --reload
+En production    : python server.py            (c'est le CMD du Dockerfile)
+
+Ce lanceur démarre uvicorn avec :
+- N workers (processus), par défaut un par CPU disponible (quota du conteneur
+  compris, WEB_CONCURRENCY pour forcer)
+- uvloop / httptools s'ils sont installés (boucle d'événements et parseur HTTP en C)
+- keep-alive et backlog réglés pour être derrière un load balancer
+- un arrêt gracieux : les requêtes en cours ont le temps de se terminer
+- le mode multiprocessus de prometheus_client : chaque worker écrit ses métriques
+  dans PROMETHEUS_MULTIPROC_DIR et /metrics agrège tous les workers
+  (sinon chaque scrape ne verrait que le worker qui a répondu) ; les gauges
+  d'un worker arrêté ou mort en sont retirées (metrics.mark_worker_dead)
+
+Toutes les options ont une variable d'environnement et un argument CLI :
+    python server.py --workers 4 --port 8000
+"""
+
+import argparse
+import importlib.util
+import math
+import os
+import shutil
+import tempfile
+
+import uvicorn
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+# Fichiers du quota CPU du conteneur (cgroup v2, puis v1)
+CGROUP_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+
+
+def _read(path: str):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_quota():
+    """
+    Quota CPU du conteneur (docker --cpus, limits.cpu de Kubernetes), arrondi au CPU supérieur.
+    None s'il n'y a pas de limite ou pas de cgroup lisible.
+    """
+    cpu_max = _read(CGROUP_CPU_MAX)
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+    else:
+        quota, period = _read(CGROUP_V1_QUOTA), _read(CGROUP_V1_PERIOD)
+    if not quota or quota in ("max", "-1") or not period:
+        return None
+    return max(1, math.ceil(int(quota) / int(period)))
+
+
+def available_cpus() -> int:
+    """
+    CPU réellement utilisables par ce processus.
+
+    os.cpu_count() compte les CPU de l'HÔTE : dans un conteneur limité à 2 CPU
+    sur une machine à 64 cœurs, il répond 64. On prend les CPU autorisés
+    (affinité) puis on les plafonne par le quota du cgroup.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    quota = cgroup_cpu_quota()
+    return max(1, min(cpus, quota) if quota else cpus)
+
+
+def default_workers() -> int:
+    """
+    Nombre de workers par défaut : WEB_CONCURRENCY si défini, sinon un par CPU disponible.
+
+    Les routes sont async : un worker occupe déjà bien son cœur, inutile
+    d'appliquer la règle "2 x CPU + 1" des serveurs synchrones. Chaque worker
+    ouvre son propre pool de connexions : compter les CPU de l'hôte épuiserait
+    les connexions PostgreSQL.
+    """
+    if os.environ.get("WEB_CONCURRENCY"):
+        return max(1, int(os.environ["WEB_CONCURRENCY"]))
+    return available_cpus()
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Lance l'API Produits (uvicorn multi-workers)")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=_env_int("PORT", 5000))
+    parser.add_argument("--workers", type=int, default=default_workers(),
+                        help="Nombre de processus (défaut : WEB_CONCURRENCY ou CPU disponibles)")
+    parser.add_argument("--backlog", type=int, default=_env_int("SERVER_BACKLOG", 2048),
+                        help="Connexions TCP en attente d'acceptation")
+    parser.add_argument("--keep-alive", type=int, default=_env_int("SERVER_KEEP_ALIVE", 75),
+                        help="Secondes de keep-alive ; > timeout du load balancer (60s en général)")
+    parser.add_argument("--graceful-timeout", type=int, default=_env_int("SERVER_GRACEFUL_TIMEOUT", 30),
+                        help="Secondes laissées aux requêtes en cours lors d'un arrêt")
+    parser.add_argument("--limit-concurrency", type=int, default=_env_int("SERVER_LIMIT_CONCURRENCY", 0) or None,
+                        help="Au-delà, uvicorn répond 503 au lieu d'accumuler les requêtes (0 = illimité)")
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "info"))
+    return parser.parse_args(argv)
+
+
+def build_config(args) -> dict:
+    """Arguments de uvicorn.run() à partir des options (séparé pour être testable)."""
+    return {
+        "host": args.host,
+        "port": args.port,
+        "workers": args.workers,
+        "loop": "uvloop" if _installed("uvloop") else "asyncio",
+        "http": "httptools" if _installed("httptools") else "h11",
+        "backlog": args.backlog,
+        "timeout_keep_alive": args.keep_alive,
+        "timeout_graceful_shutdown": args.graceful_timeout,
+        "limit_concurrency": args.limit_concurrency,
+        # Derrière le proxy Render / un load balancer : IP client réelle depuis X-Forwarded-For
+        "proxy_headers": True,
+        "forwarded_allow_ips": os.environ.get("FORWARDED_ALLOW_IPS", "*"),
+        "log_level": args.log_level,
+        # ACCESS_LOG=false coupe le log ligne à ligne (les requêtes restent comptées par Prometheus)
+        "access_log": os.environ.get("ACCESS_LOG", "true").lower() in ("1", "true", "yes"),
+    }
+
+
+def prepare_prometheus_multiproc_dir(workers: int):
+    """
+    Active le mode multiprocessus de prometheus_client quand il y a plusieurs workers.
+
+    La variable doit être définie AVANT que les workers importent prometheus_client :
+    ils l'héritent du processus parent. Le dossier est vidé à chaque démarrage
+    pour ne pas additionner les compteurs d'une exécution précédente.
+    """
+    if workers <= 1:
+        return None
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.path.join(
+        tempfile.gettempdir(), "product-api-metrics"
+    )
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    return path
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    prepare_prometheus_multiproc_dir(args.workers)
+    # "app:app" (chaîne) et pas l'objet : chaque worker importe l'app lui-même
+    uvicorn.run("app:app", **build_config(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+snapshot.py — Instantané colonnaire du catalogue en mémoire (NumPy, optionnel)
+
+GET /products/top (classement) et GET /products/analytics (agrégats) portent
+sur TOUS les produits filtrés : trier par prix * stock ou calculer une médiane
+oblige la base à parcourir et trier chaque ligne retenue, à chaque appel.
+
+Ici, chaque worker garde les quatre colonnes utiles dans des tableaux NumPy :
+
+    ids       int64    triés, pour retrouver une ligne par searchsorted
+    price     float64
+    stock     int64
+    category  int32    code de catégorie (self.categories[code] = nom)
+
+Soit 28 octets par produit (28 Mo pour 1 million). Filtres, classements et
+agrégats deviennent des opérations vectorisées (masques, argpartition,
+bincount) exécutées en C, sans objet Python par ligne.
+
+Mise à jour incrémentale : l'instantané retient le seq du flux de changements
+(product_changes) auquel il correspond, et applique ensuite les changements
+suivants (upsert / delete) au lieu de tout recharger. Les tableaux ne sont
+jamais modifiés sur place : apply_changes en construit de nouveaux puis les
+publie d'un coup, une requête en cours garde donc une vue cohérente.
+Le chargement, le rafraîchissement et le choix SQL / instantané sont dans repository.py.
+
+NumPy est optionnel : sans lui (ou avec CATALOGUE_SNAPSHOT=false), les mêmes
+requêtes sont servies en SQL (database.top_products / get_analytics).
+"""
+
+import os
+
+from database import TOP_OPTIONS
+
+try:
+    import numpy as np
+except ImportError:  # NumPy est optionnel
+    np = None
+
+# CATALOGUE_SNAPSHOT=false désactive l'instantané même si NumPy est installé
+SNAPSHOT_ENABLED = np is not None and os.environ.get("CATALOGUE_SNAPSHOT", "true").lower() not in ("0", "false", "no")
+# Âge max (secondes) de l'instantané avant de relire le flux de changements.
+# Les écritures du worker lui-même le font rafraîchir dès la requête suivante.
+SNAPSHOT_REFRESH_INTERVAL = float(os.environ.get("SNAPSHOT_REFRESH_INTERVAL", "1"))
+# Lignes lues par lot au chargement, et changements lus par page au rafraîchissement
+SNAPSHOT_LOAD_BATCH_SIZE = 10000
+SNAPSHOT_CHANGES_BATCH_SIZE = 5000
+
+
+def index_serves_top(sort: str, category: str = None, min_price: float = None,
+                     max_price: float = None, in_stock: bool = None) -> bool:
+    """
+    Vrai si la base trouve les n premiers en descendant un index (price, id) / (stock, id),
+    sans parcourir la table : tri par prix ou par stock, sans filtre qu'elle
+    devrait vérifier ligne à ligne sur une grande partie du catalogue.
+    Là, le SQL répond en une fraction de milliseconde et bat l'instantané
+    (voir benchmarks/bench_snapshot.py) ; partout ailleurs, c'est l'inverse.
+    """
+    column = sort.lstrip("-")
+    if category is not None:
+        return False
+    if column == "price":
+        return True
+    return column == "stock" and min_price is None and max_price is None
+
+
+def _round_half_away(values):
+    """Arrondi "au plus loin de zéro" pour les .5, comme ROUND() de SQLite (np.round arrondit au pair)."""
+    return np.copysign(np.floor(np.abs(values) + 0.5), values)
+
+
+class CatalogueSnapshot:
+    """Colonnes id / price / stock / category du catalogue, au seq 'seq' du flux de changements."""
+
+    def __init__(self, seq: int = 0):
+        self.seq = seq
+        # Code 0 = sans catégorie (NULL). Les codes ne sont jamais réattribués.
+        self.categories = [None]
+        self._codes = {None: 0}
+        self.columns = self._to_columns([])
+        self._parts = []
+
+    def _code(self, category) -> int:
+        code = self._codes.get(category)
+        if code is None:
+            code = self._codes[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+
+    def _to_columns(self, rows: list) -> tuple:
+        """Tuples (id, price, stock, category) -> (ids, price, stock, category) en tableaux."""
+        count = len(rows)
+        return (
+            np.fromiter((row[0] for row in rows), np.int64, count),
+            np.fromiter((row[1] for row in rows), np.float64, count),
+            np.fromiter((row[2] for row in rows), np.int64, count),
+            np.fromiter((self._code(row[3]) for row in rows), np.int32, count),
+        )
+
+    # --- Chargement ---
+
+    def append_rows(self, rows: list):
+        """Ajoute un lot de (id, price, stock, category), par id croissant (chargement initial)."""
+        self._parts.append(self._to_columns(rows))
+
+    def finish_load(self):
+        """Assemble les lots reçus par append_rows en colonnes."""
+        if self._parts:
+            self.columns = tuple(np.concatenate(parts) for parts in zip(self.columns, *self._parts))
+        self._parts = []
+
+    # --- Mise à jour incrémentale ---
+
+    def apply_changes(self, changes: list, seq: int):
+        """
+        Applique une page du flux de changements ({"op", "id", "product"}) puis avance à 'seq'.
+        Modifications en place sur une copie, suppressions par masque, nouveaux
+        produits ajoutés à la fin (retri seulement si un id arrive dans le désordre).
+        """
+        latest = {change["id"]: change["product"] for change in changes}
+        ids, price, stock, category = (column.copy() for column in self.columns)
+
+        changed = np.fromiter(latest, np.int64, len(latest))
+        positions = np.searchsorted(ids, changed)
+        known = positions < len(ids)
+        known[known] = ids[positions[known]] == changed[known]
+
+        keep = np.ones(len(ids), bool)
+        added = []
+        for product_id, position, is_known in zip(latest, positions.tolist(), known.tolist()):
+            product = latest[product_id]
+            if product is None:
+                if is_known:
+                    keep[position] = False
+            elif is_known:
+                price[position] = product["price"]
+                stock[position] = product["stock"]
+                category[position] = self._code(product["category"])
+            else:
+                added.append((product_id, product["price"], product["stock"], product["category"]))
+
+        columns = tuple(column[keep] for column in (ids, price, stock, category))
+        if added:
+            columns = tuple(np.concatenate(pair) for pair in zip(columns, self._to_columns(added)))
+            if len(columns[0]) > len(added) and min(row[0] for row in added) < columns[0][-len(added) - 1]:
+                order = np.argsort(columns[0], kind="stable")
+                columns = tuple(column[order] for column in columns)
+        self.columns = columns
+        self.seq = seq
+
+    # --- Requêtes ---
+
+    def _mask(self, columns: tuple, category: str = None, min_price: float = None,
+              max_price: float = None, in_stock: bool = None):
+        """Masque booléen des mêmes filtres que database.list_filters."""
+        _ids, price, stock, codes = columns
+        mask = np.ones(len(price), bool)
+        if category is not None:
+            code = self._codes.get(category)
+            if code is None:
+                return np.zeros(len(price), bool)
+            mask &= codes == code
+        if min_price is not None:
+            mask &= price >= min_price
+        if max_price is not None:
+            mask &= price <= max_price
+        if in_stock is True:
+            mask &= stock > 0
+        elif in_stock is False:
+            mask &= stock <= 0
+        return mask
+
+    def top_ids(self, sort: str, n: int, category: str = None, min_price: float = None,
+                max_price: float = None, in_stock: bool = None) -> list:
+        """Ids des n premiers produits filtrés, dans l'ordre de database.build_top_query."""
+        if sort not in TOP_OPTIONS:
+            raise ValueError(f"Classement inconnu : {sort}")
+        columns = self.columns
+        ids, price, stock, _codes = columns
+        rows = np.flatnonzero(self._mask(columns, category, min_price, max_price, in_stock))
+        if not len(rows) or n <= 0:
+            return []
+        column = sort.lstrip("-")
+        key = price[rows] if column == "price" else stock[rows] if column == "stock" else price[rows] * stock[rows]
+        tiebreak = ids[rows]
+        if sort.startswith("-"):
+            key, tiebreak = -key, -tiebreak
+        if len(rows) > n:
+            # argpartition : les n plus petites clés sans trier le reste. On garde
+            # toutes les égalités avec la n-ième, pour que le départage par id soit exact.
+            kth = key[np.argpartition(key, n - 1)[n - 1]]
+            candidates = np.flatnonzero(key <= kth)
+        else:
+            candidates = np.arange(len(rows))
+        order = candidates[np.lexsort((tiebreak[candidates], key[candidates]))][:n]
+        return ids[rows[order]].tolist()
+
+    def analytics(self, category: str = None, min_price: float = None, max_price: float = None,
+                  in_stock: bool = None):
+        """
+        (lignes par catégorie, prix médian) des produits filtrés : mêmes colonnes que
+        database.build_analytics_queries, à passer à database.summarize_analytics.
+        """
+        columns = self.columns
+        _ids, price, stock, codes = columns
+        rows = np.flatnonzero(self._mask(columns, category, min_price, max_price, in_stock))
+        price, stock, codes = price[rows], stock[rows], codes[rows]
+        size = len(self.categories)
+
+        counts = np.bincount(codes, minlength=size)
+        in_stock_counts = np.bincount(codes, weights=stock > 0, minlength=size)
+        total_stock = np.bincount(codes, weights=stock, minlength=size)
+        cents = np.bincount(codes, weights=_round_half_away(price * stock * 100), minlength=size)
+        price_sum = np.bincount(codes, weights=price, minlength=size)
+        min_price = np.full(size, np.inf)
+        max_price = np.full(size, -np.inf)
+        np.minimum.at(min_price, codes, price)
+        np.maximum.at(max_price, codes, price)
+
+        # NULL et '' sont une même catégorie, comme dans category_stats
+        groups = {}
+        for code in np.flatnonzero(counts).tolist():
+            name = self.categories[code] or ""
+            row = {
+                "category": name,
+                "product_count": int(counts[code]),
+                "in_stock_count": int(in_stock_counts[code]),
+                "total_stock": int(total_stock[code]),
+                "inventory_cents": int(cents[code]),
+                "min_price": float(min_price[code]),
+                "max_price": float(max_price[code]),
+                "price_sum": float(price_sum[code]),
+            }
+            previous = groups.get(name)
+            if previous is not None:
+                for field in ("product_count", "in_stock_count", "total_stock", "inventory_cents", "price_sum"):
+                    row[field] += previous[field]
+                row["min_price"] = min(row["min_price"], previous["min_price"])
+                row["max_price"] = max(row["max_price"], previous["max_price"])
+            groups[name] = row
+
+        median = None
+        if len(price):
+            middle = (len(price) - 1) // 2
+            median = float(np.partition(price, middle)[middle])
+        return list(groups.values()), median
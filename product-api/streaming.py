@@ -0,0 +1,61 @@
+"""
+streaming.py — Encodage en flux pour l'export du catalogue
+
+GET /products/export ne construit jamais la liste complète en mémoire :
+la base fournit les produits par lots (fetchmany / curseur PostgreSQL),
+chaque lot est encodé (serialization.dumps, orjson si installé) puis envoyé aussitôt au client.
+La mémoire utilisée reste celle d'un lot, quelle que soit la taille de la table.
+"""
+
+import zlib
+
+from serialization import dumps
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+JSON_MEDIA_TYPE = "application/json"
+
+
+async def ndjson_chunks(batches):
+    """NDJSON : un produit JSON par ligne — le format le plus simple à consommer en flux."""
+    async for batch in batches:
+        if batch:
+            yield b"\n".join(dumps(p) for p in batch) + b"\n"
+
+
+async def json_array_chunks(batches):
+    """Tableau JSON classique ("[{...},{...}]") mais émis morceau par morceau."""
+    yield b"["
+    first = True
+    async for batch in batches:
+        if not batch:
+            continue
+        # Un seul appel à l'encodeur pour tout le lot, sans les crochets
+        body = dumps(batch)[1:-1]
+        yield body if first else b"," + body
+        first = False
+    yield b"]"
+
+
+async def gzip_chunks(chunks, level: int = 6):
+    """
+    Compresse un flux en gzip à la volée.
+
+    Z_SYNC_FLUSH après chaque morceau : le client peut décompresser
+    au fur et à mesure au lieu d'attendre la fin de l'export.
+    """
+    # wbits=31 : en-tête et pied de page gzip (et pas zlib brut)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Vrai si le header Accept-Encoding autorise gzip (et ne le refuse pas avec q=0)."""
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
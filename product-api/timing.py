@@ -0,0 +1,88 @@
+"""
+timing.py — Décomposition du temps de chaque requête (header Server-Timing)
+
+Les métriques Prometheus donnent des distributions sur toutes les requêtes ;
+Server-Timing donne le détail d'UNE réponse, directement visible dans
+l'onglet Réseau du navigateur ou avec curl -i :
+
+    Server-Timing: db;dur=3.12;desc="2 queries", db-wait;dur=0.01, json;dur=0.20, app;dur=4.80
+
+- db      : temps passé dans les requêtes SQL (hors attente du pool)
+- db-wait : attente d'une connexion libre dans le pool
+- db-connect : ouverture de nouvelles connexions (rare : le pool les réutilise)
+- json    : sérialisation de la réponse
+- compress : compression de la réponse (compression.py)
+- app     : temps total jusqu'à l'envoi des headers
+
+Chaque requête HTTP reçoit son propre accumulateur dans une ContextVar :
+database.py, database_pg.py, serialization.py et compression.py y ajoutent leurs durées
+sans rien savoir de la requête en cours. Le contexte est copié vers les
+threads de l'exécuteur SQLite (repository.py), ces accès y sont donc aussi comptés.
+"""
+
+import os
+import time
+from contextvars import ContextVar
+
+# SERVER_TIMING_ENABLED=false retire le header (il révèle des détails internes)
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING_ENABLED", "true").lower() not in ("0", "false", "no")
+
+# nom -> [secondes cumulées, nombre d'occurrences] ; None hors d'une requête HTTP
+_timings: ContextVar = ContextVar("server_timings", default=None)
+
+
+def record(name: str, seconds: float, count: int = 1):
+    """Ajoute une durée à la requête en cours (sans effet hors requête : tests, scripts)."""
+    timings = _timings.get()
+    if timings is None:
+        return
+    entry = timings.setdefault(name, [0.0, 0])
+    entry[0] += seconds
+    entry[1] += count
+
+
+def header_value(timings: dict, total: float) -> str:
+    """Valeur du header Server-Timing (durées en millisecondes)."""
+    parts = []
+    for name, (seconds, count) in timings.items():
+        part = f"{name};dur={seconds * 1000:.2f}"
+        if name == "db":
+            part += f';desc="{count} {"query" if count == 1 else "queries"}"'
+        parts.append(part)
+    parts.append(f"app;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+class ServerTimingMiddleware:
+    """
+    Middleware ASGI : ouvre l'accumulateur de la requête et ajoute le header
+    Server-Timing à la réponse.
+
+    Middleware ASGI "pur" plutôt que BaseHTTPMiddleware : pas de tâche
+    supplémentaire par requête, et les réponses en flux (export) ne sont pas mises en mémoire.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SERVER_TIMING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        timings = {}
+        token = _timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                value = header_value(timings, time.perf_counter() - started)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", value.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)